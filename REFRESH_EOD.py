@@ -292,6 +292,36 @@ def score(pe, debtEq, roe, dailyVol, tech):
     return min(100, f+t+ct+l), f, 0, t, ct, l
 
 
+PROVIDER = None   # server.py data provider when --provider is given; None = yfinance directly
+
+def fetch_history(ticker):
+    if PROVIDER is not None:
+        return PROVIDER.history(ticker + '.NS', '1y')
+    return yf.Ticker(ticker + '.NS').history(period='1y', auto_adjust=True)
+
+def server_running(port):
+    """server.py is up — it owns the price matrix and records the session itself."""
+    import socket
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+def open_matrix():
+    """server.py's price matrix writer when no server is running, else None. The matrix
+    takes one writer at a time; /api/chart, chart patterns and the correlation book
+    all read it, so a day this job covers alone must land there too."""
+    try:
+        import server
+    except Exception as e:
+        log(f"Price matrix not updated — {e}")
+        return None
+    if server_running(server.PORT):
+        log("Server is running — it records today's bars into the price matrix")
+        return None
+    return server
+
 def main():
     log("EOD refresh started")
 
@@ -307,16 +337,22 @@ def main():
         log("Cache empty — skipping")
         return
 
+    if hasattr(PROVIDER, 'refresh'):
+        PROVIDER.refresh()   # bhavcopy: today's bars for every stock from one file
+    matrix = open_matrix()
     log(f"Refreshing technicals for {len(stocks)} stocks...")
     updated = 0
     failed  = 0
 
     for s in stocks:
         try:
-            hist = yf.Ticker(s['ticker'] + '.NS').history(period='1y', auto_adjust=True)
+            served = getattr(PROVIDER, 'served', 0)
+            hist = fetch_history(s['ticker'])
             if hist is None or len(hist) < 30:
                 failed += 1
                 continue
+            if matrix is not None:
+                matrix.prices_record(s['ticker'], hist)
             tech = calc_technicals(hist)
             if not tech:
                 failed += 1
@@ -336,9 +372,8 @@ def main():
             s['near52High']= tech['near_52high']
             s['stage']     = classify_stage(tech)
 
-            h60 = hist.tail(60)
-            s['chartDates']  = [d.strftime('%Y-%m-%d') for d in h60.index]
-            s['chartPrices'] = [round(float(p), 2) for p in h60['Close'].values]
+            s.pop('chartDates', None)    # charts are served from the price matrix (/api/chart)
+            s.pop('chartPrices', None)
 
             sc, f, c, t, ct, l = score(s.get('pe', 0), s.get('debtEq', 0),
                                        s.get('roe', 0), s.get('dailyVol', 0), tech)
@@ -349,10 +384,14 @@ def main():
             s['ctScore'] = ct
             s['lScore']  = l
             updated += 1
-            time.sleep(0.15)
+            if getattr(PROVIDER, 'served', 0) == served:
+                time.sleep(0.15)   # Yahoo throttle — bars from bhavcopy don't need it
         except:
             failed += 1
 
+    if matrix is not None:
+        matrix.prices_publish()
+
     now_ist = datetime.datetime.utcnow() + datetime.timedelta(hours=5, minutes=30)
     data['last_updated'] = now_ist.strftime('%d %b %Y, %I:%M %p IST').lstrip('0')
     data['saved_at']     = now_ist.isoformat()
@@ -366,4 +405,13 @@ def main():
 
 
 if __name__ == '__main__':
+    import argparse
+    ap = argparse.ArgumentParser(description='Dalal Street Scout EOD technical refresh')
+    ap.add_argument('--provider', default='live',
+                    help='live | record | replay | http://host:port | bhav[+base] | matrix[+base] (same as server.py)')
+    ap.add_argument('--fixtures', metavar='DIR', help='fixture directory for record/replay')
+    args = ap.parse_args()
+    if args.provider != 'live':
+        from server import make_provider
+        PROVIDER = make_provider(args.provider, args.fixtures)
     main()
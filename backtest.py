@@ -0,0 +1,615 @@
+"""
+Dalal Street Scout — Walk-Forward Backtest
+===========================================
+Replays up to 5 years of daily history for the whole universe and works out,
+for every session, what calc_technicals() / score() / classify_stage() would
+have said that evening — as array operations over each stock's full history,
+not one calc_technicals() call per day. Every time a stock enters a stage it
+is bought at the next open and managed with the plan rules from the UI:
+half off at +15%, the rest at +27.5%, -9% hard stop, time exit after --hold
+sessions. Results are grouped by stage, score band and year.
+
+  python backtest.py                       # tickers from cache.json, live Yahoo
+  python backtest.py --provider replay     # recorded fixtures (see server.py --provider)
+  python backtest.py --synthetic 2000      # random-walk universe, no network (timing)
+  python backtest.py --check 300           # compare the arrays with calc_technicals() on sampled days
+  python backtest.py --sweep 3000          # random-search 3,000 score() weight/threshold configurations
+  python backtest.py --grid rsi_lo,rsi_hi  # full grid over some SWEEP_SPACE keys
+  python backtest.py --out bt.json         # also write the tables as JSON
+
+Fundamentals have no history here: every session uses the stock's current
+P/E and D/E from cache.json (zero for tickers not in the cache).
+"""
+
+import argparse, itertools, json, os, random, sys, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import warnings
+warnings.filterwarnings('ignore')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+import server
+import numpy as np
+import pandas as pd
+
+PARTIAL_PCT  = 15.0     # book PARTIAL_SIZE of the position here
+PARTIAL_SIZE = 0.5
+TARGET_PCT   = 27.5     # rest exits here
+STOP_PCT     = 9.0      # hard stop on whatever is still open
+HOLD_DAYS    = 63       # time exit at the close (≈ 3 months — "reassess at 3 months")
+WARMUP_DAYS  = 60       # no signals before the 50 EMA has settled
+CHUNK_SIZE   = 25       # tickers per worker task
+SCORE_BANDS  = ((80, '80+'), (65, '65–79'), (45, '45–64'), (0, '<45'))   # README thresholds
+STAGES       = server.HISTORY_STAGES                                     # low → high, 'none' = 0
+OUTCOMES     = ('stop', 'partial', 'target', 'time')   # outcome codes 0-3 returned by simulate()
+
+VPB_NONE, VPB_COIL, VPB_BRK, VPB_WEAK, VPB_DIST, VPB_VOL = range(6)
+
+# ════════════════════════════════════════════════════════════════════
+# INDICATORS — calc_technicals() for every session at once
+# Each array's value at day d is what calc_technicals(hist[:d+1]) computes:
+# EWMs, rolling windows and Wilder smoothing are all causal, so running
+# them once over the whole history gives every day's value.
+# ════════════════════════════════════════════════════════════════════
+def _shift(x, k, fill):
+    out = np.empty_like(x)
+    out[:k] = fill
+    out[k:] = x[:-k]
+    return out
+
+def indicators(hist):
+    """Per-session indicator arrays for one OHLCV frame (None if too short)."""
+    close = hist['Close'].ffill()
+    first = close.first_valid_index()
+    if first is None:
+        return None
+    hist  = hist.loc[first:]
+    c     = close.loc[first:].values.astype(np.float64)
+    N     = len(c)
+    if N < WARMUP_DAYS + 2:
+        return None
+    hi  = hist['High'].ffill().values.astype(np.float64)
+    lo  = hist['Low'].ffill().values.astype(np.float64)
+    op  = hist['Open'].values.astype(np.float64)
+    vol = hist['Volume'].fillna(0).values.astype(np.float64)
+    s   = pd.Series(c)
+    idx = np.arange(N)
+
+    # RSI 14, rounded like the live value
+    d    = s.diff()
+    gain = d.clip(lower=0).rolling(14).mean()
+    loss = (-d.clip(upper=0)).rolling(14).mean()
+    rsi  = np.round((100 - 100 / (1 + gain / (loss + 1e-10))).values, 1)
+    rsi  = np.where(np.isnan(rsi), 50.0, rsi)
+
+    # MACD line crossing its signal today
+    m     = s.ewm(span=12).mean() - s.ewm(span=26).mean()
+    above = (m > m.ewm(span=9).mean()).values
+    macd  = above & ~_shift(above, 1, True)
+
+    # 14/50 EMA: most recent cross within the last 5 sessions
+    e14 = s.ewm(span=14).mean().values
+    e50 = s.ewm(span=50).mean().values
+    up  = e14 > e50
+    evt = up & ~_shift(up, 1, True)
+    last      = np.maximum.accumulate(np.where(evt, idx, -1))
+    days_ago  = idx - last + 1
+    ema_cross = (last >= 0) & (days_ago <= 5)
+    rising_fast = e14 > _shift(e14, 2, np.inf)
+
+    # Volume on the cross day vs the 20 sessions before it
+    avg20_pre = pd.Series(vol).rolling(20).mean().shift(1).values
+    vol_ok    = (idx > 20) & (avg20_pre > 0) & (vol >= avg20_pre * 1.5)
+    vol_confirmed = ema_cross & vol_ok[np.maximum(last, 0)]
+
+    # VPB: 5-session coil + shrinking volume, then today's trigger candle
+    base   = pd.Series(vol).rolling(20).mean().shift(5).values
+    cmax   = s.rolling(5).max().shift(1).values
+    cmin   = s.rolling(5).min().shift(1).values
+    coil   = (cmax - cmin) / (cmin + 1e-10) * 100 < 4.0
+    shrink = (base > 0) & (pd.Series(vol).rolling(3).max().shift(1).values < base * 0.85)
+    vr     = vol / (base + 1e-10)
+    cpos   = (c - lo) / (hi - lo + 1e-10)
+    setup  = coil & shrink
+    conds  = [setup & (vr >= 2.0) & (cpos >= 0.7), setup & (vr >= 1.5) & (cpos >= 0.6),
+              setup & (vr >= 1.5) & (cpos < 0.3), setup & (vr < 1.0), setup,
+              (vr >= 2.0) & (cpos >= 0.7), coil]
+    ok     = idx >= 24
+    vpb_score  = np.where(ok, np.select(conds, [10, 7, -2, 3, 5, 4, 2], 0), 0)
+    vpb_detail = np.where(ok, np.select(conds, [VPB_BRK, VPB_BRK, VPB_DIST, VPB_COIL, VPB_WEAK,
+                                                VPB_VOL, VPB_COIL], VPB_NONE), VPB_NONE).astype(np.int8)
+
+    return {'open': op, 'high': hi, 'low': lo, 'close': c, 'dates': hist.index,
+            'rsi': rsi, 'macd': macd, 'adx': server.adx_series(c, hi, lo),
+            'e14': e14, 'e50': e50, 'ema_cross': ema_cross, 'days_ago': days_ago,
+            'rising_fast': rising_fast, 'vol_confirmed': vol_confirmed,
+            'vpb_score': vpb_score, 'vpb_detail': vpb_detail}
+
+def tech_columns(ind):
+    """(stage codes into STAGES, score_columns() inputs) for every session — classify_stage() over arrays."""
+    c, e14, e50 = ind['close'], ind['e14'], ind['e50']
+    cross, ago  = ind['ema_cross'], ind['days_ago']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pre   = ~cross & (e14 < e50) & (c > 0) & ((e50 - e14) / c * 100 < 0.5) & ind['rising_fast']
+        post  = cross & (ago <= 2) & (c > 0) & ((e14 - e50) / c * 100 < 1.5)
+        pull  = cross & (ago >= 2) & (e14 > 0) & (np.abs(c - e14) / e14 * 100 <= 2.0)
+    trend = (e14 > e50) & ~cross
+    vs, vd = ind['vpb_score'], ind['vpb_detail']
+    brk   = (vd == VPB_BRK) | (vd == VPB_WEAK)
+
+    code  = {name: i for i, name in enumerate(STAGES)}
+    stage = np.select(
+        [pull, post, pre & brk, cross, brk | (vd == VPB_VOL),
+         (vd == VPB_COIL) | ((vs >= 2) & (vd != VPB_VOL)), trend],
+        [code['pullback'], code['post_cross'], code['pre_cross'], code['post_cross'], code['breakout'],
+         code['coiling'], code['trending']], code['none'])
+    live = np.arange(len(c)) >= 29          # calc_technicals() needs 30 sessions; before that tech is None
+    cols = {'rsi':           np.where(live, ind['rsi'], np.nan).astype(np.float32),
+            'adx':           np.where(live, ind['adx'], np.nan).astype(np.float32),
+            'vpb_score':     np.where(live, vs, 0).astype(np.int8),
+            'pre_cross':     pre & live,
+            'pre_breakout':  pre & brk & live,
+            'ema_cross':     cross & live,
+            'cross_days':    np.where(cross, ago, 0).astype(np.int8),
+            'vol_confirmed': ind['vol_confirmed'] & live,
+            'pullback':      pull & live,
+            'macd':          ind['macd'] & live}
+    return np.where(live, stage, 0).astype(np.int8), cols
+
+# ════════════════════════════════════════════════════════════════════
+# TRADE SIMULATION — every entry of a stock in one (entries × HOLD) window
+# ════════════════════════════════════════════════════════════════════
+def _first(mask, hold):
+    return np.where(mask.any(1), mask.argmax(1), hold)
+
+def simulate(ind, signal_days, hold=HOLD_DAYS):
+    """Buy at the open after each signal day and apply the plan rules.
+    Returns (return %, outcome code, sessions held) per signal."""
+    o, h, l, c = ind['open'], ind['high'], ind['low'], ind['close']
+    N = len(c)
+    e = signal_days + 1
+    k = np.arange(hold)
+    ix    = e[:, None] + k
+    valid = ix < N
+    ix    = np.minimum(ix, N - 1)
+    entry = np.where(np.isfinite(o[e]) & (o[e] > 0), o[e], c[e])
+    stop, part, tgt = (entry * (1 - STOP_PCT / 100), entry * (1 + PARTIAL_PCT / 100),
+                       entry * (1 + TARGET_PCT / 100))
+    O, H, L = o[ix], h[ix], l[ix]
+    O = np.where(np.isfinite(O) & (O > 0), O, c[ix])
+    rows = np.arange(len(e))
+
+    fs = _first(valid & (L <= stop[:, None]), hold)     # same-day stop and target: stop wins
+    fp = _first(valid & (H >= part[:, None]), hold)
+    ft = _first(valid & (H >= tgt[:, None]), hold)
+    last = valid.sum(1) - 1
+    at   = lambda M, j: M[rows, np.minimum(j, hold - 1)]
+
+    stop_fill = np.minimum(at(O, fs), stop)
+    time_fill = c[ix[rows, last]]
+    stopped   = (fs < hold) & (fs <= fp)
+    partial   = (fp < hold) & ~stopped
+    hit_tgt   = partial & (ft < hold) & (ft < fs)
+    rem_stop  = partial & ~hit_tgt & (fs < hold)
+
+    part_fill = np.maximum(at(O, fp), part)
+    rem_fill  = np.select([hit_tgt, rem_stop], [np.maximum(at(O, ft), tgt), stop_fill], time_fill)
+    ret = np.select([stopped, partial],
+                    [stop_fill / entry - 1,
+                     PARTIAL_SIZE * (part_fill / entry - 1) + (1 - PARTIAL_SIZE) * (rem_fill / entry - 1)],
+                    time_fill / entry - 1) * 100
+    outcome = np.select([stopped, hit_tgt, partial], [0, 2, 1], 3).astype(np.int8)
+    exit_k  = np.select([stopped, hit_tgt, rem_stop], [fs, ft, fs], last)
+    return ret, outcome, exit_k + 1
+
+def backtest_frame(hist, pe=0.0, debt_eq=0.0, hold=HOLD_DAYS):
+    """All stage entries of one stock → dict of per-trade arrays (or None).
+    Besides the outcome, each trade carries its score_columns() inputs, so a
+    parameter sweep can re-score the trades without touching the history."""
+    ind = indicators(hist)
+    if ind is None:
+        return None
+    stage, cols = tech_columns(ind)
+    N    = len(stage)
+    days = np.flatnonzero((stage != _shift(stage, 1, 0)) & (stage > 0))
+    days = days[days >= WARMUP_DAYS]
+    # Only signals with a full hold window behind them — keeping the early
+    # stop-outs of recent signals would bias the last months towards losses
+    open_ = int((days >= N - 1 - hold).sum())
+    days  = days[days < N - 1 - hold]
+    if not len(days):
+        return {'open': open_} if open_ else None
+    ret, outcome, held = simulate(ind, days, hold)
+    trades = {k: v[days] for k, v in cols.items()}
+    trades['pe']     = np.full(len(days), pe, np.float32)
+    trades['debtEq'] = np.full(len(days), debt_eq, np.float32)
+    trades.update(stage=stage[days],
+                  score=server.score_columns(trades)[0].astype(np.int16),
+                  year=ind['dates'][days].year.values.astype(np.int16),
+                  ret=ret.astype(np.float32), outcome=outcome, held=held.astype(np.int16),
+                  open=open_)
+    return trades
+
+# ════════════════════════════════════════════════════════════════════
+# WORKERS — one process per core, CHUNK_SIZE tickers per task
+# ════════════════════════════════════════════════════════════════════
+_synthetic = False
+
+def _init_worker(provider_spec, fixtures, synthetic):
+    global _synthetic
+    _synthetic = synthetic
+    if provider_spec and provider_spec != 'live':
+        server.provider = server.make_provider(provider_spec, fixtures)
+
+def _history(ticker):
+    if _synthetic:
+        return server.synthetic_ohlcv(int(ticker[3:]))
+    return server.provider.history(ticker + '.NS', '5y')
+
+def run_chunk(items, hold):
+    """items: [(ticker, pe, debtEq)] → (merged trade arrays, tickers done, tickers failed, open signals)."""
+    parts, done, failed, open_ = [], 0, 0, 0
+    for ticker, pe, debt_eq in items:
+        try:
+            r = backtest_frame(_history(ticker), pe, debt_eq, hold)
+            done += 1
+        except Exception:
+            failed += 1
+            continue
+        if r:
+            open_ += r.pop('open')
+            if r:
+                parts.append(r)
+    merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]} if parts else None
+    return merged, done, failed, open_
+
+def run_backtest(items, hold=HOLD_DAYS, workers=None, provider_spec='live', fixtures=None,
+                 synthetic=False, progress=None):
+    """Backtest [(ticker, pe, debtEq)] across a process pool.
+    Returns (trades, tickers done, tickers failed, open signals); progress(done, total) after each chunk."""
+    chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    parts, done, failed, open_ = [], 0, 0, 0
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1, mp_context=mp.get_context('spawn'),
+                             initializer=_init_worker, initargs=(provider_spec, fixtures, synthetic)) as pool:
+        futures = [pool.submit(run_chunk, chunk, hold) for chunk in chunks]
+        for fut in as_completed(futures):
+            merged, d, f, o = fut.result()
+            done, failed, open_ = done + d, failed + f, open_ + o
+            if merged:
+                parts.append(merged)
+            if progress:
+                progress(done + failed, len(items))
+    trades = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]} if parts else None
+    return trades, done, failed, open_
+
+# ════════════════════════════════════════════════════════════════════
+# REPORT
+# ════════════════════════════════════════════════════════════════════
+def _stats(ret, outcome, held):
+    n = len(ret)
+    if not n:
+        return {'n': 0}
+    return {'n':         n,
+            'hit_15':    round(float(np.isin(outcome, (1, 2)).mean() * 100), 1),
+            'hit_27_5':  round(float((outcome == 2).mean() * 100), 1),
+            'stopped':   round(float((outcome == 0).mean() * 100), 1),
+            'win_rate':  round(float((ret > 0).mean() * 100), 1),
+            'avg_ret':   round(float(ret.mean()), 2),
+            'med_ret':   round(float(np.median(ret)), 2),
+            'avg_held':  round(float(held.mean()), 1)}
+
+def _band(score):
+    out = np.empty(len(score), dtype=object)
+    for lo, name in reversed(SCORE_BANDS):
+        out[score >= lo] = name
+    return out
+
+def report(trades):
+    ret, outcome, held = trades['ret'], trades['outcome'], trades['held']
+    band = _band(trades['score'])
+    groups = {
+        'all':   {'all': np.ones(len(ret), bool)},
+        'stage': {STAGES[s]: trades['stage'] == s for s in range(len(STAGES) - 1, 0, -1)},
+        'band':  {name: band == name for _, name in SCORE_BANDS},
+        'stage_band': {f'{STAGES[s]} · {name}': (trades['stage'] == s) & (band == name)
+                       for s in range(len(STAGES) - 1, 0, -1) for _, name in SCORE_BANDS},
+        'year':  {str(y): trades['year'] == y for y in np.unique(trades['year'])},
+    }
+    return {g: {k: _stats(ret[m], outcome[m], held[m]) for k, m in rows.items() if m.any()}
+            for g, rows in groups.items()}
+
+def print_report(tables):
+    titles = {'all': 'All signals', 'stage': 'By stage (entry day)', 'band': 'By score band',
+              'stage_band': 'By stage × score band', 'year': 'By year (walk-forward)'}
+    for g, rows in tables.items():
+        print(f"\n  {titles[g]}")
+        print(f"  {'':<24} {'trades':>7} {'+15%':>6} {'+27.5%':>7} {'stop':>6} {'win':>6} "
+              f"{'avg %':>7} {'med %':>7} {'days':>5}")
+        for k, v in rows.items():
+            print(f"  {k:<24} {v['n']:>7} {v['hit_15']:>5.1f}% {v['hit_27_5']:>6.1f}% {v['stopped']:>5.1f}% "
+                  f"{v['win_rate']:>5.1f}% {v['avg_ret']:>7.2f} {v['med_ret']:>7.2f} {v['avg_held']:>5.1f}")
+
+# ════════════════════════════════════════════════════════════════════
+# PARAMETER SWEEP
+# A trade's outcome doesn't depend on the score weights — only whether the
+# score lets it in. So the universe is backtested once into an event table
+# (score_columns() inputs + outcome for every stage entry, kept in
+# SWEEP_FILE), and each configuration is one score_columns() call over that
+# table plus a mask. Worker processes load the table once and evaluate
+# configurations in batches of SWEEP_BATCH.
+# ════════════════════════════════════════════════════════════════════
+SWEEP_FILE        = os.path.join(BASE_DIR, 'sweep_events.npz')
+SWEEP_MAX_AGE_HRS = 24       # rebuild the event table after this
+SWEEP_MIN_TRADES  = 200      # configurations letting fewer trades in are not ranked
+SWEEP_BATCH       = 25       # configurations per worker task
+SWEEP_TOP         = 20
+ENTRY_SCORE       = 65       # 'min_score' default — README: 65+ = Strong Entry
+SWEEP_SPACE = {              # candidate values per SCORE_DEFAULTS key (+ the entry threshold)
+    'min_score':       (50, 55, 60, 65, 70, 75),
+    'rsi_lo':          (40, 42, 45, 48, 50),
+    'rsi_hi':          (55, 58, 60, 62),
+    'rsi_pts':         (6, 9, 12, 15),
+    'rsi_warm_pts':    (0, 4, 7, 10),
+    'adx_lo':          (15, 18, 20, 22, 25),
+    'adx_hi':          (30, 35, 40, 45),
+    'adx_pts':         (5, 8, 10, 12, 15),
+    'adx_strong_pts':  (0, 4, 8),
+    'pe_1':            (10, 15, 20),
+    'pe_pts_1':        (8, 12, 15),
+    'de_1':            (0.2, 0.3, 0.5),
+    'de_pts_1':        (5, 10, 12),
+    'vpb_weight':      (0, 0.5, 1.0, 1.5, 2.0),
+    'pre_pts_10':      (12, 15, 18, 22),
+    'cross_pts_fresh': (12, 15, 18, 22),
+    'cross_pts_novol': (0, 4, 8),
+    'pullback_pts':    (0, 3, 5, 8),
+    'macd_pts':        (0, 2, 4),
+}
+EVENT_COLUMNS = ('rsi', 'adx', 'vpb_score', 'pre_cross', 'pre_breakout', 'ema_cross', 'cross_days',
+                 'vol_confirmed', 'pullback', 'macd', 'pe', 'debtEq', 'stage', 'ret', 'outcome', 'held')
+
+def _valid(cfg):
+    p = {**server.SCORE_DEFAULTS, **cfg}
+    return (p['rsi_cool_lo'] <= p['rsi_lo'] < p['rsi_hi'] <= p['rsi_warm_hi'] <= p['rsi_hot_hi'] and
+            p['adx_weak_lo'] <= p['adx_lo'] < p['adx_hi'] and
+            p['pe_1'] < p['pe_2'] < p['pe_3'] < p['pe_4'] and p['de_1'] < p['de_2'] < p['de_3'] < p['de_4'])
+
+def sweep_configs(trials, mode='random', grid=None, seed=1):
+    """Configurations (SCORE_DEFAULTS overrides + min_score) to evaluate; the defaults come first.
+    grid: SWEEP_SPACE keys to take the full product of (the rest stay at their defaults)."""
+    base    = {'min_score': ENTRY_SCORE, **{k: v for k, v in server.SCORE_DEFAULTS.items() if k in SWEEP_SPACE}}
+    configs = [base]
+    seen    = {json.dumps(base, sort_keys=True)}
+    def add(cfg):
+        key = json.dumps(cfg, sort_keys=True)
+        if key not in seen and _valid(cfg):
+            seen.add(key)
+            configs.append(cfg)
+    if mode == 'grid':
+        keys = [k for k in (grid or []) if k in SWEEP_SPACE]
+        for values in itertools.product(*(SWEEP_SPACE[k] for k in keys)):
+            add({**base, **dict(zip(keys, values))})
+    else:
+        rng = random.Random(seed)
+        for _ in range(trials * 20):
+            if len(configs) >= trials:
+                break
+            add({k: rng.choice(v) for k, v in SWEEP_SPACE.items()})
+    return configs
+
+def evaluate(events, cfg):
+    """Plan-rule results of the trades whose score under cfg reaches its min_score."""
+    params = {k: v for k, v in cfg.items() if k != 'min_score'}
+    sc     = server.score_columns(events, params)[0]
+    m      = sc >= cfg.get('min_score', ENTRY_SCORE)
+    return _stats(events['ret'][m], events['outcome'][m], events['held'][m])
+
+def save_events(trades, meta, path=SWEEP_FILE):
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, meta=np.array(json.dumps(meta)), **{k: trades[k] for k in EVENT_COLUMNS})
+    os.replace(tmp, path)
+
+def load_events(path=SWEEP_FILE):
+    """(events as float64 / bool columns, meta) or (None, None)."""
+    if not os.path.exists(path):
+        return None, None
+    with np.load(path) as z:
+        meta   = json.loads(str(z['meta']))
+        events = {k: z[k] if z[k].dtype == bool else z[k].astype(np.float64) for k in EVENT_COLUMNS}
+    return events, meta
+
+_events = None
+
+def _init_sweep_worker(path):
+    global _events
+    _events, _ = load_events(path)
+
+def _eval_batch(configs):
+    return [evaluate(_events, cfg) for cfg in configs]
+
+def run_sweep(items, trials=2000, mode='random', grid=None, hold=HOLD_DAYS, workers=None,
+              provider_spec='live', fixtures=None, synthetic=False, rebuild=False,
+              path=SWEEP_FILE, progress=None):
+    """Build (or reuse) the event table, then evaluate sweep_configs() across a process pool.
+    progress(phase, done, total, best) — phase 'events' counts tickers, 'trials' configurations."""
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    events, meta = (None, None) if rebuild else load_events(path)
+    fresh = meta and meta['hold'] == hold and meta['tickers'] == len(items) and \
+            time.time() - meta['built_at'] < SWEEP_MAX_AGE_HRS * 3600
+    if not fresh:
+        cb = (lambda d, n: progress('events', d, n, None)) if progress else None
+        trades, done, failed, _ = run_backtest(items, hold, workers, provider_spec, fixtures, synthetic, cb)
+        if trades is None:
+            raise RuntimeError(f'no trades from {len(items)} tickers ({failed} failed)')
+        meta = {'built_at': time.time(), 'hold': hold, 'tickers': len(items), 'done': done, 'failed': failed,
+                'trades': int(len(trades['ret']))}
+        save_events(trades, meta, path)
+        events, _ = load_events(path)
+    build_sec = time.perf_counter() - t0
+
+    configs = sweep_configs(trials, mode, grid)
+    batches = [configs[i:i + SWEEP_BATCH] for i in range(0, len(configs), SWEEP_BATCH)]
+    results = [None] * len(configs)
+    best, done = None, 0
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'),
+                             initializer=_init_sweep_worker, initargs=(path,)) as pool:
+        futures = {pool.submit(_eval_batch, b): i * SWEEP_BATCH for i, b in enumerate(batches)}
+        for fut in as_completed(futures):
+            start = futures[fut]
+            for j, r in enumerate(fut.result()):
+                results[start + j] = r
+                if r['n'] >= SWEEP_MIN_TRADES and (best is None or r['avg_ret'] > best['avg_ret']):
+                    best = {**r, 'params': _diff(configs[start + j])}
+            done += len(fut.result())
+            if progress:
+                progress('trials', done, len(configs), best)
+
+    ranked = sorted((i for i, r in enumerate(results) if r['n'] >= SWEEP_MIN_TRADES),
+                    key=lambda i: results[i]['avg_ret'], reverse=True)
+    return {'events': int(len(events['ret'])), 'event_build_sec': round(build_sec, 1),
+            'configs': len(configs), 'elapsed_sec': round(time.perf_counter() - t0, 1),
+            'objective': 'avg_ret', 'min_trades': SWEEP_MIN_TRADES,
+            'defaults': results[0],
+            'top': [{**results[i], 'params': _diff(configs[i])} for i in ranked[:SWEEP_TOP]]}
+
+def _diff(cfg):
+    """Only the keys that differ from the live rules."""
+    base = {'min_score': ENTRY_SCORE, **server.SCORE_DEFAULTS}
+    return {k: v for k, v in cfg.items() if base.get(k) != v}
+
+def print_sweep(res):
+    print(f"\n  {res['configs']:,} configurations over {res['events']:,} trades in {res['elapsed_sec']}s "
+          f"(event table {res['event_build_sec']}s) — ranked by avg return, ≥ {res['min_trades']} trades")
+    print(f"  {'':<5} {'trades':>7} {'+15%':>6} {'stop':>6} {'win':>6} {'avg %':>7}  changes vs live rules")
+    rows = [('live', res['defaults'])] + [(f'#{i}', r) for i, r in enumerate(res['top'], 1)]
+    for name, r in rows:
+        if not r['n']:
+            print(f"  {name:<5} {0:>7}")
+            continue
+        changes = ', '.join(f'{k}={v}' for k, v in r.get('params', {}).items()) or '—'
+        print(f"  {name:<5} {r['n']:>7} {r['hit_15']:>5.1f}% {r['stopped']:>5.1f}% {r['win_rate']:>5.1f}% "
+              f"{r['avg_ret']:>7.2f}  {changes}")
+
+# ════════════════════════════════════════════════════════════════════
+# CHECK — vectorized arrays vs the live functions on sampled sessions
+# ════════════════════════════════════════════════════════════════════
+def check(frames, samples, seed=7):
+    rng = random.Random(seed)
+    bad, n = [], 0
+    for _ in range(samples):
+        ticker, hist = rng.choice(frames)
+        ind = indicators(hist)
+        if ind is None:
+            continue
+        stage, cols = tech_columns(ind)
+        t    = server.score_columns({**cols, 'pe': 0, 'debtEq': 0})[2]
+        d    = rng.randrange(WARMUP_DAYS, len(stage))
+        tech = server.calc_technicals(hist.iloc[:d + 1])
+        want_stage = server.classify_stage(tech)
+        want_t     = server.score(0, 0, 0, 0, tech)[3]
+        n += 1
+        if STAGES[stage[d]] != want_stage or t[d] != want_t:
+            bad.append((ticker, str(ind['dates'][d].date()), STAGES[stage[d]], want_stage, int(t[d]), want_t))
+    print(f"\n  Check: {n - len(bad)}/{n} sampled sessions match calc_technicals() + score() + classify_stage()")
+    for b in bad[:20]:
+        print(f"     {b[0]} {b[1]}: stage {b[2]} vs {b[3]}, tScore {b[4]} vs {b[5]}")
+    return not bad
+
+# ════════════════════════════════════════════════════════════════════
+# MAIN
+# ════════════════════════════════════════════════════════════════════
+def universe(tickers=None, synthetic=0):
+    """[(ticker, pe, debtEq)] — cache.json order, or synthetic SYN00000…"""
+    if synthetic:
+        rng = random.Random(synthetic)
+        return [(f'SYN{i:05d}', rng.choice((0, 8, 18, 30, 45, 80)), rng.choice((0, 0.2, 0.5, 0.9, 1.4, 2)))
+                for i in range(synthetic)]
+    funds = {}
+    if os.path.exists(server.CACHE_FILE):
+        with open(server.CACHE_FILE, encoding='utf-8') as f:
+            funds = {s['ticker']: (s.get('pe') or 0.0, s.get('debtEq') or 0.0)
+                     for s in json.load(f).get('stocks', [])}
+    if tickers:
+        return [(t, *funds.get(t, (0.0, 0.0))) for t in (x.strip().upper() for x in tickers.split(',')) if t]
+    if not funds:
+        funds = {t['ticker']: (0.0, 0.0) for t in (server.load_ticker_cache() or [])}
+    return [(t, pe, de) for t, (pe, de) in funds.items()]
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--tickers', help='comma-separated tickers (default: every stock in cache.json)')
+    ap.add_argument('--limit', type=int, help='only the first N tickers')
+    ap.add_argument('--synthetic', type=int, metavar='N', help='N random-walk tickers instead of real data')
+    ap.add_argument('--provider', default=server.PROVIDER, help="'live' | 'replay' | 'record' | http://host:port")
+    ap.add_argument('--fixtures', default=server.PROVIDER_DIR, help='fixture folder for replay/record')
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes (default: all cores)')
+    ap.add_argument('--hold', type=int, default=HOLD_DAYS, help='time exit after N sessions (default %(default)s)')
+    ap.add_argument('--check', type=int, metavar='N', help='verify N sampled sessions against the live functions and exit')
+    ap.add_argument('--sweep', type=int, metavar='N', help='random-search N score configurations instead')
+    ap.add_argument('--grid', metavar='KEYS', help='grid-search these comma-separated SWEEP_SPACE keys instead')
+    ap.add_argument('--rebuild', action='store_true', help=f'--sweep: rebuild {os.path.basename(SWEEP_FILE)} even if fresh')
+    ap.add_argument('--out', help='also write the tables as JSON to the given path')
+    args = ap.parse_args()
+
+    items = universe(args.tickers, args.synthetic)[:args.limit]
+    if not items:
+        print("  No tickers — run a scan first (cache.json) or pass --tickers / --synthetic")
+        return 1
+    _init_worker(args.provider, args.fixtures, bool(args.synthetic))
+
+    if args.check:
+        frames = []
+        for ticker, _, _ in items[:50]:
+            try:
+                frames.append((ticker, _history(ticker)))
+            except Exception:
+                pass
+        return 0 if check(frames, args.check) else 1
+
+    if args.sweep or args.grid:
+        print(f"\n  Sweep: {len(items):,} tickers · {args.workers} process(es)")
+        def progress(phase, done, total, best):
+            if done == total or done % max(1, total // 10) < (CHUNK_SIZE if phase == 'events' else SWEEP_BATCH):
+                extra = f" · best avg {best['avg_ret']:.2f}%" if best else ''
+                print(f"  … {phase} {done:,}/{total:,}{extra}")
+        res = run_sweep(items, args.sweep or 0, 'grid' if args.grid else 'random',
+                        args.grid.split(',') if args.grid else None, args.hold, args.workers,
+                        args.provider, args.fixtures, bool(args.synthetic), args.rebuild, progress=progress)
+        print_sweep(res)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump({'saved_at': server.get_ist().isoformat(), 'sweep': res}, f, indent=1, ensure_ascii=False)
+        return 0
+
+    print(f"\n  Backtest: {len(items):,} tickers · {args.workers} process(es) · "
+          f"+{PARTIAL_PCT:g}% half / +{TARGET_PCT:g}% / -{STOP_PCT:g}% / {args.hold}d")
+    t0 = time.perf_counter()
+    step = max(1, len(items) // 10)
+    def progress(done, total):
+        if done == total or done % step < CHUNK_SIZE:
+            print(f"  … {done:,}/{total:,} tickers · {time.perf_counter() - t0:.1f}s")
+    trades, done, failed, open_ = run_backtest(items, args.hold, args.workers, args.provider, args.fixtures,
+                                               bool(args.synthetic), progress)
+    if trades is None:
+        print("  No trades — nothing to report")
+        return 1
+    elapsed = time.perf_counter() - t0
+    print(f"\n  {len(trades['ret']):,} closed trades from {done:,} tickers in {elapsed:.1f}s "
+          f"({failed} failed, {open_} too recent for a full {args.hold}-session window)")
+
+    tables = report(trades)
+    print_report(tables)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'saved_at': server.get_ist().isoformat(), 'tickers': done, 'elapsed_sec': round(elapsed, 1),
+                       'rules': {'partial_pct': PARTIAL_PCT, 'partial_size': PARTIAL_SIZE, 'target_pct': TARGET_PCT,
+                                 'stop_pct': STOP_PCT, 'hold_days': args.hold},
+                       'tables': tables}, f, indent=1, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,465 @@
+"""
+Dalal Street Scout — Offline Benchmark Suite
+=============================================
+Times the scan, refresh and HTTP hot paths in server.py against synthetic
+OHLCV fixtures, with every Yahoo call replaced by an in-memory fake.
+No network needed.
+
+  python bench.py                  # 500 / 2,000 / 5,000 tickers, compare to baseline
+  python bench.py --sizes 500      # quick run
+  python bench.py --save-baseline  # record this run as the new baseline
+  python bench.py --no-mem         # skip the (slower) tracemalloc peak-memory pass
+  python bench.py --load 1,5,20,50 # HTTP load test: N browser tabs polling during refreshes
+
+Exit code is 1 when any timing or peak-memory figure regresses beyond
+--tolerance against bench_baseline.json.
+"""
+
+import argparse, contextlib, http.client, io, json, os, platform, random, statistics, sys, tempfile
+import threading, time, tracemalloc
+from types import SimpleNamespace
+import warnings
+warnings.filterwarnings('ignore')
+
+BASE_DIR      = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BASE_DIR, 'bench_baseline.json')
+sys.path.insert(0, BASE_DIR)
+
+import server
+import numpy as np
+import pandas as pd
+
+DEFAULT_SIZES = (500, 2000, 5000)
+POOL_SIZE     = 64        # distinct synthetic histories, reused across tickers
+HIST_DAYS_5Y  = 1250
+HIST_DAYS_1Y  = 250
+FIXTURE_END   = '2026-01-30'
+
+# ════════════════════════════════════════════════════════════════════
+# SYNTHETIC FIXTURES
+# ════════════════════════════════════════════════════════════════════
+POOL = [server.synthetic_ohlcv(i, HIST_DAYS_5Y, FIXTURE_END) for i in range(POOL_SIZE)]
+
+def _frame_for(symbol):
+    return POOL[sum(map(ord, symbol)) % POOL_SIZE]
+
+def make_info(symbol):
+    h    = _frame_for(symbol)
+    last = float(h['Close'].iloc[-1])
+    rng  = np.random.default_rng(sum(map(ord, symbol)))
+    return {
+        'marketCap':        int(rng.uniform(50, 50_000) * 1e7),
+        'currentPrice':     last,
+        'previousClose':    float(h['Close'].iloc[-2]),
+        'trailingPE':       float(rng.uniform(5, 80)),
+        'debtToEquity':     float(rng.uniform(0, 200)),
+        'returnOnEquity':   float(rng.uniform(-0.05, 0.35)),
+        'averageVolume':    int(h['Volume'].tail(60).mean()),
+        'fiftyTwoWeekHigh': float(h['High'].tail(252).max()),
+        'fiftyTwoWeekLow':  float(h['Low'].tail(252).min()),
+        'sector':           ('Industrials', 'Financial Services', 'Technology', 'Healthcare',
+                             'Basic Materials', 'Consumer Cyclical')[int(rng.integers(6))],
+        'longName':         symbol.replace('.NS', '') + ' Ltd',
+    }
+
+def _net():
+    """Simulated round-trip; 0 for the function benchmarks, set by --yahoo-latency for --load."""
+    if FakeYF.latency:
+        time.sleep(FakeYF.latency)
+
+class FakeTicker:
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    @property
+    def info(self):
+        _net()
+        return make_info(self.symbol)
+
+    @property
+    def fast_info(self):
+        _net()
+        h = _frame_for(self.symbol)
+        return SimpleNamespace(last_price=float(h['Close'].iloc[-1]), previous_close=float(h['Close'].iloc[-2]))
+
+    def history(self, period='1y', auto_adjust=True):
+        _net()
+        h = _frame_for(self.symbol)
+        return h if period == '5y' else h.tail(HIST_DAYS_1Y)
+
+class FakeYF:
+    """Stands in for the yfinance module inside server.py."""
+    Ticker  = FakeTicker
+    latency = 0.0
+
+    @staticmethod
+    def download(tickers, period='5d', interval='1d', **kw):
+        _net()
+        tickers = list(tickers)
+        tails   = [_frame_for(t).tail(5) for t in tickers]
+        fields  = ['Close', 'High', 'Low', 'Open', 'Volume']
+        values  = np.hstack([np.column_stack([t[f].values for t in tails]) for f in fields])
+        cols    = pd.MultiIndex.from_product([fields, tickers], names=['Price', 'Ticker'])
+        return pd.DataFrame(values, index=tails[0].index, columns=cols)
+
+class _FakeHandler:
+    """Enough of BaseHTTPRequestHandler for Handler.send_json to run."""
+    def __init__(self):
+        self.wfile = io.BytesIO()
+    def send_response(self, status): pass
+    def send_header(self, k, v):     pass
+    def end_headers(self):           pass
+
+# ════════════════════════════════════════════════════════════════════
+# HARNESS
+# ════════════════════════════════════════════════════════════════════
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def bench(fn, repeat=3, number=1):
+    """Median seconds per call over `repeat` rounds of `number` calls."""
+    rounds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - t0) / number)
+    return {'sec': statistics.median(rounds), 'min': min(rounds)}
+
+def peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def stage_breakdown():
+    """Per-stage totals recorded by server.py's own timing hooks during the last run."""
+    summary = server.metrics_summary()['stage']
+    return {k: {'sum': v['sum'], 'count': v['count'], 'p50': v['p50']} for k, v in summary.items()}
+
+def run_functions(with_mem):
+    """Size-independent per-call costs."""
+    h5, h1 = POOL[0], POOL[0].tail(HIST_DAYS_1Y)
+    tech   = server.calc_technicals(h5)
+    cases  = {
+        'calc_technicals_5y': (lambda: server.calc_technicals(h5), 200),
+        'calc_technicals_1y': (lambda: server.calc_technicals(h1), 200),
+        'classify_stage':     (lambda: server.classify_stage(tech), 20000),
+        'score':              (lambda: server.score(12.0, 0.4, 18.0, 6.0, tech), 20000),
+    }
+    out = {}
+    for name, (fn, number) in cases.items():
+        out[name] = bench(fn, repeat=5, number=number)
+        if with_mem:
+            out[name]['peak_bytes'] = peak_bytes(fn)
+        print(f"  {name:<22} {out[name]['sec'] * 1e6:9.1f} µs/call")
+    return out
+
+def run_size(n, with_mem, tmpdir):
+    """End-to-end and universe-sized paths for an n-ticker universe."""
+    items = [{'ticker': f'SYN{i:05d}', 'mcap': 100 + i} for i in range(n)]
+    server.load_ticker_cache = lambda: items
+    server.TICKER_CACHE_FILE = os.path.join(tmpdir, 'tickers_cache.json')
+    server.CACHE_FILE        = os.path.join(tmpdir, 'cache.json')
+    server.HISTORY_DIR       = os.path.join(tmpdir, 'history')
+    server.PRICES_DIR        = os.path.join(tmpdir, 'prices')
+    server.PLAN_FILE         = os.path.join(tmpdir, 'plan.json')
+
+    def scan():
+        with quiet():
+            server.fetch_all_stocks()
+    def prices():
+        with quiet():
+            server.refresh_prices()
+    def technicals():
+        with quiet():
+            server.refresh_technicals()
+    def save():
+        with quiet():
+            server.save_cache()
+    def load():
+        with quiet():
+            server.load_cache()
+    def encode():
+        with server.state_lock:
+            payload = {'status': server.state['status'], 'stocks': server.state['stocks']}
+        server.Handler.send_json(_FakeHandler(), payload)
+    def columnar():
+        with server.state_lock:
+            server.stocks_columnar({'status': server.state['status']}, server.state['stocks'])
+
+    out = {}
+    cases = [('scan_e2e', scan, 1), ('refresh_prices', prices, 3), ('refresh_technicals', technicals, 1),
+             ('save_cache', save, 3), ('load_cache', load, 3), ('send_json_stocks', encode, 3),
+             ('columnar_stocks', columnar, 3)]
+    for name, fn, repeat in cases:
+        server.metrics.clear()
+        out[name] = bench(fn, repeat=repeat)
+        if name in ('scan_e2e', 'refresh_prices', 'refresh_technicals'):
+            out[name]['stages'] = stage_breakdown()
+        if with_mem:
+            out[name]['peak_bytes'] = peak_bytes(fn)
+        mem = f"  peak {out[name]['peak_bytes'] / 2**20:7.1f} MB" if with_mem else ''
+        print(f"  {name:<22} {out[name]['sec']:9.3f} s{mem}")
+    out['stocks']        = len(server.state['stocks'])
+    out['payload_bytes'] = len(json.dumps(server.state['stocks'], ensure_ascii=False).encode('utf-8'))
+    out['payload_columnar_bytes'] = len(server.stocks_columnar({}, server.state['stocks']))
+    return out
+
+# ════════════════════════════════════════════════════════════════════
+# HTTP LOAD TEST
+# Each client thread is one browser tab running index.html's poll loop
+# (status every 8s; columnar stocks, the plan (If-None-Match, so usually a
+# 304) and indices whenever last_updated changes; and the Control tab's
+# ctrl/status/metrics every 5s), with timers divided by
+# --speed. A background thread keeps refresh_prices / refresh_technicals
+# running the whole time, so requests contend with them for state_lock.
+# ════════════════════════════════════════════════════════════════════
+UI_STATUS_POLL = 8.0
+UI_CTRL_POLL   = 5.0
+
+def _http_get(port, path, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path, headers=headers or {})
+        r = conn.getresponse()
+        return r.status, r.read(), r.headers
+    finally:
+        conn.close()
+
+class LoadClient(threading.Thread):
+    def __init__(self, port, samples, stop, speed, control_tab, seed):
+        super().__init__(daemon=True)
+        self.port, self.samples, self.stop, self.speed = port, samples, stop, speed
+        self.control_tab = control_tab
+        self.rng = random.Random(seed)
+        self.plan_etag = None
+
+    def hit(self, path, headers=None):
+        t0 = time.perf_counter()
+        try:
+            status, body, hdrs = _http_get(self.port, path, headers)
+            ok = status in (200, 304)
+        except Exception:
+            body, hdrs, ok = b'', {}, False
+        self.samples.append((path.split('?')[0], time.perf_counter() - t0, ok))
+        return body, hdrs
+
+    def load_stocks(self):
+        """loadStocks(): the universe as typed columns, then the plan (a 304 while it's unchanged)."""
+        self.hit('/api/stocks', {'Accept': server.COLUMNAR_TYPE})
+        _, hdrs = self.hit('/api/plan', {'If-None-Match': self.plan_etag} if self.plan_etag else None)
+        self.plan_etag = hdrs.get('ETag') or self.plan_etag
+
+    def run(self):
+        # Tabs open at random points in one status interval, not all at once
+        if self.stop.wait(self.rng.uniform(0, UI_STATUS_POLL / self.speed)):
+            return
+        self.hit('/api/status')
+        self.load_stocks()
+        for path in ('/api/indices', '/api/watchlist'):
+            self.hit(path)
+        last_updated = None
+        next_status = next_ctrl = time.monotonic()
+        while not self.stop.is_set():
+            now = time.monotonic()
+            if now >= next_status:
+                try:
+                    lu = json.loads(self.hit('/api/status')[0]).get('last_updated')
+                except ValueError:
+                    lu = last_updated
+                if lu != last_updated:
+                    last_updated = lu
+                    self.load_stocks()
+                    self.hit('/api/indices')
+                next_status += UI_STATUS_POLL / self.speed
+            if self.control_tab and now >= next_ctrl:
+                for path in ('/api/ctrl', '/api/status', '/api/metrics?format=json'):
+                    self.hit(path)
+                next_ctrl += UI_CTRL_POLL / self.speed
+            wake = next_status if not self.control_tab else min(next_status, next_ctrl)
+            self.stop.wait(max(0.0, wake - time.monotonic()))
+
+def _refresh_loop(stop, counts):
+    while not stop.is_set():
+        server.refresh_prices()
+        counts['prices'] += 1
+        if stop.is_set():
+            break
+        server.refresh_technicals()
+        counts['technicals'] += 1
+
+def _pct(xs, q):
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else 0.0
+
+def run_load_level(port, clients, duration, speed, ctrl_share):
+    samples, stop = [], threading.Event()
+    counts = {'prices': 0, 'technicals': 0}
+    server.metrics.clear()
+    refresher = threading.Thread(target=_refresh_loop, args=(stop, counts), daemon=True)
+    tabs = [LoadClient(port, samples, stop, speed, i < round(clients * ctrl_share), seed=i)
+            for i in range(clients)]
+    t0 = time.perf_counter()
+    with quiet():
+        refresher.start()
+        for tab in tabs:
+            tab.start()
+        time.sleep(duration)
+        stop.set()
+        for tab in tabs:
+            tab.join(35)
+        refresher.join()
+    wall = time.perf_counter() - t0
+
+    by_route = {}
+    for route, sec, ok in samples:
+        by_route.setdefault(route, []).append((sec, ok))
+    routes = {}
+    for route, rows in sorted(by_route.items()):
+        xs = sorted(sec for sec, _ in rows)
+        routes[route] = {'count': len(xs), 'rps': round(len(xs) / wall, 2),
+                         'p50': _pct(xs, 0.5), 'p99': _pct(xs, 0.99), 'max': xs[-1],
+                         'errors': sum(1 for _, ok in rows if not ok)}
+    summary   = server.metrics_summary()
+    lock      = summary['lock'].get('state_lock', {})
+    busy      = sum(v['sum'] for v in summary['http'].values())
+    all_xs    = sorted(sec for _, sec, _ in samples)
+    return {'clients': clients, 'wall': wall, 'routes': routes, 'refreshes': counts,
+            'p50': _pct(all_xs, 0.5), 'p99': _pct(all_xs, 0.99),
+            'lock_wait': {'count': lock.get('count', 0), 'sum': lock.get('sum', 0.0),
+                          'p50': lock.get('p50') or 0.0, 'p99': lock.get('p99') or 0.0},
+            'server_busy': busy / wall}
+
+def run_load(levels, universe, duration, speed, ctrl_share, yahoo_latency):
+    """Scan a synthetic universe, serve it with the same ScoutHTTPServer main() uses, then
+    step through the client counts in `levels`."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        items = [{'ticker': f'SYN{i:05d}', 'mcap': 100 + i} for i in range(universe)]
+        server.load_ticker_cache = lambda: items
+        server.TICKER_CACHE_FILE = os.path.join(tmpdir, 'tickers_cache.json')
+        server.CACHE_FILE        = os.path.join(tmpdir, 'cache.json')
+        server.HISTORY_DIR       = os.path.join(tmpdir, 'history')
+        server.PRICES_DIR        = os.path.join(tmpdir, 'prices')
+        server.PLAN_FILE         = os.path.join(tmpdir, 'plan.json')
+        print(f"\n  Scanning {universe:,} synthetic tickers for the load test...")
+        with quiet():
+            server.fetch_all_stocks()
+        FakeYF.latency = yahoo_latency
+
+        httpd = server.ScoutHTTPServer(('127.0.0.1', 0), server.Handler)
+        port  = httpd.server_address[1]
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+        out = []
+        for clients in levels:
+            print(f"\n  {clients} client(s) × {duration}s, UI timers ×{speed:g}, Yahoo latency {yahoo_latency * 1e3:.0f} ms")
+            r = run_load_level(port, clients, duration, speed, ctrl_share)
+            print(f"  {'route':<22} {'req':>6} {'req/s':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'err':>5}")
+            for route, v in r['routes'].items():
+                print(f"  {route:<22} {v['count']:>6} {v['rps']:>7.2f} {v['p50'] * 1e3:>9.1f} "
+                      f"{v['p99'] * 1e3:>9.1f} {v['max'] * 1e3:>9.1f} {v['errors']:>5}")
+            lw = r['lock_wait']
+            print(f"  all routes p50 {r['p50'] * 1e3:.1f} ms · p99 {r['p99'] * 1e3:.1f} ms · "
+                  f"server busy {r['server_busy']:.0%} · refreshes {r['refreshes']['prices']} prices / "
+                  f"{r['refreshes']['technicals']} technicals")
+            print(f"  state_lock wait: {lw['count']} acquisitions, {lw['sum']:.3f} s total, "
+                  f"p50 {lw['p50'] * 1e3:.2f} ms, p99 {lw['p99'] * 1e3:.2f} ms")
+            out.append(r)
+        httpd.shutdown()
+        FakeYF.latency = 0.0
+    return out
+
+# ════════════════════════════════════════════════════════════════════
+# BASELINE COMPARISON
+# ════════════════════════════════════════════════════════════════════
+def compare(current, baseline, tolerance):
+    """Yield (path, old, new, ratio) for every figure worse than baseline × (1 + tolerance)."""
+    def walk(cur, base, path):
+        for k, v in cur.items():
+            if k not in base or k == 'stages':
+                continue
+            if isinstance(v, dict):
+                yield from walk(v, base[k], path + [k])
+            elif k in ('sec', 'peak_bytes') and base[k]:
+                ratio = v / base[k]
+                if ratio > 1 + tolerance:
+                    yield '/'.join(path + [k]), base[k], v, ratio
+    yield from walk(current['results'], baseline.get('results', {}), [])
+
+def environment():
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'pandas': pd.__version__, 'numpy': np.__version__}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                    help='comma-separated universe sizes (default: %(default)s)')
+    ap.add_argument('--no-mem', action='store_true', help='skip the tracemalloc peak-memory pass')
+    ap.add_argument('--save-baseline', action='store_true', help=f'write results to {os.path.basename(BASELINE_FILE)}')
+    ap.add_argument('--baseline', default=BASELINE_FILE, help='baseline file to compare against')
+    ap.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before flagging (default 0.25 = 25%%)')
+    ap.add_argument('--out', help='also write this run as JSON to the given path')
+    ap.add_argument('--load', metavar='CLIENTS', help='run the HTTP load test instead, e.g. 1,5,20,50')
+    ap.add_argument('--duration', type=float, default=30, help='--load: seconds per client level (default %(default)s)')
+    ap.add_argument('--speed', type=float, default=4, help='--load: divide UI poll timers by this (default %(default)s)')
+    ap.add_argument('--universe', type=int, default=2000, help='--load: synthetic tickers served (default %(default)s)')
+    ap.add_argument('--ctrl-share', type=float, default=0.25,
+                    help='--load: fraction of tabs with the Control tab open (default %(default)s)')
+    ap.add_argument('--yahoo-latency', type=float, default=0.15,
+                    help='--load: simulated seconds per Yahoo call (default %(default)s)')
+    args = ap.parse_args()
+
+    server.yf = FakeYF()
+    if args.load:
+        levels = [int(x) for x in args.load.split(',') if x.strip()]
+        result = run_load(levels, args.universe, args.duration, args.speed, args.ctrl_share, args.yahoo_latency)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump({'saved_at': server.get_ist().isoformat(), 'env': environment(), 'load': result}, f, indent=1)
+        return 0
+    sizes     = [int(x) for x in args.sizes.split(',') if x.strip()]
+    with_mem  = not args.no_mem
+    run       = {'saved_at': server.get_ist().isoformat(), 'env': environment(),
+                 'results': {'functions': {}}}
+
+    print("\n  Per-function (size-independent)")
+    run['results']['functions'] = run_functions(with_mem)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in sizes:
+            print(f"\n  Universe: {n:,} tickers")
+            run['results'][f'n{n}'] = run_size(n, with_mem, tmpdir)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(run, f, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=1)
+        print(f"\n  💾 Baseline saved → {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n  No baseline at {args.baseline} — run with --save-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('env', {}) != run['env']:
+        print("\n  ⚠ Baseline was recorded on a different environment — compare with care")
+    regressions = list(compare(run, baseline, args.tolerance))
+    if not regressions:
+        print(f"\n  ✅ No regressions beyond {args.tolerance:.0%} vs baseline ({baseline.get('saved_at', '?')})")
+        return 0
+    print(f"\n  ❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+    for path, old, new, ratio in regressions:
+        print(f"     {path:<45} {old:12.4g} → {new:12.4g}  ({ratio:.2f}x)")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,9 @@ Open browser at: http://localhost:5000
 """
 
 import json, datetime, math, time, threading, os, sys
+import bisect, hashlib, random
+from array import array
+from collections import OrderedDict
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -25,7 +28,7 @@ except Exception:
     pass
 
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
 
 # ── Auto-install ─────────────────────────────────────────────────────
 def install(pkg):
@@ -48,17 +51,177 @@ try:
 except ImportError:
     print("Installing requests..."); install('requests'); import requests
 
+import numpy as np   # ships with pandas
+
 # ════════════════════════════════════════════════════════════════════
 # CONFIG
 # ════════════════════════════════════════════════════════════════════
 PORT               = 5000
 MCAP_MIN_CR        = 1         # include all stocks with valid MCap data
 MCAP_MAX_CR        = 9_999_999 # no upper limit — frontend segments by MCap
-LIVE_REFRESH       = 5 * 60   # seconds between price refreshes
+LIVE_REFRESH       = 5 * 60   # seconds between price refreshes (cold tier + total budget)
+PRICE_TICK_SEC     = 20       # scheduler tick during market hours
+PRICE_BATCH_SIZE   = 100      # tickers per yf.download call
+HOT_REFRESH        = 20       # watchlist names
+WARM_REFRESH       = 60       # top-score + breakout-stage names
+WARM_TOP_N         = 100      # top N by score that qualify for the warm tier
+WARM_STAGES        = ('breakout', 'pre_cross', 'post_cross', 'pullback')
 SCAN_WORKERS       = 8        # parallel workers for full scan
 BATCH_DELAY        = 1.0      # seconds between stocks (legacy — unused by parallel scan)
 CACHE_MAX_AGE_HRS  = 24
 TICKER_CACHE_DAYS  = 15       # refresh MCap-filtered ticker list every N days
+SCAN_MODE          = 'local'  # 'local' = thread pool here | 'sharded' = coordinator + workers
+SHARD_SIZE         = 50       # tickers per shard (sharded mode)
+SHARD_LEASE_SEC    = 120      # a shard goes back to the queue if its worker stops renewing
+SHARD_MAX_ATTEMPTS = 3        # leases per shard before its tickers are counted as failed
+SHARD_LOCAL_WORKERS = 2       # worker processes the coordinator spawns on this machine
+INDEX_LIST = [                # (Yahoo symbol, label) for the indices bar — fetched in one batch
+    ('^NSEI',               'NIFTY 50'),
+    ('^BSESN',              'SENSEX'),
+    ('^NSEBANK',            'NIFTY BANK'),
+    ('NIFTY_MIDCAP_100.NS', 'NIFTY MIDCAP 100'),
+    ('^CNXSC',              'NIFTY SMALLCAP 100'),
+    # sectoral: ('^CNXIT','NIFTY IT'), ('^CNXAUTO','NIFTY AUTO'), ('^CNXPHARMA','NIFTY PHARMA'),
+    #           ('^CNXMETAL','NIFTY METAL'), ('^CNXFMCG','NIFTY FMCG'), ('^CNXREALTY','NIFTY REALTY')
+]
+INDEX_TTL          = 60       # seconds index quotes are served from memory (market hours)
+INDEX_TTL_CLOSED   = 15 * 60  # ... outside market hours
+INDEX_RETRY_SEC    = 30       # wait after a failed index fetch before trying again
+RS_BENCHMARK       = '^NSEI'   # relative strength is measured against this index
+RS_HORIZONS        = (('1m', 21, 0.2), ('3m', 63, 0.4), ('6m', 126, 0.4))  # label, sessions, rating weight
+RS_LINE_DAYS       = 60       # points in the RS line on the stock detail view
+RS_SCORE_POINTS    = 0        # technicals bonus for RS rating >= 80 (half at >= 60); 0 = shown, not scored
+MTF_SCORE_POINTS   = 0        # technicals bonus when the weekly trend is up (half more if monthly is too); 0 = shown, not scored
+PROVIDER           = 'live'   # 'live' | 'record' | 'replay' | 'http://host:port' (stand-in) | 'bhav[+base]' | 'matrix[+base]'
+PROVIDER_DIR       = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PROVIDER_LATENCY   = 0.0      # replay/stand-in: mean seconds added per call
+PROVIDER_ERROR_RATE = 0.0     # replay/stand-in: fraction of calls that fail (500)
+PROVIDER_RATE_LIMIT = 0.0     # replay/stand-in: calls/sec before 429s (0 = unlimited)
+
+# ════════════════════════════════════════════════════════════════════
+# METRICS — per-stage / per-route latency histograms
+# Hot-path cost is two perf_counter() calls, one uncontended lock and an
+# array store. Exposed as Prometheus text at /api/metrics (JSON summary
+# for the Control tab at /api/metrics?format=json).
+# ════════════════════════════════════════════════════════════════════
+METRIC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                  0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRIC_WINDOW  = 512   # recent samples kept per series for p50/p95/p99
+METRIC_FAMILIES = {
+    'stage': ('dss_stage_seconds',        'stage', 'Pipeline stage latency'),
+    'http':  ('dss_http_request_seconds', 'route', 'HTTP route latency'),
+    'lock':  ('dss_lock_wait_seconds',    'lock',  'Time spent waiting to acquire a lock'),
+}
+
+class _Series:
+    __slots__ = ('count', 'total', 'errors', 'buckets', 'window', 'head')
+
+    def __init__(self):
+        self.count   = 0
+        self.total   = 0.0
+        self.errors  = 0
+        self.buckets = [0] * (len(METRIC_BUCKETS) + 1)
+        self.window  = array('f', bytes(4 * METRIC_WINDOW))
+        self.head    = 0
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        n = min(self.count, METRIC_WINDOW)
+        if not n:
+            return [None] * len(qs)
+        xs = sorted(self.window[:n])
+        return [xs[min(n - 1, int(q * n))] for q in qs]
+
+metrics      = {}   # (family, label) -> _Series
+metrics_lock = threading.Lock()
+
+def observe(family, label, seconds, error=False):
+    key = (family, label)
+    with metrics_lock:
+        sr = metrics.get(key)
+        if sr is None:
+            sr = metrics[key] = _Series()
+        sr.count += 1
+        sr.total += seconds
+        if error:
+            sr.errors += 1
+        sr.buckets[bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1
+        sr.window[sr.head] = seconds
+        sr.head = (sr.head + 1) % METRIC_WINDOW
+
+class timed:
+    """with timed('t.info'): ...  — records duration, and an error if the block raises."""
+    __slots__ = ('label', 'family', 't0')
+
+    def __init__(self, label, family='stage'):
+        self.label, self.family = label, family
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.family, self.label, time.perf_counter() - self.t0, exc_type is not None)
+        return False
+
+class TimedLock:
+    """threading.Lock that records how long each caller waited to acquire it."""
+    def __init__(self, name):
+        self.name  = name
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        t0 = time.perf_counter()
+        self._lock.acquire()
+        observe('lock', self.name, time.perf_counter() - t0)
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+        return False
+
+def metrics_summary():
+    """{family: {label: {count, errors, sum, p50, p95, p99}}} for the Control tab."""
+    out = {f: {} for f in METRIC_FAMILIES}
+    with metrics_lock:
+        for (family, label), sr in metrics.items():
+            p50, p95, p99 = sr.quantiles()
+            out[family][label] = {
+                'count': sr.count, 'errors': sr.errors, 'sum': round(sr.total, 3),
+                'p50': p50 and round(p50, 6), 'p95': p95 and round(p95, 6), 'p99': p99 and round(p99, 6),
+            }
+    return out
+
+def _prom_label(v):
+    """Label value escaped per the text exposition format."""
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def metrics_prometheus():
+    lines = []
+    with metrics_lock:
+        items = sorted(metrics.items())
+        for family, (name, lname, help_txt) in METRIC_FAMILIES.items():
+            series = [(label, sr) for (f, label), sr in items if f == family]
+            if not series:
+                continue
+            lines += [f'# HELP {name} {help_txt}', f'# TYPE {name} histogram']
+            series = [(_prom_label(label), sr) for label, sr in series]
+            for label, sr in series:
+                cum = 0
+                for le, n in zip(METRIC_BUCKETS + ('+Inf',), sr.buckets):
+                    cum += n
+                    lines.append(f'{name}_bucket{{{lname}="{label}",le="{le}"}} {cum}')
+                lines.append(f'{name}_sum{{{lname}="{label}"}} {sr.total:.6f}')
+                lines.append(f'{name}_count{{{lname}="{label}"}} {sr.count}')
+            lines += [f'# HELP {name[:-8]}_quantile_seconds Recent-window quantiles of {name}',
+                      f'# TYPE {name[:-8]}_quantile_seconds gauge']
+            for label, sr in series:
+                for q, v in zip(('0.5', '0.95', '0.99'), sr.quantiles()):
+                    lines.append(f'{name[:-8]}_quantile_seconds{{{lname}="{label}",quantile="{q}"}} {v:.6f}')
+            lines += [f'# HELP {name[:-8]}_errors_total Errors raised inside {name}',
+                      f'# TYPE {name[:-8]}_errors_total counter']
+            for label, sr in series:
+                lines.append(f'{name[:-8]}_errors_total{{{lname}="{label}"}} {sr.errors}')
+    return '\n'.join(lines) + '\n'
 
 # ════════════════════════════════════════════════════════════════════
 # STATE
@@ -72,16 +235,29 @@ state = {
     'fetch_message':  'Starting...',
     'total_scanned':  0,
     'in_range':       0,
+    'watchlist':      [],
     'ctrl': {
         'ticker_fetch': {'last_run': None, 'nse_count': 0, 'sme_count': 0},
         'ticker_list':  {'last_run': None, 'total_in_range': 0},
         'price_update': {'last_run': None, 'updated': 0, 'elapsed_sec': 0.0,
                          'workers': 5, 'batches': 0, 'batch_size': 100, 'running': False},
+        'price_tiers':  {'last_tick': None, 'budget': 0, 'picked': 0, 'watchlist': 0,
+                         'hot':  {'interval': HOT_REFRESH,  'count': 0, 'max_age': 0},
+                         'warm': {'interval': WARM_REFRESH, 'count': 0, 'max_age': 0},
+                         'cold': {'interval': LIVE_REFRESH, 'count': 0, 'max_age': 0}},
         'technicals':   {'last_run': None, 'elapsed_sec': 0.0, 'workers': 8,
                          'yahoo_calls': 0, 'updated': 0, 'running': False},
+        'shards':       {'running': False, 'total': 0, 'pending': 0, 'leased': 0, 'done': 0,
+                         'failed': 0, 'reassigned': 0, 'workers': {}},
+        'memory':       {'measured_at': None, 'tracing': False, 'diff_top': []},
+        'indices':      {'last_fetch': None, 'count': 0, 'fetches': 0, 'coalesced': 0,
+                         'errors': 0, 'error': None, 'ttl': INDEX_TTL},
+        'sweep':        {'running': False, 'phase': None, 'done': 0, 'total': 0, 'started': None,
+                         'finished': None, 'elapsed_sec': 0.0, 'events': 0, 'configs': 0,
+                         'defaults': None, 'best': None, 'error': None},
     },
 }
-state_lock = threading.Lock()
+state_lock = TimedLock('state_lock')
 
 # ════════════════════════════════════════════════════════════════════
 # TIME
@@ -99,40 +275,1353 @@ def get_market_mode():
     if mins >= 15*60+30:              return 'eod'
     return 'pre'
 
+# ════════════════════════════════════════════════════════════════════
+# DATA PROVIDERS
+# Every Yahoo / NSE call goes through `provider`, so a full scan can be
+# recorded once and replayed offline:
+#   live    — yfinance + requests (default)
+#   record  — live, and every response is written under PROVIDER_DIR
+#   replay  — served from PROVIDER_DIR, no network
+#   http://host:port — a stand-in started with `server.py --standin PORT`
+# Replay and the stand-in can inject latency, 429 throttling and errors.
+# Price downloads are stored per ticker, so replayed batches needn't match
+# the batches that were recorded.
+# ════════════════════════════════════════════════════════════════════
+class ProviderError(Exception):
+    def __init__(self, status, msg=''):
+        super().__init__(f'{status} {msg}'.strip())
+        self.status = status
+
+# Calendar days a history() period reaches back — for stores that serve history themselves
+PERIOD_DAYS = {'5d': 7, '1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731, '5y': 1827, '10y': 3653}
+
+def frame_to_doc(df):
+    """DataFrame → JSON-safe dict. MultiIndex columns become [field, ticker] pairs."""
+    return {'index':   [ts.isoformat() for ts in df.index],
+            'columns': [list(c) if isinstance(c, tuple) else c for c in df.columns],
+            'data':    [[None if v != v else v for v in row] for row in df.values.tolist()]}
+
+def frame_from_doc(doc):
+    cols = doc['columns']
+    if cols and isinstance(cols[0], list):
+        cols = pd.MultiIndex.from_tuples([tuple(c) for c in cols], names=['Price', 'Ticker'])
+    idx = pd.DatetimeIndex(pd.to_datetime(doc['index']), name='Date')
+    return pd.DataFrame(doc['data'], index=idx, columns=cols, dtype='float64')
+
+def synthetic_ohlcv(seed, days=1250, end='2026-01-30'):
+    """Deterministic random-walk OHLCV frame shaped like history() — for bench.py
+    fixtures and backtest.py --synthetic, no network."""
+    rng    = np.random.default_rng(seed)
+    close  = 100 * rng.uniform(0.2, 20) * np.exp(np.cumsum(rng.normal(0.0004, 0.02, days)))
+    spread = np.abs(rng.normal(0, 0.012, days)) * close
+    high   = close + spread * rng.uniform(0.2, 1.0, days)
+    low    = close - spread * rng.uniform(0.2, 1.0, days)
+    open_  = low + (high - low) * rng.uniform(0, 1, days)
+    volume = rng.lognormal(12, 0.6, days).round()
+    idx    = pd.bdate_range(end=end, periods=days)
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume},
+                        index=idx)
+
+class FaultInjector:
+    """Latency, token-bucket throttling (→ 429) and random errors (→ 500)."""
+    def __init__(self, latency=0.0, error_rate=0.0, rate=0.0, seed=None):
+        self.latency, self.error_rate, self.rate = latency, error_rate, rate
+        self.rng    = random.Random(seed)
+        self.tokens = max(1.0, rate)
+        self.stamp  = time.monotonic()
+        self.lock   = threading.Lock()
+        self.counts = {200: 0, 429: 0, 500: 0}
+
+    def admit(self):
+        """Sleep the configured latency, then return the status this call gets."""
+        with self.lock:
+            status = 200
+            if self.rate:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.stamp) * self.rate)
+                self.stamp  = now
+                if self.tokens < 1:
+                    status = 429
+                else:
+                    self.tokens -= 1
+            if status == 200 and self.error_rate and self.rng.random() < self.error_rate:
+                status = 500
+            delay = self.latency * self.rng.uniform(0.5, 1.5) if self.latency else 0
+            self.counts[status] += 1
+        if delay:
+            time.sleep(delay)
+        return status
+
+class LiveProvider:
+    name = 'live'
+    NSE_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Accept': 'application/json, text/plain, */*',
+        'Referer': 'https://www.nseindia.com/',
+    }
+
+    def info(self, symbol):
+        return yf.Ticker(symbol).info
+
+    def history(self, symbol, period):
+        return yf.Ticker(symbol).history(period=period, auto_adjust=True)
+
+    def download(self, symbols, period='5d'):
+        return yf.download(list(symbols), period=period, interval='1d',
+                           auto_adjust=True, progress=False, threads=False)
+
+    def quotes(self, symbols):
+        """{symbol: {'last', 'prev'}} for every symbol from one batched download.
+        During market hours the last daily bar is today's, so 'last' is live."""
+        data = self.download(symbols, '5d')
+        out  = {}
+        if data.empty:
+            return out
+        close = data['Close']
+        for sym in symbols:
+            if sym not in close:
+                continue
+            vals = close[sym].dropna()
+            if len(vals) >= 2:
+                out[sym] = {'last': float(vals.iloc[-1]), 'prev': float(vals.iloc[-2])}
+        return out
+
+    def nse_text(self, url):
+        """GET an NSE page. The JSON API wants the homepage cookies first."""
+        session = requests.Session()
+        if '/api/' in url:
+            session.get('https://www.nseindia.com', headers=self.NSE_HEADERS, timeout=15)
+        r = session.get(url, headers=self.NSE_HEADERS, timeout=20)
+        if r.status_code != 200:
+            raise ProviderError(r.status_code, url)
+        return r.text
+
+def _fixture_name(key):
+    return ''.join(c if c.isalnum() or c in '._^&-' else '_' for c in key) + '.json'
+
+class FixtureStore:
+    """On-disk layout: <dir>/<kind>/[<period>/]<key>.json"""
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, kind, key, period=None):
+        parts = [self.root, kind] + ([period] if period else [])
+        return os.path.join(*parts, _fixture_name(key))
+
+    def write(self, kind, key, doc, period=None):
+        p = self.path(kind, key, period)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = p + f'.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(doc, f, ensure_ascii=False, default=str)
+        os.replace(tmp, p)
+
+    def read(self, kind, key, period=None):
+        try:
+            with open(self.path(kind, key, period), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ProviderError(404, f'no {kind} fixture for {key}')
+
+class RecordingProvider(LiveProvider):
+    name = 'record'
+
+    def __init__(self, root):
+        self.store = FixtureStore(root)
+
+    def info(self, symbol):
+        info = super().info(symbol)
+        self.store.write('info', symbol, info)
+        return info
+
+    def history(self, symbol, period):
+        hist = super().history(symbol, period)
+        self.store.write('history', symbol, frame_to_doc(hist), period)
+        return hist
+
+    def download(self, symbols, period='5d'):
+        data = super().download(symbols, period)
+        if not data.empty and isinstance(data.columns, pd.MultiIndex):
+            for sym in data.columns.get_level_values(1).unique():
+                sub = data.xs(sym, axis=1, level=1).dropna(how='all')
+                if len(sub):
+                    self.store.write('download', sym, frame_to_doc(sub), period)
+        return data
+
+    def quotes(self, symbols):
+        out = super().quotes(symbols)
+        for sym, q in out.items():
+            self.store.write('quotes', sym, q)
+        return out
+
+    def nse_text(self, url):
+        text = super().nse_text(url)
+        self.store.write('nse', hashlib.sha1(url.encode()).hexdigest()[:16], {'url': url, 'text': text})
+        return text
+
+class ReplayProvider:
+    name = 'replay'
+
+    def __init__(self, root, faults=None):
+        self.store  = FixtureStore(root)
+        self.faults = faults
+
+    def _admit(self):
+        if self.faults:
+            status = self.faults.admit()
+            if status != 200:
+                raise ProviderError(status, 'injected')
+
+    def info(self, symbol):
+        self._admit()
+        return self.store.read('info', symbol)
+
+    def history(self, symbol, period):
+        self._admit()
+        return frame_from_doc(self.store.read('history', symbol, period))
+
+    def download(self, symbols, period='5d'):
+        """Reassemble a yf.download-shaped frame; tickers without a fixture are left out."""
+        self._admit()
+        parts = {}
+        for sym in symbols:
+            try:
+                parts[sym] = frame_from_doc(self.store.read('download', sym, period))
+            except ProviderError:
+                pass
+        if not parts:
+            return pd.DataFrame()
+        data = pd.concat(parts, axis=1).swaplevel(0, 1, axis=1).sort_index(axis=1, level=0)
+        data.columns.names = ['Price', 'Ticker']
+        return data
+
+    def quotes(self, symbols):
+        self._admit()
+        out = {}
+        for sym in symbols:
+            try:
+                out[sym] = self.store.read('quotes', sym)
+            except ProviderError:
+                pass
+        return out
+
+    def nse_text(self, url):
+        self._admit()
+        return self.store.read('nse', hashlib.sha1(url.encode()).hexdigest()[:16])['text']
+
+class HttpProvider:
+    """Client for the stand-in (`server.py --standin PORT`)."""
+    name = 'http'
+
+    def __init__(self, base):
+        self.base = base.rstrip('/')
+
+    def _get(self, route, **params):
+        r = requests.get(f'{self.base}/{route}', params=params, timeout=30)
+        if r.status_code != 200:
+            raise ProviderError(r.status_code, f'{route} {params.get("s", "")}')
+        return r.json()
+
+    def info(self, symbol):
+        return self._get('info', s=symbol)
+
+    def history(self, symbol, period):
+        return frame_from_doc(self._get('history', s=symbol, period=period))
+
+    def download(self, symbols, period='5d'):
+        doc = self._get('download', s=','.join(symbols), period=period)
+        return frame_from_doc(doc) if doc['columns'] else pd.DataFrame()
+
+    def quotes(self, symbols):
+        return self._get('quotes', s=','.join(symbols))
+
+    def nse_text(self, url):
+        return self._get('nse', url=url)['text']
+
+def make_provider(spec=None, root=None, faults=None):
+    spec = spec or PROVIDER
+    root = root or PROVIDER_DIR
+    if spec == 'live':
+        return LiveProvider()
+    if spec == 'record':
+        return RecordingProvider(root)
+    if spec == 'replay':
+        return ReplayProvider(root, faults)
+    if spec.startswith('http://') or spec.startswith('https://'):
+        return HttpProvider(spec)
+    if spec == 'bhav' or spec.startswith('bhav+'):
+        return BhavcopyProvider(make_provider(spec[5:] or 'live', root, faults))
+    if spec == 'matrix' or spec.startswith('matrix+'):
+        return MatrixProvider(make_provider(spec[7:] or 'live', root, faults))
+    raise ValueError(f'unknown provider {spec!r} (live | record | replay | http://host:port | bhav[+base] | matrix[+base])')
+
+def provider_faults():
+    if not (PROVIDER_LATENCY or PROVIDER_ERROR_RATE or PROVIDER_RATE_LIMIT):
+        return None
+    return FaultInjector(PROVIDER_LATENCY, PROVIDER_ERROR_RATE, PROVIDER_RATE_LIMIT)
+
+def provider_argv():
+    """CLI flags that reproduce the current provider in a child process."""
+    if PROVIDER == 'live':
+        return []
+    return ['--provider', PROVIDER, '--fixtures', PROVIDER_DIR, '--latency', str(PROVIDER_LATENCY),
+            '--error-rate', str(PROVIDER_ERROR_RATE), '--rate-limit', str(PROVIDER_RATE_LIMIT)]
+
+provider = LiveProvider()
+
+def run_standin(port, root=None, faults=None):
+    """Serve recorded fixtures over HTTP so clients pay real socket/JSON costs.
+    Faults are applied per request: 429 carries Retry-After, 500 is a plain error."""
+    from http.server import ThreadingHTTPServer
+    replay = ReplayProvider(root or PROVIDER_DIR)
+
+    class StandinHandler(BaseHTTPRequestHandler):
+        def log_message(self, *a): pass
+
+        def _send(self, status, body, headers=()):
+            data = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for k, v in headers:
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            route  = parsed.path.strip('/')
+            q      = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            status = faults.admit() if faults else 200
+            if status == 429:
+                return self._send(429, {'error': 'Too Many Requests'}, [('Retry-After', '1')])
+            if status != 200:
+                return self._send(status, {'error': 'injected'})
+            syms = [s for s in q.get('s', '').split(',') if s]
+            try:
+                if route == 'info':
+                    body = replay.info(q['s'])
+                elif route == 'history':
+                    body = replay.store.read('history', q['s'], q.get('period', '1y'))
+                elif route == 'download':
+                    body = frame_to_doc(replay.download(syms, q.get('period', '5d')))
+                elif route == 'quotes':
+                    body = replay.quotes(syms)
+                elif route == 'nse':
+                    body = {'text': replay.nse_text(q['url'])}
+                else:
+                    return self._send(404, {'error': f'unknown route {route}'})
+            except ProviderError as e:
+                return self._send(e.status, {'error': str(e)})
+            except KeyError as e:
+                return self._send(400, {'error': f'missing {e}'})
+            self._send(200, body)
+
+    srv = ThreadingHTTPServer(('0.0.0.0', port), StandinHandler)
+    srv.daemon_threads = True
+    print(f"  🎭 Provider stand-in on :{port} serving {os.path.abspath(root or PROVIDER_DIR)}")
+    if faults:
+        print(f"     latency {faults.latency}s · error rate {faults.error_rate:.0%} · "
+              f"rate limit {faults.rate or '∞'} req/s")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        if faults:
+            print(f"\n  Stand-in stopped — responses: {faults.counts}")
+
+# ════════════════════════════════════════════════════════════════════
+# BHAVCOPY — bulk EOD bars from NSE's daily files
+# One bhavcopy CSV holds the session's OHLCV for every listed symbol, so a
+# day costs one file instead of one history call per ticker. Files sit in
+# BHAV_DIR (dropped in by hand, or fetched from BHAV_URLS). Their rows are
+# kept raw in bhavcopy.npz; a load merges only files it hasn't seen. The
+# served bars are sorted by (symbol, day) and back-adjusted for splits and
+# bonuses from the exchange's own adjusted PREVCLOSE on the ex-date.
+#   --provider bhav             history() from bhavcopy, the rest live
+#   --provider bhav+replay      ... with replay for the rest instead
+#   --bhav-backfill 2021-01-01  download the missing files (in parallel), then exit
+# ════════════════════════════════════════════════════════════════════
+BHAV_DIR     = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bhavcopy')
+BHAV_URLS    = (   # (first session, template), newest first — {MON} is JAN..DEC
+    ('2024-07-08', 'https://nsearchives.nseindia.com/content/cm/BhavCopy_NSE_CM_0_0_0_{d:%Y%m%d}_F_0000.csv.zip'),
+    ('1994-11-03', 'https://nsearchives.nseindia.com/content/historical/EQUITIES/{d:%Y}/{MON}/cm{d:%d}{MON}{d:%Y}bhav.csv.zip'),
+)
+BHAV_FETCH   = True     # bhav provider: fetch the session's file at EOD if it isn't in BHAV_DIR
+BHAV_SERIES  = ('EQ', 'BE', 'BZ', 'SM', 'ST')   # main board + SME; the first listed wins a duplicate
+BHAV_WORKERS = 8        # parallel downloads / parses
+BHAV_ADJ_MIN = 0.005    # PREVCLOSE off the last close by more than this = corporate action
+BHAV_LEGACY  = {'SYMBOL': 'sym', 'SERIES': 'series', 'OPEN': 'o', 'HIGH': 'h', 'LOW': 'l', 'CLOSE': 'c',
+                'PREVCLOSE': 'pc', 'TOTTRDQTY': 'v', 'TIMESTAMP': 'date'}
+BHAV_UDIFF   = {'TckrSymb': 'sym', 'SctySrs': 'series', 'OpnPric': 'o', 'HghPric': 'h', 'LwPric': 'l',
+                'ClsPric': 'c', 'PrvsClsgPric': 'pc', 'TtlTradgVol': 'v', 'TradDt': 'date'}
+BHAV_FIELDS  = ('o', 'h', 'l', 'c', 'pc', 'v')
+
+bhav = {
+    'loaded':  False,
+    'files':   set(),   # file names already merged
+    'syms':    [],      # symbol id -> symbol
+    'sid_of':  {},
+    'raw':     None,    # sid, day, o, h, l, c, pc, v — one row per symbol per file
+    'index':   {},      # symbol -> (start, end) rows in the served arrays
+    'bars':    None,    # day + adjusted o, h, l, c, v, sorted by (symbol, day)
+    'first':   None,    # day numbers covered
+    'last':    None,
+    'actions': 0,       # split / bonus adjustments applied
+}
+bhav_lock      = threading.Lock()   # swaps of the served arrays
+bhav_load_lock = threading.Lock()   # one merge at a time
+
+def _bhav_store():
+    return os.path.join(BHAV_DIR, 'bhavcopy.npz')
+
+def bhav_parse(path):
+    """One bhavcopy (.csv or .csv.zip, old or UDiFF layout) → (day number, symbols, {field: array})."""
+    if path.lower().endswith('.zip'):
+        import zipfile
+        with zipfile.ZipFile(path) as z, z.open(z.namelist()[0]) as f:
+            df = pd.read_csv(f, dtype=str)
+    else:
+        df = pd.read_csv(path, dtype=str)
+    df.columns = [c.strip() for c in df.columns]
+    cols = BHAV_UDIFF if 'TckrSymb' in df.columns else BHAV_LEGACY
+    df   = df[list(cols)].rename(columns=cols)
+    for k in ('sym', 'series', 'date'):
+        df[k] = df[k].str.strip()
+    rank = df['series'].map({sr: i for i, sr in enumerate(BHAV_SERIES)})
+    df   = df[rank.notna()].assign(rank=rank).sort_values('rank', kind='stable').drop_duplicates('sym')
+    if df.empty:
+        raise ValueError('no rows in BHAV_SERIES')
+    stamp = df['date'].iloc[0]
+    day   = datetime.datetime.strptime(stamp, '%Y-%m-%d' if stamp[4:5] == '-' else '%d-%b-%Y').date()
+    vals  = {k: pd.to_numeric(df[k], errors='coerce').to_numpy(np.float32) for k in BHAV_FIELDS}
+    return (day - datetime.date(1970, 1, 1)).days, df['sym'].tolist(), vals
+
+def _bhav_read_store():
+    try:
+        with np.load(_bhav_store()) as z:
+            bhav['files']  = set(z['files'].tolist())
+            bhav['syms']   = z['syms'].tolist()
+            bhav['raw']    = {k: z[k] for k in ('sid', 'day') + BHAV_FIELDS}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"  ⚠ {_bhav_store()} unreadable ({e}) — re-reading every file")
+    bhav['sid_of'] = {sym: i for i, sym in enumerate(bhav['syms'])}
+    bhav['loaded'] = True
+
+def _bhav_save():
+    raw = bhav['raw']
+    tmp = _bhav_store() + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, files=np.array(sorted(bhav['files'])), syms=np.array(bhav['syms']), **raw)
+    os.replace(tmp, _bhav_store())
+
+def _bhav_build():
+    """Raw rows → served arrays: sorted by (symbol, day), one row per pair, back-adjusted."""
+    raw = bhav['raw']
+    order = np.lexsort((raw['day'], raw['sid']))
+    sid, day = raw['sid'][order], raw['day'][order]
+    # Same session read twice (a .csv and its .zip) — the later file wins
+    keep  = np.r_[(sid[1:] != sid[:-1]) | (day[1:] != day[:-1]), True]
+    order, sid, day = order[keep], sid[keep], day[keep]
+    o, h, l, c, pc, v = (raw[k][order].astype(np.float64) for k in BHAV_FIELDS)
+
+    # On an ex-date the exchange quotes PREVCLOSE already adjusted, so
+    # PREVCLOSE / yesterday's close is the split / bonus factor. Only when the
+    # row before really is the previous session in the store: across a gap
+    # (the symbol missing from a file, suspended, re-listed) PREVCLOSE is a
+    # close we don't have, and a plain price move would read as an action.
+    starts = np.flatnonzero(np.r_[True, sid[1:] != sid[:-1]])
+    days   = np.unique(day)                       # sessions in the store, sorted
+    prev   = np.r_[-1, days[:-1]][np.searchsorted(days, day)]
+    same   = np.r_[False, (sid[1:] == sid[:-1]) & (day[:-1] == prev[1:])]
+    last_c = np.r_[np.nan, c[:-1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(same & (last_c > 0) & (pc > 0), pc / last_c, 1.0)
+    acts = np.flatnonzero(np.abs(ratio - 1) > BHAV_ADJ_MIN)
+    adj  = np.ones(len(sid))
+    for k in acts:
+        adj[starts[np.searchsorted(starts, k, 'right') - 1]:k] *= ratio[k]
+    bars  = {'day': day, 'o': o * adj, 'h': h * adj, 'l': l * adj, 'c': c * adj, 'v': v / adj}
+    ends  = np.r_[starts[1:], len(sid)]
+    index = {bhav['syms'][sid[a]]: (int(a), int(b)) for a, b in zip(starts.tolist(), ends.tolist())}
+    with bhav_lock:
+        bhav.update(bars=bars, index=index, actions=len(acts),
+                    first=int(day.min()) if len(day) else None, last=int(day.max()) if len(day) else None)
+
+def bhav_load():
+    """Merge files in BHAV_DIR the store hasn't seen (parsed in parallel), save, rebuild.
+    Returns the number of new files."""
+    from concurrent.futures import ThreadPoolExecutor
+    with bhav_load_lock:
+        if not bhav['loaded']:
+            _bhav_read_store()
+        names = sorted(n for n in os.listdir(BHAV_DIR) if n.lower().endswith(('.csv', '.zip'))) \
+                if os.path.isdir(BHAV_DIR) else []
+        new   = [n for n in names if n not in bhav['files']]
+        if new:
+            t0 = time.time()
+
+            def parse(name):
+                try:
+                    return name, bhav_parse(os.path.join(BHAV_DIR, name))
+                except Exception as e:
+                    print(f"  ⚠ bhavcopy {name}: {e}")
+                    return name, None
+
+            with ThreadPoolExecutor(max_workers=BHAV_WORKERS) as ex:
+                parsed = [(n, p) for n, p in ex.map(parse, new) if p]
+            parts = {k: [] for k in ('sid', 'day') + BHAV_FIELDS}
+            if bhav['raw'] is not None:
+                for k in parts:
+                    parts[k].append(bhav['raw'][k])
+            for name, (day, syms, vals) in parsed:
+                sid_of = bhav['sid_of']
+                for sym in syms:
+                    if sym not in sid_of:
+                        sid_of[sym] = len(bhav['syms'])
+                        bhav['syms'].append(sym)
+                parts['sid'].append(np.fromiter((sid_of[sym] for sym in syms), np.int32, len(syms)))
+                parts['day'].append(np.full(len(syms), day, np.int32))
+                for k in BHAV_FIELDS:
+                    parts[k].append(vals[k])
+                bhav['files'].add(name)
+            if parsed:
+                bhav['raw'] = {k: np.concatenate(v) for k, v in parts.items()}
+                _bhav_save()
+            print(f"  📥 Bhavcopy: {len(parsed)}/{len(new)} new files merged in {time.time() - t0:.1f}s")
+        if bhav['raw'] is not None and (new or bhav['bars'] is None):
+            _bhav_build()
+            print(f"  📥 Bhavcopy: {len(bhav['index'])} symbols, {len(bhav['files'])} sessions, "
+                  f"{bhav['actions']} split/bonus adjustments")
+        return len(new)
+
+def bhav_series(symbol, period='1y'):
+    """Adjusted daily bars shaped like provider.history(), or None when the store
+    doesn't hold the symbol or doesn't reach back `period`."""
+    if not bhav['loaded']:
+        bhav_load()
+    with bhav_lock:
+        span, bars = bhav['index'].get(symbol), bhav['bars']
+        first, last = bhav['first'], bhav['last']
+    if span is None:
+        return None
+    cutoff = last - PERIOD_DAYS.get(period, 366)
+    if first > cutoff + 7:   # store starts after the period does — not enough history
+        return None
+    a, b = span
+    a   += int(np.searchsorted(bars['day'][a:b], cutoff, 'right'))
+    idx  = pd.DatetimeIndex(bars['day'][a:b].astype('datetime64[D]'), name='Date')
+    return pd.DataFrame({'Open': bars['o'][a:b], 'High': bars['h'][a:b], 'Low': bars['l'][a:b],
+                         'Close': bars['c'][a:b], 'Volume': bars['v'][a:b]}, index=idx)
+
+def _bhav_url(day):
+    for first, tpl in BHAV_URLS:
+        if day >= datetime.date.fromisoformat(first):
+            return tpl.format(d=day, MON=day.strftime('%b').upper())
+    return None
+
+def bhav_fetch(day):
+    """Download one session's file into BHAV_DIR unless it's there (or known missing).
+    Returns True when a new file landed."""
+    url = _bhav_url(day)
+    if not url:
+        return False
+    path = os.path.join(BHAV_DIR, url.rsplit('/', 1)[-1])
+    if os.path.exists(path) or os.path.exists(path + '.404'):
+        return False
+    os.makedirs(BHAV_DIR, exist_ok=True)
+    r = requests.get(url, headers=LiveProvider.NSE_HEADERS, timeout=30)
+    if r.status_code == 404:
+        if day < trading_day():   # a holiday — don't ask again (today's file may just be late)
+            open(path + '.404', 'w').close()
+        return False
+    if r.status_code != 200:
+        raise ProviderError(r.status_code, url)
+    tmp = path + f'.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(r.content)
+    os.replace(tmp, path)
+    return True
+
+def bhav_backfill(start, end=None):
+    """Fetch every weekday's file from start to end (default: last session) in parallel, then merge."""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    end  = end or trading_day()
+    days = [start + datetime.timedelta(days=n) for n in range((end - start).days + 1)]
+    days = [d for d in days if d.weekday() < 5]
+    print(f"  📥 Bhavcopy backfill {start} → {end}: {len(days)} weekdays, {BHAV_WORKERS} workers")
+    got = failed = 0
+    with ThreadPoolExecutor(max_workers=BHAV_WORKERS) as ex:
+        futs = {ex.submit(bhav_fetch, d): d for d in days}
+        for i, fut in enumerate(as_completed(futs), 1):
+            try:
+                got += fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"  ⚠ bhavcopy {futs[fut]}: {e}")
+            if i % 100 == 0:
+                print(f"    ↻ bhavcopy: {i}/{len(days)} checked, {got} downloaded")
+    print(f"  📥 Backfill: {got} downloaded, {failed} failed")
+    return bhav_load()
+
+class BhavcopyProvider:
+    """history() from the bhavcopy store when it covers the period and is current (its
+    last file is the latest session's); everything else — symbols or periods it doesn't
+    cover, or every history before the session's file is published — goes to `base`."""
+    name = 'bhav'
+
+    def __init__(self, base):
+        self.base   = base
+        self.served = 0   # history() calls answered from the store
+
+    def __getattr__(self, attr):
+        return getattr(self.base, attr)
+
+    def history(self, symbol, period):
+        if symbol.endswith('.NS'):
+            df = bhav_series(symbol[:-3], period)
+            if df is not None and bhav['last'] >= (trading_day() - datetime.date(1970, 1, 1)).days:
+                self.served += 1
+                return df
+        return self.base.history(symbol, period)
+
+    def refresh(self):
+        """EOD: pick up the session's file (fetched if BHAV_FETCH) and merge anything new."""
+        if BHAV_FETCH:
+            try:
+                bhav_fetch(trading_day())
+            except Exception as e:
+                print(f"  ⚠ Bhavcopy fetch failed: {e}")
+        return bhav_load()
+
+# ════════════════════════════════════════════════════════════════════
+# PRICE MATRIX — one shared, memory-mapped copy of daily bars
+# A (tickers × trading days) float32 .npy per field in PRICES_DIR, with the
+# ticker and day index in index.json. Every history the server fetches is
+# written into its row in place; new sessions take the next column, so EOD
+# is an append. A session's column is only written once it has closed — a
+# scan during market hours records up to the previous session, so readers
+# never see a partial intraday bar as the day's close. Readers —
+# REFRESH_EOD.py, backtest / shard workers, other tools — map the files
+# read-only: opening 5 years × 5,000 tickers takes
+# milliseconds and pages stay shared in the OS cache instead of each
+# process holding its own pandas copies.
+#   --provider matrix[+base]   history() from the matrix when it's current
+# One writer at a time: the server, or REFRESH_EOD.py when no server is
+# running (it checks the port first). A regrow (more tickers / days than the
+# files hold) writes a new generation of files, so readers with the old
+# ones mapped — which Windows won't let anyone replace — carry on.
+# ════════════════════════════════════════════════════════════════════
+PRICES_DIR          = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prices')
+PRICE_FIELDS        = ('Open', 'High', 'Low', 'Close', 'Volume')   # Open for backtest entries
+PRICES_GROW_TICKERS = 500    # spare rows added on a regrow
+PRICES_GROW_DAYS    = 260    # spare sessions added on a regrow (~1 year of appends)
+PRICES_ADJ_MIN      = 0.005  # fetched vs stored close off by more than this = upstream re-adjustment
+
+class PriceMatrix:
+    """Rows of the shared matrix. PriceMatrix() maps read-only; reload() picks up the
+    writer's last publish. write=True is for the server's prices_record() only."""
+
+    def __init__(self, root=None, write=False):
+        self.root, self.write = root or PRICES_DIR, write
+        self.gen, self.mtime  = 0, None
+        self.tickers, self.row_of = [], {}
+        self.days = np.zeros(0, np.int32)
+        self.cols = {}
+        self.reload()
+
+    def _file(self, field, gen):
+        return os.path.join(self.root, f'{field.lower()}.{gen}.npy')
+
+    def reload(self):
+        """Re-read index.json if it changed since the last look. Returns True if it did."""
+        path = os.path.join(self.root, 'index.json')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self.mtime:
+            return False
+        with open(path, encoding='utf-8') as f:
+            idx = json.load(f)
+        if idx['gen'] != self.gen or not self.cols:
+            self.cols = {k: np.load(self._file(k, idx['gen']), mmap_mode='r+' if self.write else 'r')
+                         for k in PRICE_FIELDS}
+        self.gen, self.mtime = idx['gen'], mtime
+        self.tickers = idx['tickers']
+        self.row_of  = {t: i for i, t in enumerate(self.tickers)}
+        self.days    = np.asarray(idx['days'], np.int32)
+        return True
+
+    @property
+    def last(self):
+        return int(self.days[-1]) if len(self.days) else None
+
+    def frame(self, ticker, period='1y'):
+        """Daily bars shaped like provider.history() (sessions with no close left out),
+        or None if the ticker isn't here or the matrix doesn't reach back `period`
+        (period=None: every session it has)."""
+        i = self.row_of.get(ticker)
+        if i is None or not len(self.days):
+            return None
+        a, b = 0, len(self.days)
+        if period is not None:
+            cutoff = self.last - PERIOD_DAYS.get(period, 366)
+            if self.days[0] > cutoff + 7:
+                return None
+            a = int(np.searchsorted(self.days, cutoff, 'right'))
+        close = self.cols['Close'][i, a:b]
+        ok    = np.isfinite(close)
+        idx   = pd.DatetimeIndex(self.days[a:b][ok].astype('datetime64[D]'), name='Date')
+        df    = pd.DataFrame({k: self.cols[k][i, a:b][ok].astype(np.float64) for k in PRICE_FIELDS}, index=idx)
+        df.attrs['source'] = 'matrix'
+        return df
+
+prices       = None              # the server's writable PriceMatrix, opened on first record
+prices_lock  = threading.Lock()
+prices_dirty = False             # rows written since the last publish
+prices_error = None              # last failed write, reported at publish
+
+def _prices_alloc(m, gen, n_rows, days):
+    """New generation of files sized for n_rows tickers and `days`, old rows copied over
+    at their new day positions."""
+    cap_t = max(n_rows + PRICES_GROW_TICKERS, n_rows * 3 // 2)
+    cap_d = len(days) + PRICES_GROW_DAYS
+    os.makedirs(m.root, exist_ok=True)
+    pos   = np.searchsorted(days, m.days)
+    cols  = {}
+    for k in PRICE_FIELDS:
+        a = np.lib.format.open_memmap(m._file(k, gen), mode='w+', dtype=np.float32, shape=(cap_t, cap_d))
+        a[:] = np.nan
+        if len(m.tickers) and len(m.days):
+            a[:len(m.tickers), pos] = m.cols[k][:len(m.tickers), :len(m.days)]
+        a.flush()
+        cols[k] = a
+    old, m.cols, m.gen, m.days = m.gen, cols, gen, np.asarray(days, np.int32)
+    _prices_publish(m)
+    for k in PRICE_FIELDS:   # readers may still map these; they go when the last one lets go
+        try:
+            os.remove(m._file(k, old))
+        except OSError:
+            pass
+
+def _prices_publish(m):
+    for a in m.cols.values():
+        a.flush()
+    path = os.path.join(m.root, 'index.json')
+    tmp  = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'gen': m.gen, 'tickers': m.tickers, 'days': m.days.tolist(),
+                   'updated': get_ist().isoformat()}, f)
+    os.replace(tmp, path)
+    m.mtime = os.stat(path).st_mtime_ns
+
+def prices_record(ticker, hist):
+    """Write a fetched history into the ticker's row, in place. Sessions past the last
+    column are appended; if the overlap disagrees with what's stored (a split, or
+    Yahoo re-adjusting dividends) the older stored bars are rescaled to match. While the
+    market is open today's bar is still forming, so it's left out — the EOD refresh
+    records it once the session has closed."""
+    global prices_error
+    if hist is None or not len(hist) or hist.attrs.get('source') == 'matrix':
+        return
+    try:
+        days = _day_numbers(hist.index)
+        vals = {k: hist[k].to_numpy(np.float32) for k in PRICE_FIELDS}
+        if get_market_mode() == 'open':
+            keep = days < (trading_day() - datetime.date(1970, 1, 1)).days
+            days, vals = days[keep], {k: v[keep] for k, v in vals.items()}
+        if len(days):
+            _prices_record(ticker, days, vals)
+    except Exception as e:   # never costs the scan a stock — reported at publish
+        prices_error = f'{ticker}: {e}'
+
+def _prices_record(ticker, days, vals):
+    global prices, prices_dirty
+    with prices_lock:
+        if prices is None:
+            prices = PriceMatrix(write=True)
+        m = prices
+        cap_t, cap_d = m.cols['Close'].shape if m.cols else (0, 0)
+        new = np.setdiff1d(days, m.days)
+        if len(new) and (not m.cols or new[0] < (m.last or 0) or len(m.days) + len(new) > cap_d
+                         or (ticker not in m.row_of and len(m.tickers) >= cap_t)):
+            _prices_alloc(m, m.gen + 1, len(m.tickers) + 1, np.union1d(m.days, days))
+        elif len(new):
+            m.days = np.concatenate([m.days, new]).astype(np.int32)   # appended columns
+        elif ticker not in m.row_of and len(m.tickers) >= cap_t:
+            _prices_alloc(m, m.gen + 1, len(m.tickers) + 1, m.days)
+        i = m.row_of.get(ticker)
+        if i is None:
+            i = m.row_of[ticker] = len(m.tickers)
+            m.tickers.append(ticker)
+        pos  = np.searchsorted(m.days, days)
+        row  = m.cols['Close'][i]
+        seen = np.flatnonzero(np.isfinite(row[pos]) & (vals['Close'] > 0))
+        if len(seen):
+            j = seen[0]
+            f = vals['Close'][j] / row[pos[j]]
+            if abs(f - 1) > PRICES_ADJ_MIN:
+                for k in PRICE_FIELDS:
+                    m.cols[k][i, :pos[j]] *= (1 / f if k == 'Volume' else f)
+        for k in PRICE_FIELDS:
+            m.cols[k][i, pos] = vals[k]
+        prices_dirty = True
+
+def prices_publish():
+    """Make the rows written since the last publish visible to readers (after a scan / EOD)."""
+    global prices_dirty, prices_error
+    if prices_error:
+        print(f"  ⚠ Price matrix write failed — {prices_error}")
+        prices_error = None
+    with prices_lock:
+        if prices is None or not prices_dirty:
+            return
+        _prices_publish(prices)
+        prices_dirty = False
+    print(f"  🧮 Price matrix: {len(prices.tickers)} tickers × {len(prices.days)} sessions published")
+
+def prices_frame(ticker, period=None):
+    """The server's own view of a row, including writes not yet published."""
+    with prices_lock:
+        return prices.frame(ticker, period) if prices is not None else None
+
+class MatrixProvider:
+    """history() from the shared price matrix when it holds the ticker and is current
+    (its last session is the latest one); everything else goes to `base`."""
+    name = 'matrix'
+
+    def __init__(self, base, root=None):
+        self.base   = base
+        self.matrix = PriceMatrix(root)
+        self.served = 0
+
+    def __getattr__(self, attr):
+        return getattr(self.base, attr)
+
+    def history(self, symbol, period):
+        m = self.matrix
+        m.reload()
+        if symbol.endswith('.NS') and m.last is not None and \
+           m.last >= (trading_day() - datetime.date(1970, 1, 1)).days:
+            df = m.frame(symbol[:-3], period)
+            if df is not None:
+                self.served += 1
+                return df
+        return self.base.history(symbol, period)
+
+# ════════════════════════════════════════════════════════════════════
+# CHART PATTERNS — the whole universe at once, from the price matrix
+# After each publish (scan / EOD) the last PATTERN_BARS sessions of every
+# stock's row are cut out of the matrix as (stocks × sessions) arrays, and
+# each pattern is a handful of array ops over all stocks together — there
+# is no per-ticker loop. Every detector runs twice: on the window ending
+# today (the pattern formed today → 'setup', trigger = its pivot) and on
+# the window ending yesterday (today closed above that pivot on volume →
+# 'breakout'). Like vpbDetail, this sits beside the stage, not in score().
+# ════════════════════════════════════════════════════════════════════
+PATTERN_BARS     = 130             # sessions per stock (a cup-and-handle base takes ~6 months)
+PATTERN_ORDER    = ('cup_handle', 'flag', 'pennant', 'tight_closes', 'nr7', 'inside_bar')  # first hit = `pattern`
+PATTERN_VOL_MULT = 1.5             # breakout volume vs the 20-session average
+TIGHT_BARS       = 5               # tight closes: last 5 closes within TIGHT_PCT,
+TIGHT_PCT        = 1.5             #   above the 50-session average close
+FLAG_POLE_BARS   = 10              # flag / pennant: a +FLAG_POLE_PCT pole within 10 sessions,
+FLAG_POLE_PCT    = 15.0            #   then 3–10 sessions holding its upper half
+FLAG_BARS        = range(3, 11)    #   (pennant: highs falling and lows rising)
+CUP_DEPTH        = (12.0, 35.0)    # cup: % from the left rim down to the bottom
+CUP_MIN_BARS     = 30              # sessions from the left rim to the right rim
+HANDLE_BARS      = (3, 20)         # handle length, holding the cup's upper half
+
+def pattern_masks(H, L, C):
+    """{pattern: (hit, pivot)} for (stocks × sessions) highs / lows / closes — the last
+    column is the session being judged. Leading NaNs (short histories) never hit."""
+    n, W = C.shape
+    have = np.isfinite(C).sum(1)
+    out  = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Inside bar: today's range inside yesterday's
+        out['inside_bar'] = ((H[:, -1] < H[:, -2]) & (L[:, -1] > L[:, -2]), H[:, -2])
+
+        # NR7: narrowest range of the last 7 sessions
+        R = H[:, -7:] - L[:, -7:]
+        out['nr7'] = ((R[:, -1] < R[:, :-1].min(1)) & (have >= 7), H[:, -1])
+
+        # Tight closes above the 50-session average
+        c = C[:, -TIGHT_BARS:]
+        out['tight_closes'] = (((c.max(1) - c.min(1)) / c.min(1) * 100 <= TIGHT_PCT) &
+                               (C[:, -1] > C[:, -50:].mean(1)) & (have >= 50), H[:, -TIGHT_BARS:].max(1))
+
+        # Flag / pennant: shortest flag length that fits wins
+        flag, pennant, fpiv = np.zeros(n, bool), np.zeros(n, bool), np.full(n, np.nan)
+        for k in FLAG_BARS:
+            pole  = slice(-k - FLAG_POLE_BARS, -k)
+            top   = H[:, pole].max(1)
+            base  = np.fmin(C[:, -k - FLAG_POLE_BARS - 1], L[:, pole].min(1))
+            fh, fl = H[:, -k:].max(1), L[:, -k:].min(1)
+            ok = ((top / base - 1) * 100 >= FLAG_POLE_PCT) & (H[:, -k - 1] >= top * 0.97) & \
+                 (fh <= top * 1.01) & (fl >= top - (top - base) / 2) & (have >= k + FLAG_POLE_BARS + 1)
+            h = k // 2
+            contracting = (k >= 4) & (H[:, -h:].max(1) < H[:, -k:-h].max(1)) & (L[:, -h:].min(1) > L[:, -k:-h].min(1))
+            new = ok & ~flag & ~pennant
+            pennant |= new & contracting
+            flag    |= new & ~contracting
+            fpiv = np.where(new, fh, fpiv)
+        out['flag'], out['pennant'] = (flag, fpiv), (pennant, fpiv)
+
+        # Cup and handle: left rim (first half) → bottom → right rim → handle
+        rows = np.arange(n)
+        idx  = np.arange(W)
+        Hf   = np.where(np.isfinite(H), H, -np.inf)
+        Lf   = np.where(np.isfinite(L), L, np.inf)
+        a    = Hf[:, :W // 2].argmax(1)
+        b    = np.where(idx > a[:, None], Lf, np.inf).argmin(1)
+        r    = np.where(idx > b[:, None], Hf, -np.inf).argmax(1)
+        left, bottom, right = H[rows, a], L[rows, b], H[rows, r]
+        depth  = (1 - bottom / left) * 100
+        handle = W - 1 - r
+        hl     = np.where(idx > r[:, None], Lf, np.inf).min(1)
+        out['cup_handle'] = ((depth >= CUP_DEPTH[0]) & (depth <= CUP_DEPTH[1]) &
+                             (right >= left * 0.95) & (right <= left * 1.05) &
+                             (r - a >= CUP_MIN_BARS) & (b - a >= CUP_MIN_BARS // 3) & (r - b >= CUP_MIN_BARS // 3) &
+                             (handle >= HANDLE_BARS[0]) & (handle <= HANDLE_BARS[1]) &
+                             (hl >= right - (right - bottom) / 2) & (have == W), right)
+    return out
+
+def detect_patterns(stocks):
+    """Set pattern / patternStage / patternPivot / patterns on every stock in place.
+    patternStage: breakout (closed above yesterday's pivot on volume) | setup (formed
+    today, pivot = trigger) | none. Stocks without a bar on the matrix's last session
+    (not in it, or not refreshed today) get none."""
+    t0 = time.perf_counter()
+    with prices_lock:
+        m = prices
+        if m is None or len(m.days) < 2 or not stocks:
+            return 0
+        rows = np.array([m.row_of.get(s['ticker'], -1) for s in stocks])
+        D    = len(m.days)
+        a    = max(0, D - PATTERN_BARS - 1)
+        cut  = {k: m.cols[k][:, a:D][np.maximum(rows, 0)].astype(np.float64)
+                for k in ('High', 'Low', 'Close', 'Volume')}
+    C = cut['Close']
+    C[rows < 0] = np.nan
+    W = C.shape[1]
+    # Days a stock didn't trade are forward-filled (leading NaNs stay)
+    fill = np.where(np.isfinite(C), np.arange(W), 0)
+    np.maximum.accumulate(fill, axis=1, out=fill)
+    pick = (np.arange(len(C))[:, None], fill)
+    live = np.isfinite(C[:, -1]) & np.isfinite(C[:, -2])
+    C    = C[pick]
+    H    = np.fmax(cut['High'][pick], C)
+    L    = np.fmin(cut['Low'][pick], C)
+    V    = np.nan_to_num(cut['Volume'])
+
+    today = pattern_masks(H[:, 1:], L[:, 1:], C[:, 1:])
+    yday  = pattern_masks(H[:, :-1], L[:, :-1], C[:, :-1])
+    with np.errstate(invalid='ignore'):
+        vol_ok = V[:, -1] >= PATTERN_VOL_MULT * V[:, -21:-1].mean(1)
+        brk = np.array([yday[p][0] & (C[:, -1] > yday[p][1]) & vol_ok & live for p in PATTERN_ORDER])
+    setup = np.array([today[p][0] & live for p in PATTERN_ORDER])
+    first_brk, first_set = brk.argmax(0), setup.argmax(0)
+    cols  = np.arange(len(C))
+    pivot = np.where(brk.any(0), np.array([yday[p][1] for p in PATTERN_ORDER])[first_brk, cols],
+                     np.array([today[p][1] for p in PATTERN_ORDER])[first_set, cols])
+    pivot = [None if x != x else x for x in np.round(pivot, 2).tolist()]
+    hits  = (brk | setup).T.tolist()
+    n_brk, n_set = brk.any(0), setup.any(0)
+    observe('stage', 'patterns', time.perf_counter() - t0)
+
+    for i, s in enumerate(stocks):
+        if n_brk[i]:
+            s['pattern'], s['patternStage'], s['patternPivot'] = PATTERN_ORDER[first_brk[i]], 'breakout', pivot[i]
+        elif n_set[i]:
+            s['pattern'], s['patternStage'], s['patternPivot'] = PATTERN_ORDER[first_set[i]], 'setup', pivot[i]
+        else:
+            s['pattern'], s['patternStage'], s['patternPivot'] = 'none', 'none', None
+        s['patterns'] = [p for p, hit in zip(PATTERN_ORDER, hits[i]) if hit]
+    print(f"  🔎 Patterns: {int(n_brk.sum())} breakouts, {int((n_set & ~n_brk).sum())} setups "
+          f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return int((n_brk | n_set).sum())
+
+# ════════════════════════════════════════════════════════════════════
+# CORRELATION — diversified plan picks
+# On breakout days the top scores are often one sector moving as a block.
+# At each publish the top CORR_CANDIDATES stocks' last CORR_DAYS daily log
+# returns come out of the price matrix, minus that day's universe-average
+# return so the shared market move doesn't tie everything together. The
+# book keeps that window plus its sums Σr and Σr·rᵀ: a new session is a
+# rank-1 add / drop, a stock entering the top set costs one row, and only
+# a scan, a gap in sessions or every CORR_DAYS shifts (float drift) rebuild
+# it. /api/plan/diversified clusters the plan's candidates on it and caps
+# picks per cluster.
+# ════════════════════════════════════════════════════════════════════
+CORR_DAYS        = 60      # returns window (sessions)
+CORR_CANDIDATES  = 500     # top stocks by plan_score() kept in the book
+CORR_CLUSTER     = 0.5     # correlation at which a stock joins a higher-scored stock's cluster
+PLAN_PICKS       = 10      # /api/plan/diversified defaults
+PLAN_PER_CLUSTER = 2
+PLAN_MIN_SCORE   = 43      # the Plan tab's Strong Entry cut (plan_score(), max 73)
+
+corr_book = {'days': None, 'tickers': [], 'row_of': {}, 'R': None, 'S': None, 'P': None, 'shifts': 0}
+corr_lock = threading.Lock()
+
+def _corr_returns(closes):
+    """(rows × sessions+1) closes → (rows × sessions) log returns; gaps and missing
+    history count as 0, single-day moves are capped at ±20% (bad ticks)."""
+    fill = np.where(np.isfinite(closes), np.arange(closes.shape[1]), 0)
+    np.maximum.accumulate(fill, axis=1, out=fill)
+    closes = closes[np.arange(len(closes))[:, None], fill]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.diff(np.log(closes), axis=1)
+    r[~np.isfinite(r)] = 0.0
+    return np.clip(r, -0.2, 0.2, out=r)
+
+def corr_update(stocks, rebuild=False):
+    """Bring the book to the matrix's last session for today's top CORR_CANDIDATES.
+    Returns the number of stocks in it (0 if the matrix is too short)."""
+    t0  = time.perf_counter()
+    top = sorted(stocks, key=lambda s: -plan_score(s))
+    with prices_lock:
+        m = prices or PriceMatrix()   # restarted from cache.json: what the last run published
+        D = len(m.days)
+        if D < CORR_DAYS + 1:
+            return 0
+        want   = [s['ticker'] for s in top if s['ticker'] in m.row_of][:CORR_CANDIDATES]
+        rows   = np.array([m.row_of[t] for t in want], dtype=np.int64)
+        closes = m.cols['Close'][:len(m.tickers), D - CORR_DAYS - 1:D].astype(np.float64)
+        days   = m.days[D - CORR_DAYS:D].copy()
+    r_all = _corr_returns(closes)
+    R     = r_all[rows] - r_all.mean(0)                      # residual vs the universe average
+    n     = len(want)
+
+    with corr_lock:
+        bk   = corr_book
+        old  = bk['days']
+        k    = CORR_DAYS - int(np.searchsorted(days, old[-1], 'right')) if old is not None and old[-1] in days else None
+        full = rebuild or k is None or bk['shifts'] + k >= CORR_DAYS or \
+               (k and not np.array_equal(old[k:], days[:CORR_DAYS - k]))
+        if full:
+            S, P, shifts = R.sum(1), R @ R.T, 0
+        else:
+            keep = np.array([bk['row_of'].get(t, -1) for t in want])
+            kept = np.flatnonzero(keep >= 0)
+            S, P = np.zeros(n), np.zeros((n, n))
+            ko   = keep[kept]
+            # Stocks already in the book keep their stored returns; only the sessions
+            # that slid in / out of the window change their sums
+            R[kept, :CORR_DAYS - k] = bk['R'][ko, k:]
+            Rk_new, Rk_old = R[kept, CORR_DAYS - k:], bk['R'][ko, :k]
+            S[kept] = bk['S'][ko] + Rk_new.sum(1) - Rk_old.sum(1)
+            P[np.ix_(kept, kept)] = bk['P'][np.ix_(ko, ko)] + Rk_new @ Rk_new.T - Rk_old @ Rk_old.T
+            # Stocks new to the top set: one row each against the whole window
+            added = np.flatnonzero(keep < 0)
+            if len(added):
+                S[added] = R[added].sum(1)
+                P[added] = R[added] @ R.T
+                P[:, added] = P[added].T
+            shifts = bk['shifts'] + k
+        bk.update(days=days, tickers=want, row_of={t: i for i, t in enumerate(want)},
+                  R=R, S=S, P=P, shifts=shifts)
+    observe('stage', 'correlation', time.perf_counter() - t0)
+    print(f"  🔗 Correlation book: {n} stocks × {CORR_DAYS} sessions "
+          f"({'rebuilt' if full else f'+{k} session(s)'}, {(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return n
+
+def corr_matrix(tickers):
+    """Residual-return correlations among `tickers` (NaN for stocks not in the book)."""
+    with corr_lock:
+        bk  = corr_book
+        idx = np.array([bk['row_of'].get(t, -1) for t in tickers], dtype=np.int64)
+        ok  = idx >= 0
+        S, P = bk['S'][idx[ok]], bk['P'][np.ix_(idx[ok], idx[ok])]
+    mean = S / CORR_DAYS
+    cov  = P / CORR_DAYS - np.outer(mean, mean)
+    sd   = np.sqrt(np.clip(np.diag(cov), 0, None))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        c = cov / np.outer(sd, sd)
+    c[~np.isfinite(c)] = 0.0
+    np.fill_diagonal(c, 1.0)
+    out = np.full((len(tickers), len(tickers)), np.nan)
+    out[np.ix_(ok, ok)] = c
+    return out
+
+def plan_diversified(picks=PLAN_PICKS, per_cluster=PLAN_PER_CLUSTER, min_score=PLAN_MIN_SCORE,
+                     threshold=CORR_CLUSTER, stocks=None):
+    """The plan's strong entries (plan_score() ≥ min_score, an active stage) in plan-score order,
+    clustered by leader: each unclustered stock starts a cluster and takes every unclustered
+    stock correlated ≥ threshold with it. Picks walk the same order, at most per_cluster each."""
+    t0 = time.perf_counter()
+    if stocks is None:
+        with state_lock:
+            stocks = state['stocks']
+    if corr_book['days'] is None and stocks:
+        corr_update(stocks)
+    if corr_book['days'] is None:
+        return {'ok': False, 'msg': f'Price matrix has under {CORR_DAYS + 1} sessions — run a scan first'}
+    ps    = {s['ticker']: plan_score(s) for s in stocks}
+    cands = sorted((s for s in stocks if plan_strong(s, ps[s['ticker']], min_score)),
+                   key=lambda s: -ps[s['ticker']])[:CORR_CANDIDATES]
+    n  = len(cands)
+    cm = corr_matrix([s['ticker'] for s in cands])
+    cluster = np.full(n, -1)
+    for i in range(n):
+        if cluster[i] < 0:
+            cluster[(cluster < 0) & (cm[i] >= threshold)] = i
+            cluster[i] = i
+    sizes  = np.bincount(cluster, minlength=n) if n else np.zeros(0, int)
+    taken, chosen, skipped = {}, [], []
+    for i in range(n):
+        c = int(cluster[i])
+        if taken.get(c, 0) < per_cluster:
+            if len(chosen) < picks:
+                taken[c] = taken.get(c, 0) + 1
+                chosen.append(i)
+        elif len(skipped) < picks:
+            skipped.append(i)
+    def row(i):
+        s = cands[i]
+        prior = [j for j in chosen if j < i]
+        rho = np.nanmax(cm[i, prior]) if prior and np.isfinite(cm[i, prior]).any() else None
+        return {'ticker': s['ticker'], 'sector': s.get('sector'), 'score': s['score'], 'planScore': ps[s['ticker']],
+                'stage': s.get('stage'),
+                'price': s.get('price'), 'cluster': cands[int(cluster[i])]['ticker'],
+                'clusterSize': int(sizes[cluster[i]]), 'maxCorr': None if rho is None else round(float(rho), 2)}
+    out = {
+        'ok':           True,
+        'last_updated': state['last_updated'],
+        'day':          str(np.datetime64(int(corr_book['days'][-1]), 'D')),
+        'candidates':   n,
+        'clusters':     int((sizes > 0).sum()),
+        'picks':        [row(i) for i in chosen],
+        'skipped':      [row(i) for i in skipped],   # capped out — 'cluster' names the stock they follow
+    }
+    observe('stage', 'plan_diversified', time.perf_counter() - t0)
+    return out
+
+# ════════════════════════════════════════════════════════════════════
+# TOMORROW'S PLAN — materialized at publish, frozen at EOD
+# The Plan tab's bands, stage pipeline and entry levels are built once
+# per publish (scan, EOD refresh, cache load), encoded once, and served
+# from /api/plan with an ETag — the browser no longer filters and sorts
+# the universe on every render. A plan built outside market hours is
+# frozen: it's written to plan.json and survives restarts, and while the
+# market is open on the session it was made for, publishes leave it alone.
+# The next EOD refresh builds tomorrow's. /api/ctrl/run_plan rebuilds it
+# regardless.
+# ════════════════════════════════════════════════════════════════════
+PLAN_FILE         = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plan.json')
+PLAN_WATCH_SCORE  = 28       # watch band: PLAN_WATCH_SCORE ≤ plan score < PLAN_MIN_SCORE
+PLAN_PIPE_TOP     = 3        # stocks shown under each pipeline stage
+PLAN_PARTIAL_PCT  = 15.0     # plan rules (same as backtest.py): half off here,
+PLAN_TARGET_PCT   = 27.5     #   the rest here,
+PLAN_STOP_PCT     = 9.0      #   hard stop below entry
+PLAN_SEGMENTS     = {'all': lambda m: True, 'micro': lambda m: m < 100,
+                     'mid': lambda m: 100 <= m <= 10000, 'large': lambda m: m > 10000}   # the UI's MCap bar
+PLAN_STAGES       = ('coiling', 'breakout', 'pre_cross', 'post_cross', 'pullback', 'trending')
+
+plan_state = {'plan': None, 'body': None, 'etag': None}
+plan_lock  = threading.Lock()
+
+def plan_score(s):
+    """The Plan tab's score: fundamentals + RSI / ADX points + the stage's signal (max 73)."""
+    r, a = s.get('rsi') or 0, s.get('adx') or 0
+    t  = 12 if 45 <= r <= 58 else 7 if 58 < r <= 65 else 4 if 40 <= r < 45 else 2 if 65 < r <= 72 else 0
+    t += 10 if 20 <= a <= 35 else 5 if 15 <= a < 20 else 4 if a > 35 else 0
+    vs, cs, stage = s.get('vpbScore') or 0, s.get('crossScore') or 0, s.get('stage')
+    if stage == 'trending':          sig = 0
+    elif s.get('emaPreCross') and vs > 0:
+        sig = 18 if vs >= 10 else 14 if vs >= 7 else 12
+    elif cs > 0:                     sig = cs + (3 if stage == 'pullback' else 0)
+    else:                            sig = max(vs, 0)
+    return (s.get('fScore') or 0) + t + sig
+
+def plan_strong(s, ps, min_score=PLAN_MIN_SCORE):
+    return ps >= min_score and s.get('stage') not in ('trending', 'none')
+
+def plan_build(stocks):
+    """The plan dict for `stocks` (see the section comment)."""
+    ps    = {s['ticker']: plan_score(s) for s in stocks}
+    order = sorted(stocks, key=lambda s: -ps[s['ticker']])
+    segments = {}
+    for seg, in_seg in PLAN_SEGMENTS.items():
+        rows = [s for s in order if in_seg(s.get('mcap') or 0)]
+        segments[seg] = {
+            'strong': [s['ticker'] for s in rows if plan_strong(s, ps[s['ticker']])],
+            'watch':  [s['ticker'] for s in rows if PLAN_WATCH_SCORE <= ps[s['ticker']] < PLAN_MIN_SCORE],
+            'range':  [s['ticker'] for s in rows],
+            'stages': {st: {'count': 0, 'top': []} for st in PLAN_STAGES},
+        }
+        for s in rows:   # already in plan-score order
+            st = segments[seg]['stages'].get(s.get('stage'))
+            if st is not None:
+                st['count'] += 1
+                if len(st['top']) < PLAN_PIPE_TOP:
+                    st['top'].append(s['ticker'])
+    levels = {}
+    for s in order:
+        if plan_strong(s, ps[s['ticker']]) and s.get('price'):
+            p = s['price']
+            levels[s['ticker']] = {'entry': p, 'partial': round(p * (1 + PLAN_PARTIAL_PCT / 100), 2),
+                                   'target': round(p * (1 + PLAN_TARGET_PCT / 100), 2),
+                                   'stop': round(p * (1 - PLAN_STOP_PCT / 100), 2), 'mmTarget': s.get('mmTarget')}
+    div = plan_diversified(stocks=stocks)
+    return {
+        'ok':        True,
+        'built':     get_ist().isoformat(timespec='seconds'),
+        'session':   trading_day().isoformat(),
+        'frozen':    get_market_mode() != 'open',
+        'rules':     {'partial_pct': PLAN_PARTIAL_PCT, 'target_pct': PLAN_TARGET_PCT, 'stop_pct': PLAN_STOP_PCT,
+                      'min_score': PLAN_MIN_SCORE, 'watch_score': PLAN_WATCH_SCORE},
+        'planScore': ps,
+        'segments':  segments,
+        'levels':    levels,
+        'picks':     div['picks'] if div.get('ok') else [],
+        'skipped':   div['skipped'] if div.get('ok') else [],
+    }
+
+def _plan_store(p):
+    body = json.dumps(p, ensure_ascii=False).replace('Infinity', 'null').replace('NaN', 'null').encode('utf-8')
+    plan_state.update(plan=p, body=body, etag='"' + hashlib.sha1(body).hexdigest()[:16] + '"')
+
+def _plan_locked():
+    """A frozen plan made for today's session while the market is open."""
+    p = plan_state['plan']
+    if not p or not p['frozen'] or get_market_mode() != 'open':
+        return False
+    prev = trading_day(get_ist().replace(hour=9, minute=0))   # the session before today's
+    return p['session'] == prev.isoformat()
+
+def plan_publish(stocks, force=False):
+    """Rebuild the plan from `stocks` unless today's frozen plan is locked. Returns True if rebuilt."""
+    t0 = time.perf_counter()
+    with plan_lock:
+        if plan_state['plan'] is None and os.path.exists(PLAN_FILE):
+            try:
+                with open(PLAN_FILE, encoding='utf-8') as f:
+                    _plan_store(json.load(f))
+            except Exception as e:
+                print(f"  ⚠ plan.json unreadable: {e}")
+        if not force and _plan_locked():
+            print(f"  🔒 Plan locked — made at {plan_state['plan']['built']} for today's session")
+            return False
+    p = plan_build(stocks)
+    with plan_lock:
+        _plan_store(p)
+        if p['frozen']:
+            try:
+                tmp = PLAN_FILE + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(plan_state['body'])
+                os.replace(tmp, PLAN_FILE)
+            except Exception as e:
+                print(f"  ⚠ plan.json save failed: {e}")
+    observe('stage', 'plan_build', time.perf_counter() - t0)
+    print(f"  📋 Plan {'frozen' if p['frozen'] else 'built (provisional — market open)'}: "
+          f"{len(p['segments']['all']['strong'])} strong, {len(p['segments']['all']['watch'])} watch "
+          f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return True
+
+# ════════════════════════════════════════════════════════════════════
+# CHARTS — on demand from the price matrix, downsampled
+# The detail modal's price chart used to ride along in /api/stocks as 60
+# closes + 60 date strings per stock (about half the payload), for the one
+# stock being looked at. Now it's /api/chart/<ticker>?range=3m|1y|5y, cut
+# from the price matrix's row. Longer ranges are thinned to CHART_POINTS
+# with LTTB (largest-triangle-three-buckets: each bucket keeps the bar that
+# makes the biggest triangle with its neighbours, so peaks and gaps
+# survive). Encoded bodies are cached per (ticker, range) and dropped when
+# the matrix publishes a new session.
+# ════════════════════════════════════════════════════════════════════
+CHART_RANGES    = {'3m': '3mo', '1y': '1y', '5y': '5y'}   # ?range= → PERIOD_DAYS key
+CHART_POINTS    = 250     # points returned per chart at most (≈ 1 per 2–3 px in the modal)
+CHART_CACHE_MAX = 512     # cached (ticker, range) bodies
+
+chart_cache = OrderedDict()   # (ticker, range) -> (matrix stamp, body)
+chart_lock  = threading.Lock()
+chart_view  = None            # read-only matrix for a server restarted from cache.json
+
+def lttb(x, y, n):
+    """Indices of the n points LTTB keeps from (x, y) — first and last always included."""
+    N = len(y)
+    if n >= N or n < 3:
+        return np.arange(N)
+    every = (N - 2) / (n - 2)
+    b     = (np.arange(n - 1) * every).astype(np.int64) + 1   # bucket starts; b[-1] = N - 1
+    out   = np.empty(n, np.int64)
+    out[0], out[-1], a = 0, N - 1, 0
+    for i in range(n - 2):
+        lo, hi  = b[i], b[i + 1]
+        nxt     = slice(b[i + 1], b[i + 2] if i + 2 < n - 1 else N)   # next bucket (last: the last point)
+        cx, cy  = x[nxt].mean(), y[nxt].mean()
+        area    = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a       = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+def chart_body(ticker, rng):
+    """Encoded /api/chart reply for a ticker and range key, or None if the matrix doesn't have it."""
+    global chart_view
+    t0 = time.perf_counter()
+    with prices_lock:
+        m = prices
+        if m is None:
+            if chart_view is None:
+                chart_view = PriceMatrix()
+            chart_view.reload()
+            m = chart_view
+        stamp = (m.gen, m.mtime, len(m.days))
+        with chart_lock:
+            hit = chart_cache.get((ticker, rng))
+            if hit and hit[0] == stamp:
+                chart_cache.move_to_end((ticker, rng))
+                return hit[1]
+        i = m.row_of.get(ticker)
+        if i is None or not len(m.days):
+            return None
+        a     = int(np.searchsorted(m.days, m.last - PERIOD_DAYS[CHART_RANGES[rng]], 'right'))
+        close = m.cols['Close'][i, a:len(m.days)].astype(np.float64)
+        days  = m.days[a:]
+    ok          = np.isfinite(close)
+    close, days = close[ok], days[ok]
+    if not len(close):
+        return None
+    keep = lttb(days.astype(np.float64), close, CHART_POINTS)
+    body = json.dumps({
+        'ticker':   ticker,
+        'range':    rng,
+        'sessions': len(close),
+        'dates':    [str(d) for d in days[keep].astype('datetime64[D]')],
+        'prices':   np.round(close[keep], 2).tolist(),
+    }).encode('utf-8')
+    with chart_lock:
+        chart_cache[(ticker, rng)] = (stamp, body)
+        chart_cache.move_to_end((ticker, rng))
+        while len(chart_cache) > CHART_CACHE_MAX:
+            chart_cache.popitem(last=False)
+    observe('stage', 'chart_build', time.perf_counter() - t0)
+    return body
+
 # ════════════════════════════════════════════════════════════════════
 # NSE TICKERS
 # ════════════════════════════════════════════════════════════════════
 def get_sme_tickers():
     """Fetch NSE Emerge (SME) tickers via NIFTY SME EMERGE index API."""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Referer': 'https://www.nseindia.com/',
-        }
-        session = requests.Session()
-        session.get('https://www.nseindia.com', headers=headers, timeout=15)
-        r = session.get(
-            'https://www.nseindia.com/api/equity-stockIndices?index=NIFTY%20SME%20EMERGE',
-            headers=headers, timeout=15
-        )
-        if r.status_code == 200:
-            data = r.json()
-            tickers = [x['symbol'] for x in data.get('data', []) if x.get('symbol')]
-            print(f"  ✅ Got {len(tickers)} SME/Emerge tickers from NSE")
-            return tickers
+        data = json.loads(provider.nse_text(
+            'https://www.nseindia.com/api/equity-stockIndices?index=NIFTY%20SME%20EMERGE'))
+        tickers = [x['symbol'] for x in data.get('data', []) if x.get('symbol')]
+        print(f"  ✅ Got {len(tickers)} SME/Emerge tickers from NSE")
+        return tickers
     except Exception as e:
         print(f"  ⚠ SME ticker fetch failed: {e}")
     return []
 
 def get_nse_tickers():
     try:
-        headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://www.nseindia.com/'}
-        url  = 'https://archives.nseindia.com/content/equities/EQUITY_L.csv'
-        resp = requests.get(url, headers=headers, timeout=20)
-        if resp.status_code == 200:
+        text = provider.nse_text('https://archives.nseindia.com/content/equities/EQUITY_L.csv')
+        if text:
             from io import StringIO
-            df = pd.read_csv(StringIO(resp.text))
+            df = pd.read_csv(StringIO(text))
             if 'SYMBOL' in df.columns:
                 main_tickers = df['SYMBOL'].dropna().str.strip().tolist()
                 print(f"  ✅ Got {len(main_tickers)} main board tickers from NSE")
@@ -187,257 +1676,410 @@ def get_nse_tickers():
 
 # ════════════════════════════════════════════════════════════════════
 # TECHNICALS — breakout-focused
+# Every signal is a node in INDICATORS that names the nodes it reads, down
+# to the sources ('hist', 'mtf_hist'). evaluate() orders the graph behind
+# the requested fields once and walks it per ticker, so a shared series
+# (closes, highs/lows, each EMA span, the weekly bars) is computed once and
+# a node nobody asks for never runs. A new indicator costs only its own
+# compute: register it, then add its name to the field list that reads it.
 # ════════════════════════════════════════════════════════════════════
-def calc_technicals(hist):
+# What each consumer reads from a tech dict — keep in sync with them
+STAGE_FIELDS = ('ema_pullback', 'ema_cross', 'ema_post_cross', 'ema_pre_cross',
+                'vpb_detail', 'vpb_score', 'ema_trend')                      # classify_stage()
+SCORE_FIELDS = ('rsi', 'ema_pre_cross', 'vpb_detail', 'vpb_score', 'cross_score',
+                'ema_pullback', 'ema_cross', 'adx', 'vol_confirmed_cross',
+                'macd', 'w_trend', 'm_trend')                                # score()
+UI_FIELDS    = ('rsi', 'adx', 'macd', 'ema_signal', 'ema_cross', 'ema_cross_days_ago',
+                'ema_trend', 'vol_confirmed_cross', 'cross_score', 'ema_pre_cross',
+                'ema_post_cross', 'ema_pullback', 'golden', 'vpb_score', 'vpb_detail',
+                'vpb_range_height', 'near_52high', 'ema50', 'avg_vol20')     # stock dict
+TECH_FIELDS  = tuple(dict.fromkeys(UI_FIELDS + STAGE_FIELDS + SCORE_FIELDS))  # + w_* / m_* (MTF_FIELDS)
+
+INDICATORS    = {}               # name -> (fn, inputs, default)
+TECH_SOURCES  = ('hist', 'mtf_hist')
+_NO_DEFAULT   = object()
+_FAILED       = object()
+_plans        = {}               # requested fields -> evaluation order
+
+def indicator(name, *inputs, default=_NO_DEFAULT):
+    """Register fn(*input values) as node `name`. With a default, the node takes it
+    when fn raises or an input failed; without one the failure reaches the caller."""
+    def register(fn):
+        INDICATORS[name] = (fn, inputs, default)
+        _plans.clear()
+        return fn
+    return register
+
+def indicator_plan(fields):
+    """Dependency order of every node behind `fields` (sources excluded)."""
+    key  = tuple(fields)
+    plan = _plans.get(key)
+    if plan is None:
+        plan, done = [], set()
+        def visit(name, path):
+            if name in done or name in TECH_SOURCES:
+                return
+            if name in path:
+                raise ValueError(f"indicator cycle: {' → '.join(path + (name,))}")
+            if name not in INDICATORS:
+                raise KeyError(f"unknown indicator: {name}")
+            for dep in INDICATORS[name][1]:
+                visit(dep, path + (name,))
+            done.add(name)
+            plan.append(name)
+        for name in key:
+            visit(name, ())
+        _plans[key] = plan
+    return plan
+
+def evaluate(fields, **sources):
+    """{field: value} for one ticker. Raises if a requested field failed with no default."""
+    vals = dict(sources)
+    for name in indicator_plan(fields):
+        fn, inputs, default = INDICATORS[name]
+        args = [vals[i] for i in inputs]
+        if any(a is _FAILED for a in args):
+            v = _FAILED
+        else:
+            try:
+                v = fn(*args)
+            except Exception:
+                v = _FAILED
+        vals[name] = default if v is _FAILED and default is not _NO_DEFAULT else v
+    out = {k: vals[k] for k in fields}
+    if any(v is _FAILED for v in out.values()):
+        raise ValueError(f"indicators failed: {[k for k, v in out.items() if v is _FAILED]}")
+    return out
+
+def calc_technicals(hist, mtf_hist=None, fields=None):
+    # mtf_hist: a longer daily history for the weekly / monthly fields (default: hist)
+    # fields: the subset to compute (default TECH_FIELDS — everything the app stores)
     if hist is None or len(hist) < 30:
         return None
     try:
-        c = hist['Close'].ffill().dropna().values
-        s = pd.Series(c)
-
-        # RSI 14
-        delta = s.diff()
-        gain  = delta.clip(lower=0).rolling(14).mean()
-        loss  = (-delta.clip(upper=0)).rolling(14).mean()
-        rsi_s = 100 - 100/(1+gain/(loss+1e-10))
-        rsi   = round(float(rsi_s.iloc[-1]), 1)
-        if math.isnan(rsi): rsi = 50.0
-
-        # MACD
-        m_line = s.ewm(span=12).mean() - s.ewm(span=26).mean()
-        sig    = m_line.ewm(span=9).mean()
-        macd   = bool(m_line.iloc[-1] > sig.iloc[-1] and m_line.iloc[-2] <= sig.iloc[-2])
-
-        # 14/50 EMA cross
-        ema14 = s.ewm(span=14).mean()
-        ema50 = s.ewm(span=50).mean()
-        e14n  = float(ema14.iloc[-1])
-        e50n  = float(ema50.iloc[-1])
-        e14p  = float(ema14.iloc[-2]) if len(ema14)>1 else e14n
-        e50p  = float(ema50.iloc[-2]) if len(ema50)>1 else e50n
-
-        ema_cross = bool(e14n > e50n and e14p <= e50p)
-        ema_cross_days_ago = None  # how many days ago the cross happened
-        if ema_cross:
-            ema_cross_days_ago = 1
-        elif len(ema14) >= 4:
-            for i in range(2, 6):
-                if len(ema14) > i and \
-                   float(ema14.iloc[-i]) > float(ema50.iloc[-i]) and \
-                   float(ema14.iloc[-i-1]) <= float(ema50.iloc[-i-1]):
-                    ema_cross = True
-                    ema_cross_days_ago = i
-                    break
-
-        ema14_rising      = e14n > float(ema14.iloc[-5]) if len(ema14) >= 5 else False
-        ema14_rising_fast = e14n > float(ema14.iloc[-3]) if len(ema14) >= 3 else False
-        ema_trend         = bool(e14n > e50n and not ema_cross)
-
-        # Pre-cross: 14 EMA below 50 EMA but gap < 0.5% of price and closing fast
-        # Combined with VPB breakout → cross happening within 1 day
-        ema_pre_cross = False
-        try:
-            if not ema_cross and e14n < e50n and c[-1] > 0:
-                gap_pct = (e50n - e14n) / c[-1] * 100
-                ema_pre_cross = bool(gap_pct < 0.5 and ema14_rising_fast)
-        except:
-            pass
-
-        # Post-cross: just crossed (1-2 days ago) and lines still in close proximity
-        # Gap < 1.5% means stock hasn't surged away — still in the entry window
-        ema_post_cross = False
-        try:
-            if ema_cross and ema_cross_days_ago and ema_cross_days_ago <= 2 and c[-1] > 0:
-                prox_pct = (e14n - e50n) / c[-1] * 100
-                ema_post_cross = bool(prox_pct < 1.5)
-        except:
-            pass
-
-        if ema_cross:   ema_signal = 'cross'
-        elif ema_trend: ema_signal = 'trend'
-        else:           ema_signal = 'none'
-
-        # Volume-confirmed EMA cross with recency decay
-        # cross_score: 18 (fresh+vol), 14 (3-4d+vol), 10 (5d+vol), 8 (cross no vol), 0
-        vol_confirmed_cross = False
-        cross_score = 0
-        try:
-            if ema_cross and ema_cross_days_ago and 'Volume' in hist.columns:
-                vols = hist['Volume'].fillna(0).values
-                i = ema_cross_days_ago
-                cross_day_idx = len(vols) - i
-                vol_ok = False
-                if cross_day_idx > 20:
-                    avg20_pre = vols[cross_day_idx - 20:cross_day_idx].mean()
-                    cross_vol = vols[cross_day_idx]
-                    vol_ok = avg20_pre > 0 and cross_vol >= avg20_pre * 1.5
-                if vol_ok:
-                    vol_confirmed_cross = True
-                    if i <= 2:   cross_score = 18  # 1-2 days ago: fresh signal
-                    elif i <= 4: cross_score = 14  # 3-4 days ago: still valid
-                    else:        cross_score = 10  # 5 days ago: aging
-                else:
-                    cross_score = 8  # cross without volume confirmation
-        except:
-            pass
-
-        # EMA pullback setup — price pulled back within 2% of 14 EMA after a cross
-        # (the "kiss-back" — high probability re-entry after initial surge)
-        ema_pullback = False
-        try:
-            if ema_cross and ema_cross_days_ago and ema_cross_days_ago >= 2 and e14n > 0:
-                pct_from_ema = abs(float(c[-1]) - e14n) / e14n * 100
-                ema_pullback = bool(pct_from_ema <= 2.0)
-        except:
-            pass
-
-        # Golden cross 30/200
-        e30    = float(s.ewm(span=30).mean().iloc[-1])
-        golden = False
-        if len(c) >= 200:
-            e200   = float(s.ewm(span=200).mean().iloc[-1])
-            golden = bool(e30 > e200)
-
-        # Real 14-period ADX using Wilder smoothing (+DM/-DM/TR)
-        adx = 15.0
-        try:
-            if 'High' in hist.columns and 'Low' in hist.columns and len(c) >= 28:
-                highs = hist['High'].ffill().values
-                lows  = hist['Low'].ffill().values
-                n = 14
-                tr_arr, pdm_arr, ndm_arr = [], [], []
-                for i in range(1, len(c)):
-                    tr  = max(highs[i]-lows[i], abs(highs[i]-c[i-1]), abs(lows[i]-c[i-1]))
-                    up  = highs[i] - highs[i-1]
-                    dn  = lows[i-1] - lows[i]
-                    pdm_arr.append(up  if up > dn and up > 0 else 0.0)
-                    ndm_arr.append(dn  if dn > up and dn > 0 else 0.0)
-                    tr_arr.append(tr)
-                # Wilder smoothing: seed with sum of first n, then rolling
-                def wilder(arr, period):
-                    out = [None] * period
-                    s = sum(arr[:period])
-                    out.append(s)
-                    for v in arr[period:]:
-                        s = s - s/period + v
-                        out.append(s)
-                    return out
-                atr14  = wilder(tr_arr,  n)
-                pdm14  = wilder(pdm_arr, n)
-                ndm14  = wilder(ndm_arr, n)
-                dx_arr = []
-                for a, p, nd in zip(atr14, pdm14, ndm14):
-                    if a is None or a < 1e-10: continue
-                    pdi = 100 * p  / a
-                    ndi = 100 * nd / a
-                    denom = pdi + ndi
-                    dx_arr.append(100 * abs(pdi - ndi) / denom if denom > 1e-10 else 0.0)
-                if len(dx_arr) >= n:
-                    adx_s = sum(dx_arr[:n])
-                    for v in dx_arr[n:]:
-                        adx_s = adx_s - adx_s/n + v
-                    adx = round(min(60, max(5, adx_s / n)), 1)
-        except:
-            pass
-
-        # Volume-Price Breakout (VPB) — unified signal replacing vol_contract/vol_expand/consolidating
-        # Looks for: price coiling (tight range) + shrinking volume (setup)
-        # then a trigger candle: big volume + close near top of range (breakout)
-        # Penalises: high volume + close near low (distribution)
-        vpb_score        = 0
-        vpb_detail       = 'none'   # coiling | breakout | weak_breakout | distribution | vol_only
-        vpb_range_height = 0.0
-        try:
-            if ('High' in hist.columns and 'Low' in hist.columns and
-                    'Volume' in hist.columns and len(hist) >= 25):
-                vols   = hist['Volume'].fillna(0).values
-                closes = c
-                highs  = hist['High'].ffill().values
-                lows   = hist['Low'].ffill().values
-
-                # 5-day high/low range for measured move target
-                if len(highs) >= 6:
-                    vpb_range_height = float(max(highs[-6:-1]) - min(lows[-6:-1]))
-
-                # Baseline: 20d avg excluding last 5 days (clean pre-setup reference)
-                avg20_base = vols[-25:-5].mean() if len(vols) >= 25 else vols[:-5].mean()
-
-                # --- Setup: last 5 days (excluding today) ---
-                setup_range_pct = (
-                    (max(closes[-6:-1]) - min(closes[-6:-1])) /
-                    (min(closes[-6:-1]) + 1e-10) * 100
-                ) if len(closes) >= 6 else 999
-                price_coiling = setup_range_pct < 4.0   # tight price range
-
-                setup_vols    = vols[-4:-1]              # last 3 days before today
-                vol_shrinking = (
-                    avg20_base > 0 and
-                    all(v < avg20_base * 0.85 for v in setup_vols)
-                )
-
-                # --- Trigger: today's candle ---
-                today_vol   = vols[-1]
-                vol_ratio   = today_vol / (avg20_base + 1e-10)
-                day_range   = highs[-1] - lows[-1]
-                close_pos   = (closes[-1] - lows[-1]) / (day_range + 1e-10)  # 0=low, 1=high
-
-                # Scoring hierarchy
-                if price_coiling and vol_shrinking:
-                    if vol_ratio >= 2.0 and close_pos >= 0.7:
-                        vpb_score  = 10   # perfect: setup + strong breakout candle
-                        vpb_detail = 'breakout'
-                    elif vol_ratio >= 1.5 and close_pos >= 0.6:
-                        vpb_score  = 7    # good breakout but slightly weaker
-                        vpb_detail = 'breakout'
-                    elif vol_ratio >= 1.5 and close_pos < 0.3:
-                        vpb_score  = -2   # distribution — sellers dumping into volume
-                        vpb_detail = 'distribution'
-                    elif vol_ratio < 1.0:
-                        vpb_score  = 3    # coiling with no trigger yet — watch
-                        vpb_detail = 'coiling'
-                    else:
-                        vpb_score  = 5    # breakout candle but close not convincing
-                        vpb_detail = 'weak_breakout'
-                elif vol_ratio >= 2.0 and close_pos >= 0.7:
-                    vpb_score  = 4        # volume breakout but no coiling setup
-                    vpb_detail = 'vol_only'
-                elif price_coiling:
-                    vpb_score  = 2        # price coiling but volume not shrinking
-                    vpb_detail = 'coiling'
-        except:
-            pass
-
-        # Near 52W high
-        near_52high = False
-        try:
-            if len(c) >= 50:
-                high52 = max(c[-252:]) if len(c)>=252 else max(c)
-                near_52high = bool(c[-1] >= high52 * 0.92)
-        except:
-            pass
-
-        return {
-            'rsi':                rsi,
-            'macd':               macd,
-            'ema_signal':         ema_signal,
-            'ema_cross':          ema_cross,
-            'ema_cross_days_ago': ema_cross_days_ago,
-            'ema_trend':          ema_trend,
-            'vol_confirmed_cross':vol_confirmed_cross,
-            'cross_score':        cross_score,
-            'ema_pre_cross':      ema_pre_cross,
-            'ema_post_cross':     ema_post_cross,
-            'ema_pullback':       ema_pullback,
-            'golden':             golden,
-            'adx':                adx,
-            'vpb_score':          vpb_score,
-            'vpb_detail':         vpb_detail,
-            'vpb_range_height':   vpb_range_height,
-            'near_52high':        near_52high,
-        }
+        return evaluate(fields or TECH_FIELDS, hist=hist,
+                        mtf_hist=hist if mtf_hist is None else mtf_hist)
     except Exception as e:
         return None
 
+# ── Shared series ───────────────────────────────────────────────────
+@indicator('close', 'hist')
+def _close(hist):
+    return hist['Close'].ffill().dropna().values
+
+@indicator('close_s', 'close')
+def _close_s(c):
+    return pd.Series(c)
+
+@indicator('high', 'hist')
+def _high(hist):
+    return hist['High'].ffill().values
+
+@indicator('low', 'hist')
+def _low(hist):
+    return hist['Low'].ffill().values
+
+@indicator('volume', 'hist')
+def _volume(hist):
+    return hist['Volume'].fillna(0).values
+
+def _ema(span):
+    indicator(f'ema_{span}', 'close_s')(lambda s: s.ewm(span=span).mean())
+
+for _span in (12, 14, 26, 30, 50, 200):
+    _ema(_span)
+
+# ── Momentum ────────────────────────────────────────────────────────
+@indicator('rsi', 'close_s')
+def _rsi(s):
+    # RSI 14
+    delta = s.diff()
+    gain  = delta.clip(lower=0).rolling(14).mean()
+    loss  = (-delta.clip(upper=0)).rolling(14).mean()
+    rsi   = round(float((100 - 100/(1+gain/(loss+1e-10))).iloc[-1]), 1)
+    return 50.0 if math.isnan(rsi) else rsi
+
+@indicator('macd', 'ema_12', 'ema_26')
+def _macd(e12, e26):
+    m_line = e12 - e26
+    sig    = m_line.ewm(span=9).mean()
+    return bool(m_line.iloc[-1] > sig.iloc[-1] and m_line.iloc[-2] <= sig.iloc[-2])
+
+# Real 14-period ADX using Wilder smoothing (+DM/-DM/TR) — see adx_series()
+@indicator('adx', 'close', 'high', 'low', default=15.0)
+def _adx(c, highs, lows):
+    return float(adx_series(c, highs, lows)[-1])
+
+# ── 14/50 EMA cross ─────────────────────────────────────────────────
+@indicator('ema_cross_days_ago', 'ema_14', 'ema_50')
+def _ema_cross_days_ago(ema14, ema50):
+    # how many days ago the cross happened (1 = today), None if not in the last 5
+    e14, e50 = ema14.values, ema50.values
+    for i in range(1, 6):
+        if len(e14) > i and e14[-i] > e50[-i] and e14[-i-1] <= e50[-i-1]:
+            return i
+    return None
+
+@indicator('ema_cross', 'ema_cross_days_ago')
+def _ema_cross(days_ago):
+    return days_ago is not None
+
+@indicator('ema_trend', 'ema_14', 'ema_50', 'ema_cross')
+def _ema_trend(ema14, ema50, ema_cross):
+    return bool(ema14.iloc[-1] > ema50.iloc[-1] and not ema_cross)
+
+@indicator('ema_signal', 'ema_cross', 'ema_trend')
+def _ema_signal(ema_cross, ema_trend):
+    return 'cross' if ema_cross else 'trend' if ema_trend else 'none'
+
+@indicator('ema50', 'ema_50')
+def _ema50(ema50):
+    return round(float(ema50.iloc[-1]), 2)
+
+# Pre-cross: 14 EMA below 50 EMA but gap < 0.5% of price and closing fast
+# Combined with VPB breakout → cross happening within 1 day
+@indicator('ema_pre_cross', 'close', 'ema_14', 'ema_50', 'ema_cross', default=False)
+def _ema_pre_cross(c, ema14, ema50, ema_cross):
+    e14n, e50n = float(ema14.iloc[-1]), float(ema50.iloc[-1])
+    if ema_cross or e14n >= e50n or c[-1] <= 0:
+        return False
+    rising_fast = e14n > float(ema14.iloc[-3]) if len(ema14) >= 3 else False
+    return bool((e50n - e14n) / c[-1] * 100 < 0.5 and rising_fast)
+
+# Post-cross: just crossed (1-2 days ago) and lines still in close proximity
+# Gap < 1.5% means stock hasn't surged away — still in the entry window
+@indicator('ema_post_cross', 'close', 'ema_14', 'ema_50', 'ema_cross_days_ago', default=False)
+def _ema_post_cross(c, ema14, ema50, days_ago):
+    if not days_ago or days_ago > 2 or c[-1] <= 0:
+        return False
+    return bool((float(ema14.iloc[-1]) - float(ema50.iloc[-1])) / c[-1] * 100 < 1.5)
+
+# Volume-confirmed EMA cross with recency decay
+# cross_score: 18 (fresh+vol), 14 (3-4d+vol), 10 (5d+vol), 8 (cross no vol), 0
+@indicator('cross_volume', 'volume', 'ema_cross_days_ago', default=(False, 0))
+def _cross_volume(vols, i):
+    if not i:
+        return False, 0
+    cross_day_idx = len(vols) - i
+    vol_ok = False
+    if cross_day_idx > 20:
+        avg20_pre = vols[cross_day_idx - 20:cross_day_idx].mean()
+        vol_ok = avg20_pre > 0 and vols[cross_day_idx] >= avg20_pre * 1.5
+    if not vol_ok:
+        return False, 8                # cross without volume confirmation
+    if i <= 2:   return True, 18       # 1-2 days ago: fresh signal
+    elif i <= 4: return True, 14       # 3-4 days ago: still valid
+    else:        return True, 10       # 5 days ago: aging
+
+indicator('vol_confirmed_cross', 'cross_volume')(lambda cv: cv[0])
+indicator('cross_score',         'cross_volume')(lambda cv: cv[1])
+
+# EMA pullback setup — price pulled back within 2% of 14 EMA after a cross
+# (the "kiss-back" — high probability re-entry after initial surge)
+@indicator('ema_pullback', 'close', 'ema_14', 'ema_cross_days_ago', default=False)
+def _ema_pullback(c, ema14, days_ago):
+    e14n = float(ema14.iloc[-1])
+    if not days_ago or days_ago < 2 or e14n <= 0:
+        return False
+    return bool(abs(float(c[-1]) - e14n) / e14n * 100 <= 2.0)
+
+# Golden cross 30/200
+@indicator('golden', 'close', 'ema_30', 'ema_200')
+def _golden(c, ema30, ema200):
+    return bool(len(c) >= 200 and float(ema30.iloc[-1]) > float(ema200.iloc[-1]))
+
+# ── Volume-Price Breakout (VPB) — see vpb_signal() ──────────────────
+@indicator('vpb', 'hist', 'close', 'high', 'low', 'volume', default=(0, 'none', 0.0))
+def _vpb(hist, c, highs, lows, vols):
+    return vpb_signal(c, highs, lows, vols) if len(hist) >= 25 else (0, 'none', 0.0)
+
+indicator('vpb_score',        'vpb')(lambda v: v[0])
+indicator('vpb_detail',       'vpb')(lambda v: v[1])
+indicator('vpb_range_height', 'vpb')(lambda v: v[2])
+
+# Raw 20-session average share volume — the intraday VPB trigger's baseline
+@indicator('avg_vol20', 'volume', default=None)
+def _avg_vol20(vols):
+    return round(float(vols[-20:].mean())) if len(vols) else None
+
+# Near 52W high
+@indicator('near_52high', 'close', default=False)
+def _near_52high(c):
+    if len(c) < 50:
+        return False
+    high52 = max(c[-252:]) if len(c)>=252 else max(c)
+    return bool(c[-1] >= high52 * 0.92)
+
+def vpb_signal(closes, highs, lows, vols):
+    """Volume-Price Breakout (VPB) — unified signal replacing vol_contract/vol_expand/consolidating.
+    Looks for: price coiling (tight range) + shrinking volume (setup)
+    then a trigger candle: big volume + close near top of range (breakout)
+    Penalises: high volume + close near low (distribution)
+    Bars can be daily, weekly or monthly. Returns (vpb_score, vpb_detail, vpb_range_height),
+    vpb_detail: coiling | breakout | weak_breakout | distribution | vol_only | none"""
+    vpb_score        = 0
+    vpb_detail       = 'none'
+    vpb_range_height = 0.0
+
+    # 5-bar high/low range for measured move target
+    if len(highs) >= 6:
+        vpb_range_height = float(max(highs[-6:-1]) - min(lows[-6:-1]))
+
+    # Baseline: 20-bar avg excluding last 5 (clean pre-setup reference)
+    avg20_base = vols[-25:-5].mean() if len(vols) >= 25 else vols[:-5].mean()
+
+    # --- Setup: last 5 bars (excluding the current one) ---
+    setup_range_pct = (
+        (max(closes[-6:-1]) - min(closes[-6:-1])) /
+        (min(closes[-6:-1]) + 1e-10) * 100
+    ) if len(closes) >= 6 else 999
+    price_coiling = setup_range_pct < 4.0   # tight price range
+
+    setup_vols    = vols[-4:-1]              # last 3 bars before the current one
+    vol_shrinking = (
+        avg20_base > 0 and
+        all(v < avg20_base * 0.85 for v in setup_vols)
+    )
+
+    # --- Trigger: the current candle ---
+    today_vol   = vols[-1]
+    vol_ratio   = today_vol / (avg20_base + 1e-10)
+    day_range   = highs[-1] - lows[-1]
+    close_pos   = (closes[-1] - lows[-1]) / (day_range + 1e-10)  # 0=low, 1=high
+
+    # Scoring hierarchy
+    if price_coiling and vol_shrinking:
+        if vol_ratio >= 2.0 and close_pos >= 0.7:
+            vpb_score  = 10   # perfect: setup + strong breakout candle
+            vpb_detail = 'breakout'
+        elif vol_ratio >= 1.5 and close_pos >= 0.6:
+            vpb_score  = 7    # good breakout but slightly weaker
+            vpb_detail = 'breakout'
+        elif vol_ratio >= 1.5 and close_pos < 0.3:
+            vpb_score  = -2   # distribution — sellers dumping into volume
+            vpb_detail = 'distribution'
+        elif vol_ratio < 1.0:
+            vpb_score  = 3    # coiling with no trigger yet — watch
+            vpb_detail = 'coiling'
+        else:
+            vpb_score  = 5    # breakout candle but close not convincing
+            vpb_detail = 'weak_breakout'
+    elif vol_ratio >= 2.0 and close_pos >= 0.7:
+        vpb_score  = 4        # volume breakout but no coiling setup
+        vpb_detail = 'vol_only'
+    elif price_coiling:
+        vpb_score  = 2        # price coiling but volume not shrinking
+        vpb_detail = 'coiling'
+    return vpb_score, vpb_detail, vpb_range_height
+
+# ── Multi-timeframe ─────────────────────────────────────────────────
+# Weekly / monthly bars are resampled from the daily history already in
+# hand (no extra fetches) and run through the same RSI / 14-50 EMA / ADX /
+# VPB rules. The current week's / month's bar is partial, like today's.
+MTF_FRAMES   = ('w', 'm')    # weekly (Mon–Fri), monthly
+MTF_MIN_BARS = 20            # fewer bars than this → that timeframe's fields are None
+MTF_FIELDS   = {'trend': 'Trend', 'rsi': 'Rsi', 'adx': 'Adx', 'ema_cross': 'EmaCross', 'vpb': 'Vpb'}
+
+def wilder_mean(x, n):
+    """calc_technicals()' Wilder smoothing as a running mean: seeded with mean(x[:n]),
+    then y += (x - y) / n. The live code keeps the sum (n * y); ratios are the same."""
+    out = np.full(len(x), np.nan)
+    if len(x) >= n:
+        seed = np.concatenate([[x[:n].mean()], x[n:]])
+        out[n - 1:] = pd.Series(seed).ewm(alpha=1 / n, adjust=False).mean().values
+    return out
+
+def adx_series(c, hi, lo, n=14):
+    """calc_technicals()' ADX for every bar at once (15.0 until there are 28 bars)."""
+    N  = len(c)
+    tr = np.maximum.reduce([hi[1:] - lo[1:], np.abs(hi[1:] - c[:-1]), np.abs(lo[1:] - c[:-1])])
+    up = hi[1:] - hi[:-1]
+    dn = lo[:-1] - lo[1:]
+    pdm = np.where((up > dn) & (up > 0), up, 0.0)
+    ndm = np.where((dn > up) & (dn > 0), dn, 0.0)
+    atr, pdi, ndi = wilder_mean(tr, n), wilder_mean(pdm, n), wilder_mean(ndm, n)   # index k ↔ day k + 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pdi = 100 * pdi / atr
+        ndi = 100 * ndi / atr
+        den = pdi + ndi
+        dx  = np.where(den > 1e-10, 100 * np.abs(pdi - ndi) / den, 0.0)
+    valid = np.isfinite(atr) & (atr * n >= 1e-10)
+    days  = np.flatnonzero(valid) + 1
+    out   = np.full(N, np.nan)
+    out[days] = wilder_mean(dx[valid], n)
+    out = pd.Series(out).ffill().values      # days with flat ranges keep the last ADX
+    adx = np.round(np.clip(out, 5, 60), 1)
+    return np.where(np.isfinite(adx) & (np.arange(N) >= 27), adx, 15.0)
+
+def resample_bars(hist, frame):
+    """Daily OHLCV → (open, high, low, close, volume) arrays per week ('w') or month ('m').
+    Periods are read off the dates and aggregated with reduceat — no pandas resample."""
+    close = hist['Close'].ffill()
+    ok    = close.notna().values
+    if not ok.any():
+        return None
+    index = hist.index[ok]
+    if getattr(index, 'tz', None) is not None:
+        index = index.tz_localize(None)
+    d   = index.values.astype('datetime64[D]')
+    key = (d.astype(np.int64) + 3) // 7 if frame == 'w' else d.astype('datetime64[M]').astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    ends   = np.r_[starts[1:], len(key)] - 1
+    c  = close.values[ok].astype(np.float64)
+    op = hist['Open'].values[ok].astype(np.float64)
+    hi = hist['High'].values[ok].astype(np.float64)
+    lo = hist['Low'].values[ok].astype(np.float64)
+    v  = np.nan_to_num(hist['Volume'].values[ok].astype(np.float64))
+    return (np.where(np.isfinite(op[starts]), op[starts], c[starts]),
+            np.fmax.reduceat(np.where(np.isfinite(hi), hi, c), starts),
+            np.fmin.reduceat(np.where(np.isfinite(lo), lo, c), starts),
+            c[ends], np.add.reduceat(v, starts))
+
+def calc_tf_technicals(o, h, l, c, v):
+    """Trend / RSI 14 / 14-50 EMA cross / ADX / VPB for one timeframe's bars.
+    trend: 'up' (14 EMA > 50 EMA, close above the 50) | 'down' (both the other way) | 'flat'."""
+    if len(c) < MTF_MIN_BARS:
+        return None
+    d    = np.diff(c[-15:])
+    gain = np.clip(d, 0, None).mean()
+    loss = np.clip(-d, 0, None).mean()
+    s    = pd.Series(c)
+    e14  = s.ewm(span=14).mean().values
+    e50  = s.ewm(span=50).mean().values
+    up   = e14 > e50
+    return {
+        'trend':     'up' if up[-1] and c[-1] > e50[-1] else 'down' if not up[-1] and c[-1] < e50[-1] else 'flat',
+        'rsi':       round(float(100 - 100 / (1 + gain / (loss + 1e-10))), 1),
+        'adx':       float(adx_series(c, h, l)[-1]),
+        'ema_cross': bool(up[-1] and not up[-3:-1].all()),   # crossed on one of the last 2 bars
+        'vpb':       vpb_signal(c, h, l, v)[1] if len(c) >= 25 else 'none',
+    }
+
+def _mtf_nodes(tf):
+    # {tf}_bars → {tf}_tech → {tf}_trend, {tf}_rsi, … ; a timeframe that fails is all None.
+    # Monthly needs ~2 years of bars, so the EOD refresh passes the price matrix's
+    # full row as mtf_hist rather than its 1y fetch.
+    indicator(f'{tf}_bars', 'mtf_hist', default=None)(lambda hist: resample_bars(hist, tf))
+    indicator(f'{tf}_tech', f'{tf}_bars', default=None)(
+        lambda bars: calc_tf_technicals(*bars) if bars else None)
+    for k in MTF_FIELDS:
+        indicator(f'{tf}_{k}', f'{tf}_tech')(lambda tech, k=k: tech[k] if tech else None)
+
+for _tf in MTF_FRAMES:
+    _mtf_nodes(_tf)
+TECH_FIELDS = tuple(dict.fromkeys(TECH_FIELDS + tuple(f'{tf}_{k}' for tf in MTF_FRAMES for k in MTF_FIELDS)))
+
+def mtf_fields(tech):
+    """tech's w_* / m_* keys as stock fields — wTrend, wRsi, wAdx, wEmaCross, wVpb, mTrend, …."""
+    tech = tech or {}
+    return {tf + name: tech.get(f'{tf}_{k}') for tf in MTF_FRAMES for k, name in MTF_FIELDS.items()}
+
+def mtf_points(w_trend, m_trend):
+    """Score bonus for higher-timeframe confirmation (see MTF_SCORE_POINTS)."""
+    if not MTF_SCORE_POINTS or w_trend != 'up':
+        return 0
+    return MTF_SCORE_POINTS + (MTF_SCORE_POINTS // 2 if m_trend == 'up' else 0)
+
 # ════════════════════════════════════════════════════════════════════
 # STAGE CLASSIFICATION
 # Lifecycle: coiling → breakout → pre_cross → post_cross → pullback
@@ -473,7 +2115,8 @@ def classify_stage(tech):
 # ════════════════════════════════════════════════════════════════════
 # SCORING
 # ════════════════════════════════════════════════════════════════════
-def score(pe, debtEq, roe, dailyVol, tech):
+def score(pe, debtEq, roe, dailyVol, tech, rs_rating=None):
+    # Rule changes here go into SCORE_DEFAULTS / score_columns() below too
     # Fundamentals (30 pts) — ROE not scored, warning badge only
     f = 8   # no pledge assumed — verify on screener.in
 
@@ -524,11 +2167,83 @@ def score(pe, debtEq, roe, dailyVol, tech):
 
         if tech.get('macd'):   t += 2
 
+        # Weekly / monthly trend confirmation — optional, off unless MTF_SCORE_POINTS is set
+        t += mtf_points(tech.get('w_trend'), tech.get('m_trend'))
+
+    # Relative strength vs NIFTY — optional, off unless RS_SCORE_POINTS is set
+    t += rs_points(rs_rating)
+
     l = 0  # liquidity is a UI filter only, not scored
     c = 0  # catalyst — manual only for now
     ct = 0  # context removed from scoring — near52High kept as a badge only
     return min(100, f+t+c), f, c, t, ct, l
 
+# Every threshold and weight in score(), by name — score_columns() takes
+# overrides of these (parameter sweeps, the Strategy Playground).
+SCORE_DEFAULTS = {
+    'f_base': 8,
+    'pe_1': 15,  'pe_2': 25,  'pe_3': 35,  'pe_4': 50,  'pe_pts_1': 12, 'pe_pts_2': 9, 'pe_pts_3': 5, 'pe_pts_4': 2,
+    'de_1': 0.3, 'de_2': 0.7, 'de_3': 1.0, 'de_4': 1.5, 'de_pts_1': 10, 'de_pts_2': 7, 'de_pts_3': 4, 'de_pts_4': 1,
+    'rsi_lo': 45, 'rsi_hi': 58, 'rsi_pts': 12,          # sweet spot
+    'rsi_warm_hi': 65, 'rsi_warm_pts': 7,               # (rsi_hi, rsi_warm_hi]
+    'rsi_cool_lo': 40, 'rsi_cool_pts': 4,               # [rsi_cool_lo, rsi_lo)
+    'rsi_hot_hi': 72,  'rsi_hot_pts': 2,                # (rsi_warm_hi, rsi_hot_hi]
+    'pre_pts_10': 18, 'pre_pts_7': 14, 'pre_pts': 12,   # pre-cross by VPB quality
+    'cross_pts_fresh': 18, 'cross_pts_recent': 14, 'cross_pts_aging': 10, 'cross_pts_novol': 8,
+    'pullback_pts': 5,
+    'adx_lo': 20, 'adx_hi': 35, 'adx_pts': 10,
+    'adx_weak_lo': 15, 'adx_weak_pts': 5, 'adx_strong_pts': 4,
+    'vpb_weight': 1.0, 'macd_pts': 2,
+    'rs_pts': None,                                     # None = RS_SCORE_POINTS
+    'mtf_pts': None,                                    # None = MTF_SCORE_POINTS
+}
+
+def score_columns(cols, params=None):
+    """score() over whole columns at once — one element per stock (or per session).
+    cols: pe, debtEq, rsi, adx, vpb_score, pre_cross, pre_breakout (pre-cross with a
+    breakout / weak_breakout VPB), ema_cross, cross_days, vol_confirmed, pullback, macd,
+    optionally rs_rating (NaN = unrated) and w_up / m_up (weekly / monthly trend 'up').
+    Scalars broadcast. params: SCORE_DEFAULTS
+    overrides. Returns (score, fScore, tScore) as int arrays.
+    Keep in step with score() — backtest.py --check compares the two."""
+    p   = {**SCORE_DEFAULTS, **(params or {})}
+    col = lambda k: np.asarray(cols[k], dtype=np.float64)
+    pe, de = col('pe'), col('debtEq')
+    f = p['f_base'] + np.select([(pe > 0) & (pe < p['pe_1']), (pe > 0) & (pe < p['pe_2']),
+                                 (pe > 0) & (pe < p['pe_3']), (pe > 0) & (pe < p['pe_4'])],
+                                [p['pe_pts_1'], p['pe_pts_2'], p['pe_pts_3'], p['pe_pts_4']], 0) \
+                    + np.select([de < p['de_1'], de < p['de_2'], de < p['de_3'], de < p['de_4']],
+                                [p['de_pts_1'], p['de_pts_2'], p['de_pts_3'], p['de_pts_4']], 0)
+
+    r, adx, vs = col('rsi'), col('adx'), col('vpb_score')
+    pre, cross = np.asarray(cols['pre_cross'], bool), np.asarray(cols['ema_cross'], bool)
+    vconf      = np.asarray(cols['vol_confirmed'], bool)
+    ago        = np.nan_to_num(col('cross_days'), nan=0)
+    t  = np.select([(r >= p['rsi_lo']) & (r <= p['rsi_hi']), (r > p['rsi_hi']) & (r <= p['rsi_warm_hi']),
+                    (r >= p['rsi_cool_lo']) & (r < p['rsi_lo']), (r > p['rsi_warm_hi']) & (r <= p['rsi_hot_hi'])],
+                   [p['rsi_pts'], p['rsi_warm_pts'], p['rsi_cool_pts'], p['rsi_hot_pts']], 0).astype(np.float64)
+    cross_pts = np.where(cross & (ago > 0),
+                         np.where(vconf, np.select([ago <= 2, ago <= 4], [p['cross_pts_fresh'], p['cross_pts_recent']],
+                                                   p['cross_pts_aging']), p['cross_pts_novol']), 0)
+    t  = t + np.where(np.asarray(cols['pre_breakout'], bool),
+                      np.select([vs >= 10, vs >= 7], [p['pre_pts_10'], p['pre_pts_7']], p['pre_pts']), cross_pts)
+    t += p['pullback_pts'] * (np.asarray(cols['pullback'], bool) & cross)
+    t += np.select([(adx >= p['adx_lo']) & (adx <= p['adx_hi']), (adx >= p['adx_weak_lo']) & (adx < p['adx_lo']),
+                    adx > p['adx_hi']], [p['adx_pts'], p['adx_weak_pts'], p['adx_strong_pts']], 0)
+    t += np.where(~pre & ~vconf, p['vpb_weight'] * vs, 0)
+    t += p['macd_pts'] * np.asarray(cols['macd'], bool)
+    rs_pts = RS_SCORE_POINTS if p['rs_pts'] is None else p['rs_pts']
+    if rs_pts and 'rs_rating' in cols:
+        rs = col('rs_rating')
+        t += np.select([rs >= 80, rs >= 60], [rs_pts, rs_pts // 2], 0)
+    mtf_pts = MTF_SCORE_POINTS if p['mtf_pts'] is None else p['mtf_pts']
+    if mtf_pts and 'w_up' in cols:
+        w_up = np.asarray(cols['w_up'], bool)
+        t += w_up * (mtf_pts + (mtf_pts // 2) * np.asarray(cols.get('m_up', False), bool))
+    t = np.rint(t).astype(np.int64)
+    f = np.broadcast_to(np.rint(f), t.shape).astype(np.int64)
+    return np.minimum(100, f + t), f, t
+
 # ════════════════════════════════════════════════════════════════════
 # TARGET CALCULATION
 # ════════════════════════════════════════════════════════════════════
@@ -557,7 +2272,7 @@ def _check_mcap_only(ticker):
     """MCap check via info['marketCap'] (no history). Returns {ticker, mcap} or None.
     fast_info.market_cap returns None for most NSE stocks — use info instead."""
     try:
-        info = yf.Ticker(ticker + '.NS').info
+        info = provider.info(ticker + '.NS')
         mcap_raw = info.get('marketCap', 0) or 0
         if not mcap_raw:
             return None
@@ -622,8 +2337,8 @@ def _scan_one(ticker, prefiltered_mcap=None):
     If prefiltered_mcap is provided (from ticker cache), MCap check is skipped."""
     ns = ticker.strip().replace(' ', '') + '.NS'
     try:
-        t    = yf.Ticker(ns)
-        info = t.info
+        with timed('t.info'):
+            info = provider.info(ns)
 
         # MCap check — skip if prefiltered from ticker cache
         if prefiltered_mcap is not None:
@@ -635,9 +2350,12 @@ def _scan_one(ticker, prefiltered_mcap=None):
                 return None
 
         # Fetch 5-year history for technicals + ATH
-        hist = t.history(period='5y', auto_adjust=True)
+        with timed('t.history'):
+            hist = provider.history(ns, '5y')
         if hist is None or len(hist) < 30:
             return None
+        rs_capture(ticker, hist)
+        prices_record(ticker, hist)
 
         # Price
         price = float(
@@ -674,7 +2392,8 @@ def _scan_one(ticker, prefiltered_mcap=None):
         sector = info.get('sector') or 'Others'
         name   = info.get('longName') or info.get('shortName') or ticker
 
-        tech = calc_technicals(hist)
+        with timed('calc_technicals'):
+            tech = calc_technicals(hist)
 
         # ATH from 5-year history (already fetched — no extra API call)
         ath = 0.0
@@ -688,17 +2407,10 @@ def _scan_one(ticker, prefiltered_mcap=None):
         mm_target = round(price + vpb_rh, 2) if vpb_rh > 0 else None
         target_price, target_type, upside_pct, upside_rs = calc_target(price, mm_target, wk52h, ath)
 
-        sc, f, c, t2, ct2, l = score(pe, debtEq, roe, dvol, tech)
+        with timed('score'):
+            sc, f, c, t2, ct2, l = score(pe, debtEq, roe, dvol, tech)
         roe_warn = 'high' if roe > 20 else 'medium' if roe > 12 else 'low' if roe > 0 else 'na'
 
-        chart_prices, chart_dates = [], []
-        try:
-            h60    = hist.tail(60)
-            closes = h60['Close'].ffill().tolist()
-            chart_prices = [round(float(x), 2) for x in closes if not math.isnan(float(x))]
-            chart_dates  = [str(d.date()) for d in h60.index.tolist()]
-        except: pass
-
         return {
             'ticker':          ticker,
             'name':            name,
@@ -731,7 +2443,14 @@ def _scan_one(ticker, prefiltered_mcap=None):
             'golden':          tech['golden']             if tech else False,
             'vpbScore':        tech['vpb_score']          if tech else 0,
             'vpbDetail':       tech['vpb_detail']         if tech else 'none',
+            'pattern':         'none',     # pattern* set by detect_patterns() once the matrix is published
+            'patternStage':    'none',
+            'patternPivot':    None,
+            'patterns':        [],
             'near52High':      tech['near_52high']        if tech else False,
+            'ema50':           tech['ema50']              if tech else None,
+            'avgVol20':        tech['avg_vol20']          if tech else None,
+            **mtf_fields(tech),
             'stage':           classify_stage(tech),
             'catalysts':       [],
             'dailyVol':        dvol,
@@ -741,8 +2460,6 @@ def _scan_one(ticker, prefiltered_mcap=None):
             'tScore':          t2,
             'ctScore':         ct2,
             'lScore':          l,
-            'chartPrices':     chart_prices,
-            'chartDates':      chart_dates,
             'ath':             round(ath, 2),
             'mmTarget':        mm_target,
             'targetPrice':     target_price,
@@ -777,7 +2494,10 @@ def fetch_all_stocks():
 
     print(f"\n{'='*60}")
     print(f"  Scanning {total} pre-filtered stocks  ₹{MCAP_MIN_CR}–{MCAP_MAX_CR} Cr MCap")
-    print(f"  Workers: {SCAN_WORKERS}")
+    if SCAN_MODE == 'sharded':
+        print(f"  Mode: sharded — {SHARD_SIZE} tickers/shard, lease {SHARD_LEASE_SEC}s")
+    else:
+        print(f"  Workers: {SCAN_WORKERS}")
     print(f"{'='*60}\n")
 
     results      = []
@@ -803,12 +2523,22 @@ def fetch_all_stocks():
                     state['fetch_message']  = f'Scanning {n} of {total}  ({len(results)} found)'
                     state['in_range']       = len(results)
 
-    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as ex:
-        list(ex.map(worker, ticker_items))
+    if SCAN_MODE == 'sharded':
+        results, counter[1] = scan_sharded(ticker_items)
+    else:
+        with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as ex:
+            list(ex.map(worker, ticker_items))
 
     ist    = get_ist()
     strong = [s for s in results if s['score'] >= 65]
 
+    compute_relative_strength(results)
+    prices_publish()
+    detect_patterns(results)
+    corr_update(results, rebuild=True)
+    plan_publish(results)
+    breadth_rebuild(results)
+    check_alerts(results)
     with state_lock:
         state['stocks']         = results
         state['last_updated']   = ist.strftime('%d %b %Y, %I:%M %p IST')
@@ -839,45 +2569,241 @@ def fetch_all_stocks():
     except Exception as e:
         print(f"  ⚠ Ticker cache save failed: {e}")
 
+# ════════════════════════════════════════════════════════════════════
+# SHARDED SCAN — coordinator + workers (SCAN_MODE = 'sharded')
+# The coordinator splits the ticker list into shards and serves them over
+# HTTP. Workers (this machine or any box on the LAN) run:
+#     python server.py --worker http://<coordinator-ip>:5000
+# lease a shard, run _scan_one on it, renew the lease while working and
+# POST the results back. A shard whose lease lapses (worker died, laptop
+# slept) is handed to the next worker that asks; first result wins.
+# ════════════════════════════════════════════════════════════════════
+shard_lock = threading.Lock()
+shard_job  = {'id': None, 'shards': {}, 'results': [], 'failed': 0}
+
+def _shard_counts():
+    shards = shard_job['shards'].values()
+    return {k: sum(1 for sh in shards if sh['status'] == k)
+            for k in ('pending', 'leased', 'done', 'failed')}
+
+def _reap_expired_leases(now):
+    """Return lapsed leases to the queue (or fail the shard after SHARD_MAX_ATTEMPTS)."""
+    for sh in shard_job['shards'].values():
+        if sh['status'] == 'leased' and now > sh['expires']:
+            print(f"  ⚠ Shard {sh['id']} lease expired on {sh['worker']} — reassigning")
+            if sh['attempts'] >= SHARD_MAX_ATTEMPTS:
+                sh['status'] = 'failed'
+                shard_job['failed'] += len(sh['items'])
+            else:
+                sh['status'] = 'pending'
+                with state_lock:
+                    state['ctrl']['shards']['reassigned'] += 1
+
+def lease_shard(worker):
+    now = time.time()
+    with shard_lock:
+        with state_lock:
+            state['ctrl']['shards']['workers'].setdefault(worker, {'shards_done': 0, 'tickers': 0})
+            state['ctrl']['shards']['workers'][worker]['last_seen'] = get_ist().isoformat()
+        if shard_job['id'] is None:
+            return {'shard': None, 'wait': 10}
+        _reap_expired_leases(now)
+        sh = next((sh for sh in shard_job['shards'].values() if sh['status'] == 'pending'), None)
+        if sh is None:
+            return {'shard': None, 'wait': 5}
+        sh.update({'status': 'leased', 'worker': worker, 'lease': os.urandom(8).hex(),
+                   'expires': now + SHARD_LEASE_SEC, 'attempts': sh['attempts'] + 1})
+        return {'job': shard_job['id'], 'shard': sh['id'], 'lease': sh['lease'],
+                'lease_sec': SHARD_LEASE_SEC, 'tickers': sh['items']}
+
+def renew_shard(job, shard_id, lease):
+    with shard_lock:
+        sh = shard_job['shards'].get(shard_id) if job == shard_job['id'] else None
+        if not sh or sh['status'] != 'leased' or sh['lease'] != lease:
+            return False
+        sh['expires'] = time.time() + SHARD_LEASE_SEC
+        return True
+
+def complete_shard(payload):
+    """Merge a worker's results. Accepted for any shard not already done, even if its
+    lease lapsed and it was reassigned — the slower duplicate is simply dropped."""
+    with shard_lock:
+        if payload.get('job') != shard_job['id']:
+            return False
+        sh = shard_job['shards'].get(payload.get('shard'))
+        if not sh or sh['status'] in ('done', 'failed'):
+            return False
+        results = payload.get('results') or []
+        sh['status'] = 'done'
+        shard_job['results'].extend(results)
+        shard_job['failed'] += len(sh['items']) - len(results)
+        worker = payload.get('worker', '?')
+    with state_lock:
+        w = state['ctrl']['shards']['workers'].setdefault(worker, {'shards_done': 0, 'tickers': 0})
+        w['shards_done'] += 1
+        w['tickers']     += len(sh['items'])
+        w['last_seen']    = get_ist().isoformat()
+    print(f"  ✅ Shard {sh['id']} from {worker}: {len(results)}/{len(sh['items'])} in range")
+    return True
+
+def _spawn_local_workers(n):
+    import subprocess
+    url  = f'http://127.0.0.1:{PORT}'
+    argv = [sys.executable, '-W', 'ignore', os.path.abspath(__file__), '--worker', url] + provider_argv()
+    return [subprocess.Popen(argv) for _ in range(n)]
+
+def scan_sharded(ticker_items):
+    """Coordinator side of a full scan. Blocks until every shard is done or failed.
+    Returns (results, failed_count) like the in-process thread pool path."""
+    total = len(ticker_items)
+    with shard_lock:
+        shard_job['id']      = os.urandom(4).hex()
+        shard_job['results'] = []
+        shard_job['failed']  = 0
+        shard_job['shards']  = {
+            i: {'id': i, 'items': ticker_items[o:o+SHARD_SIZE], 'status': 'pending',
+                'attempts': 0, 'worker': None, 'lease': None, 'expires': 0}
+            for i, o in enumerate(range(0, total, SHARD_SIZE))
+        }
+        n_shards = len(shard_job['shards'])
+    with state_lock:
+        state['ctrl']['shards'].update({'running': True, 'total': n_shards, 'reassigned': 0})
+
+    procs, stop = [], threading.Event()
+    if SHARD_LOCAL_WORKERS > 0:
+        procs = _spawn_local_workers(SHARD_LOCAL_WORKERS)
+    else:
+        # No local processes — scan in-process too so a coordinator alone still finishes
+        threading.Thread(target=run_worker, args=(f'http://127.0.0.1:{PORT}', stop, 'coordinator'),
+                         daemon=True).start()
+    print(f"  🧩 {n_shards} shards queued — {len(procs) or 'in-process'} local worker(s), LAN workers welcome")
+
+    try:
+        while True:
+            time.sleep(2)
+            with shard_lock:
+                _reap_expired_leases(time.time())
+                counts  = _shard_counts()
+                found   = len(shard_job['results'])
+            finished = counts['done'] + counts['failed']
+            with state_lock:
+                state['ctrl']['shards'].update(counts)
+                state['fetch_progress'] = int(finished / max(1, n_shards) * 100)
+                state['fetch_message']  = f'Sharded scan: {finished}/{n_shards} shards  ({found} found)'
+                state['in_range']       = found
+            if finished >= n_shards:
+                break
+    finally:
+        stop.set()
+        for p in procs:
+            p.terminate()
+        with shard_lock:
+            results, failed = shard_job['results'], shard_job['failed']
+            shard_job['id'] = None
+        with state_lock:
+            state['ctrl']['shards']['running'] = False
+    # A re-leased shard may be answered twice across restarts — keep one row per ticker
+    merged = list({r['ticker']: r for r in results}.values())
+    return merged, failed
+
+def run_worker(coordinator, stop=None, worker_id=None):
+    """Worker loop: lease → scan → push, until stopped. Survives coordinator restarts."""
+    import socket
+    from concurrent.futures import ThreadPoolExecutor
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    base      = coordinator.rstrip('/') + '/api/shard'
+    backoff   = 2
+    print(f"  🛠 Worker {worker_id} → {coordinator}  ({SCAN_WORKERS} threads)")
+    while not (stop and stop.is_set()):
+        try:
+            job = requests.get(f'{base}/lease', params={'worker': worker_id}, timeout=15).json()
+            backoff = 2
+        except Exception as e:
+            print(f"  ⚠ Coordinator unreachable ({e}) — retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(60, backoff * 2)
+            continue
+        if job.get('shard') is None:
+            time.sleep(job.get('wait', 10))
+            continue
+
+        params = {'job': job['job'], 'shard': job['shard'], 'lease': job['lease']}
+        done   = threading.Event()
+        def _heartbeat():
+            while not done.wait(job['lease_sec'] / 3):
+                try: requests.get(f'{base}/renew', params=params, timeout=10)
+                except Exception: pass
+        threading.Thread(target=_heartbeat, daemon=True).start()
+
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as ex:
+            scanned = list(ex.map(lambda it: _scan_one(it['ticker'], prefiltered_mcap=it['mcap']),
+                                  job['tickers']))
+        done.set()
+        results = [r for r in scanned if r]
+        body = json.dumps({**params, 'worker': worker_id, 'results': results},
+                          default=lambda o: o.item() if hasattr(o, 'item') else str(o))
+        for attempt in range(3):
+            try:
+                requests.post(f'{base}/done', data=body.encode('utf-8'), timeout=30,
+                              headers={'Content-Type': 'application/json'})
+                break
+            except Exception as e:
+                print(f"  ⚠ Result push failed ({e}) — retry {attempt + 1}/3")
+                time.sleep(2 * (attempt + 1))
+        print(f"  ✅ Shard {job['shard']}: {len(results)}/{len(job['tickers'])} in range "
+              f"({time.time() - t0:.0f}s)")
+
 # ════════════════════════════════════════════════════════════════════
 # PRICE REFRESH (market hours — fast, no history re-fetch)
 # ════════════════════════════════════════════════════════════════════
-def refresh_prices():
+def refresh_prices(tickers=None):
+    """Refresh live prices. tickers=None refreshes the whole universe; otherwise only
+    the given tickers are fetched and patched in place (used by the tiered scheduler)."""
     with state_lock:
         stocks = list(state['stocks'])
+    partial = tickers is not None
+    if partial:
+        wanted = set(tickers)
+        stocks = [s for s in stocks if s['ticker'] in wanted]
     if not stocks:
-        return
+        return 0
 
     _t0 = time.time()
     with state_lock:
         state['ctrl']['price_update']['running'] = True
 
-    BATCH_SIZE  = 100
     MAX_WORKERS = 5
 
     tickers_ns = [s['ticker'] + '.NS' for s in stocks]
-    batches    = [tickers_ns[i:i+BATCH_SIZE] for i in range(0, len(tickers_ns), BATCH_SIZE)]
-    print(f"  🔄 Refreshing {len(stocks)} prices ({len(batches)} batches × {MAX_WORKERS} workers)...")
+    batches    = [tickers_ns[i:i+PRICE_BATCH_SIZE] for i in range(0, len(tickers_ns), PRICE_BATCH_SIZE)]
+    if not partial:
+        print(f"  🔄 Refreshing {len(stocks)} prices ({len(batches)} batches × {MAX_WORKERS} workers)...")
 
-    # Shared dict: ticker_ns -> (price, prev_close)
+    # Shared dict: ticker_ns -> (price, prev_close, day_volume)
     price_map = {}
     import threading
     map_lock  = threading.Lock()
 
     def fetch_batch(batch):
         try:
-            data = yf.download(batch, period='5d', interval='1d',
-                               auto_adjust=True, progress=False, threads=False)
+            with timed('yf.download'):
+                data = provider.download(batch, '5d')
             if data.empty:
                 return
             close = data['Close']  # MultiIndex → DataFrame with tickers as columns
+            volume = data['Volume'] if 'Volume' in data else None
             for ticker in batch:
                 try:
                     vals = close[ticker].dropna()
                     if len(vals) < 2:
                         continue
+                    dvol = 0.0
+                    if volume is not None:
+                        v = volume[ticker].dropna()
+                        dvol = float(v.iloc[-1]) if len(v) else 0.0
                     with map_lock:
-                        price_map[ticker] = (float(vals.iloc[-1]), float(vals.iloc[-2]))
+                        price_map[ticker] = (float(vals.iloc[-1]), float(vals.iloc[-2]), dvol)
                 except:
                     pass
         except Exception as e:
@@ -887,15 +2813,20 @@ def refresh_prices():
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
         list(ex.map(fetch_batch, batches))
 
+    _tm = time.perf_counter()
     updated = 0
+    bar_minute = session_minute() if get_market_mode() == 'open' else None
     for s in stocks:
         ns = s['ticker'] + '.NS'
         if ns not in price_map:
             continue
         try:
-            price, prev = price_map[ns]
+            price, prev, dvol = price_map[ns]
             if math.isnan(price):
                 continue
+            if bar_minute is not None:
+                record_intraday(s['ticker'], bar_minute, price, dvol)
+                s['intradayVpb'] = calc_intraday_signals(s).get('provisional_vpb', 'none')
             prev   = prev or s['price']
             change = round((price - prev) / prev * 100, 2) if prev else s['change']
             s['price']  = round(price, 2)
@@ -932,8 +2863,11 @@ def refresh_prices():
                 'near_52high':        s.get('near52High'),
                 'macd':               s.get('macd'),
                 'golden':             s.get('golden'),
+                'w_trend':            s.get('wTrend'),
+                'm_trend':            s.get('mTrend'),
             } if s.get('rsi') is not None else None
-            sc, f, c, t, ct, l = score(s.get('pe'), s.get('debtEq'), s.get('roe'), s.get('dailyVol'), tech)
+            sc, f, c, t, ct, l = score(s.get('pe'), s.get('debtEq'), s.get('roe'), s.get('dailyVol'), tech,
+                                       s.get('rsRating'))
             s['score']   = sc
             s['fScore']  = f
             s['cScore']  = c
@@ -943,13 +2877,25 @@ def refresh_prices():
             updated += 1
         except:
             pass
+    # Stamp every attempt (not just successes) so a dead ticker can't hog the tier budget
+    for s in stocks:
+        price_stamps[s['ticker']] = _t0
+    observe('stage', 'price_merge', time.perf_counter() - _tm)
+    breadth_update(stocks)
+    with timed('check_alerts'):
+        check_alerts(stocks)
 
     ist = get_ist()
     with state_lock:
-        state['stocks']       = stocks
+        if not partial:
+            state['stocks']   = stocks
         state['last_updated'] = ist.strftime('%d %b %Y, %I:%M %p IST')
         state['market_mode']  = get_market_mode()
         state['status']       = 'live'
+    if partial:
+        with state_lock:
+            state['ctrl']['price_update']['running'] = False
+        return updated
     print(f"  ✅ {updated} prices updated at {ist.strftime('%H:%M:%S')} IST")
     with state_lock:
         state['ctrl']['price_update'].update({
@@ -958,9 +2904,331 @@ def refresh_prices():
             'elapsed_sec': round(time.time() - _t0, 1),
             'workers':    MAX_WORKERS,
             'batches':    len(batches),
-            'batch_size': BATCH_SIZE,
+            'batch_size': PRICE_BATCH_SIZE,
             'running':    False,
         })
+    return updated
+
+# ════════════════════════════════════════════════════════════════════
+# INTRADAY BARS
+# Every live price poll is folded into a per-ticker ring of 1-minute OHLCV
+# bars for the current session (5-minute bars are rolled up on read).
+# Fixed memory: INTRADAY_CAPACITY slots per ticker, typed arrays, no pandas.
+# ════════════════════════════════════════════════════════════════════
+SESSION_OPEN_MIN   = 9*60 + 15
+SESSION_MINUTES    = 375            # 9:15 → 15:30
+INTRADAY_CAPACITY  = SESSION_MINUTES
+
+class IntradayRing:
+    """Ring buffer of 1-minute bars. Slots are overwritten oldest-first once full."""
+    __slots__ = ('day', 'minute', 'o', 'h', 'l', 'c', 'v', 'head', 'size', 'last_cumvol')
+
+    def __init__(self, capacity=INTRADAY_CAPACITY):
+        self.day    = None
+        self.minute = array('h', bytes(2 * capacity))
+        self.o      = array('f', bytes(4 * capacity))
+        self.h      = array('f', bytes(4 * capacity))
+        self.l      = array('f', bytes(4 * capacity))
+        self.c      = array('f', bytes(4 * capacity))
+        self.v      = array('f', bytes(4 * capacity))
+        self.head   = -1
+        self.size   = 0
+        self.last_cumvol = 0.0
+
+    def add(self, day, minute, price, cumvol):
+        if day != self.day:
+            self.day, self.head, self.size, self.last_cumvol = day, -1, 0, 0.0
+        dv = max(0.0, cumvol - self.last_cumvol) if cumvol else 0.0
+        if cumvol:
+            self.last_cumvol = cumvol
+        i = self.head
+        if self.size and self.minute[i] == minute:
+            if price > self.h[i]: self.h[i] = price
+            if price < self.l[i]: self.l[i] = price
+            self.c[i]  = price
+            self.v[i] += dv
+            return
+        if self.size and minute < self.minute[i]:
+            return   # out-of-order poll — drop
+        cap = len(self.minute)
+        i = self.head = (self.head + 1) % cap
+        self.size = min(cap, self.size + 1)
+        self.minute[i] = minute
+        self.o[i] = self.h[i] = self.l[i] = self.c[i] = price
+        self.v[i] = dv
+
+    def bars(self, step=1):
+        """Oldest→newest bars aggregated into `step`-minute buckets.
+        Returns list of [minute, open, high, low, close, volume]."""
+        cap, out = len(self.minute), []
+        start = (self.head - self.size + 1) % cap
+        for k in range(self.size):
+            i = (start + k) % cap
+            m = self.minute[i] - self.minute[i] % step
+            if out and out[-1][0] == m:
+                b = out[-1]
+                b[2] = max(b[2], self.h[i]); b[3] = min(b[3], self.l[i])
+                b[4] = self.c[i];            b[5] += self.v[i]
+            else:
+                out.append([m, self.o[i], self.h[i], self.l[i], self.c[i], self.v[i]])
+        return out
+
+    def session(self):
+        """Whole session so far as one bar: (open, high, low, last, volume) or None."""
+        if not self.size:
+            return None
+        bars = self.bars()
+        return (bars[0][1], max(b[2] for b in bars), min(b[3] for b in bars),
+                bars[-1][4], sum(b[5] for b in bars))
+
+intraday      = {}   # ticker -> IntradayRing
+intraday_lock = threading.Lock()
+
+def session_minute():
+    d = get_ist()
+    return max(0, min(SESSION_MINUTES - 1, d.hour * 60 + d.minute - SESSION_OPEN_MIN))
+
+def minute_to_hhmm(minute):
+    m = SESSION_OPEN_MIN + minute
+    return f'{m // 60:02d}:{m % 60:02d}'
+
+def record_intraday(ticker, minute, price, cumvol=0.0):
+    day = get_ist().date().isoformat()
+    with intraday_lock:
+        ring = intraday.get(ticker)
+        if ring is None:
+            ring = intraday[ticker] = IntradayRing()
+        ring.add(day, minute, float(price), float(cumvol or 0.0))
+
+def get_intraday_bars(ticker, step=1):
+    with intraday_lock:
+        ring = intraday.get(ticker)
+        if ring is None:
+            return None, []
+        return ring.day, ring.bars(step)
+
+def calc_intraday_signals(s):
+    """Provisional signals for today's still-forming candle, from the intraday ring
+    plus stored EOD fields — no history fetch. Mirrors the VPB trigger rules in
+    calc_technicals(): the setup (coiling) comes from yesterday's EOD run, the
+    trigger (volume ratio + close position) from the session so far."""
+    with intraday_lock:
+        ring = intraday.get(s['ticker'])
+        sess = ring.session() if ring else None
+    if not sess:
+        return {}
+    o, h, l, c, v = sess
+    price     = s.get('price') or c
+    avg_vol   = s.get('avgVol20')
+    if not avg_vol:   # stocks scanned before avgVol20 existed: ₹ Cr back to shares
+        avg_vol = (s.get('dailyVol') or 0) * 1e7 / price if price else 0
+    # Scale by session progress so a half-day volume isn't compared to a full day
+    progress  = (session_minute() + 1) / SESSION_MINUTES
+    vol_ratio = v / (avg_vol * progress + 1e-10) if avg_vol else 0.0
+    close_pos = (c - l) / (h - l + 1e-10)
+    provisional = 'none'
+    if s.get('vpbDetail') == 'coiling':
+        if vol_ratio >= 1.5 and close_pos >= 0.6:   provisional = 'breakout'
+        elif vol_ratio >= 1.5 and close_pos < 0.3:  provisional = 'distribution'
+        elif vol_ratio >= 1.0:                      provisional = 'weak_breakout'
+    elif vol_ratio >= 2.0 and close_pos >= 0.7:
+        provisional = 'vol_only'
+    return {
+        'open':            round(o, 2),
+        'high':            round(h, 2),
+        'low':             round(l, 2),
+        'last':            round(c, 2),
+        'volume':          int(v),
+        'range_pct':       round((h - l) / (l + 1e-10) * 100, 2),
+        'vol_ratio':       round(vol_ratio, 2),
+        'close_pos':       round(close_pos, 2),
+        'provisional_vpb': provisional,
+    }
+
+# ════════════════════════════════════════════════════════════════════
+# WATCHLIST + PRICE TIERS
+# hot  = watchlist names          every HOT_REFRESH  sec
+# warm = top score / live stages  every WARM_REFRESH sec
+# cold = everything else          every LIVE_REFRESH sec
+# The budget is the flat cadence's ticker rate (universe / LIVE_REFRESH),
+# paid out in whole PRICE_BATCH_SIZE downloads: ticks are skipped until a
+# full batch has accrued, so the provider sees no more calls per LIVE_REFRESH
+# than the flat refresh — the cold tier stretches to make room.
+# ════════════════════════════════════════════════════════════════════
+WATCHLIST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'watchlist.json')
+
+price_stamps = {}   # ticker -> epoch of last price refresh attempt
+price_credit = {'tickers': 0.0, 'at': None}   # accrued tick budget (scheduler thread only)
+
+def load_watchlist():
+    try:
+        if os.path.exists(WATCHLIST_FILE):
+            with open(WATCHLIST_FILE) as f:
+                wl = json.load(f).get('tickers', [])
+            with state_lock:
+                state['watchlist'] = wl
+            print(f"  ⭐ Watchlist loaded — {len(wl)} tickers")
+    except Exception as e:
+        print(f"  ⚠ Watchlist load error: {e}")
+
+def save_watchlist():
+    try:
+        with state_lock:
+            data = {'saved_at': get_ist().isoformat(), 'tickers': list(state['watchlist'])}
+        with open(WATCHLIST_FILE, 'w') as f:
+            json.dump(data, f)
+    except Exception as e:
+        print(f"  ⚠ Watchlist save failed: {e}")
+
+def price_tiers(stocks, watchlist):
+    """Split tickers into hot/warm/cold. Returns {ticker: tier}."""
+    wl   = set(watchlist)
+    top  = sorted(stocks, key=lambda s: s.get('score', 0), reverse=True)[:WARM_TOP_N]
+    warm = {s['ticker'] for s in top}
+    warm.update(s['ticker'] for s in stocks if s.get('stage') in WARM_STAGES)
+    tiers = {}
+    for s in stocks:
+        t = s['ticker']
+        tiers[t] = 'hot' if t in wl else 'warm' if t in warm else 'cold'
+    return tiers
+
+TIER_INTERVAL = {'hot': HOT_REFRESH, 'warm': WARM_REFRESH, 'cold': LIVE_REFRESH}
+
+def pick_due_tickers(stocks, watchlist, now):
+    """Choose which tickers to refresh this tick, within the flat-cadence budget.
+    Budget accrues at universe / LIVE_REFRESH tickers a second and is spent in
+    whole batches (a call costs a full batch however few it carries), so a tick
+    with less than one batch accrued picks nothing. Due tickers are ranked by
+    how overdue they are relative to their own tier interval, so hot names win
+    ties but the cold tier can never starve."""
+    tiers = price_tiers(stocks, watchlist)
+    batch = max(1, min(PRICE_BATCH_SIZE, len(stocks)))
+    rate  = len(stocks) / LIVE_REFRESH
+    c     = price_credit
+    # Start with one batch; after a pause carry at most a tick's worth beyond it
+    credit = batch if c['at'] is None else c['tickers'] + rate * (now - c['at'])
+    credit = min(credit, batch + rate * PRICE_TICK_SEC)
+    budget = int(credit // batch) * batch
+    due    = []
+    if budget:
+        for t, tier in tiers.items():
+            age = now - price_stamps.get(t, 0)
+            ratio = age / TIER_INTERVAL[tier]
+            if ratio >= 1:
+                due.append((ratio, t))
+        due.sort(reverse=True)
+    picked = [t for _, t in due[:budget]]
+    credit -= math.ceil(len(picked) / batch) * batch
+    c.update(tickers=credit, at=now)
+    return picked, tiers, budget
+
+def refresh_due_prices():
+    """One scheduler tick of the tiered price refresh."""
+    with state_lock:
+        stocks    = list(state['stocks'])
+        watchlist = list(state['watchlist'])
+        running   = state['ctrl']['price_update'].get('running', False)
+    if not stocks or running:
+        return
+    now = time.time()
+    picked, tiers, budget = pick_due_tickers(stocks, watchlist, now)
+    if picked:
+        refresh_prices(picked)
+
+    now = time.time()
+    summary = {}
+    for tier in ('hot', 'warm', 'cold'):
+        ages = [now - price_stamps.get(t, 0) for t, tr in tiers.items() if tr == tier]
+        summary[tier] = {
+            'interval': TIER_INTERVAL[tier],
+            'count':    len(ages),
+            'max_age':  round(max(ages), 0) if ages and max(ages) < 86400 else None,
+        }
+    with state_lock:
+        state['ctrl']['price_tiers'].update(summary)
+        state['ctrl']['price_tiers'].update({
+            'last_tick': get_ist().isoformat(),
+            'budget':    budget,
+            'picked':    len(picked),
+            'watchlist': len(watchlist),
+        })
+
+# ════════════════════════════════════════════════════════════════════
+# INDEX QUOTES
+# The indices bar is served from memory. A background thread refreshes the
+# whole INDEX_LIST in one batched call every INDEX_TTL seconds (slower
+# outside market hours). Concurrent refreshes coalesce on index_fetch_lock:
+# the first caller fetches, later ones wait for it and reuse its result.
+# ════════════════════════════════════════════════════════════════════
+index_cache      = {'quotes': {}, 'fetched_at': 0.0, 'failed_at': 0.0, 'error': None}
+index_lock       = threading.Lock()   # guards index_cache
+index_fetch_lock = threading.Lock()   # at most one Yahoo fetch in flight
+
+def index_ttl():
+    return INDEX_TTL if get_market_mode() == 'open' else INDEX_TTL_CLOSED
+
+def _indices_fresh(now):
+    with index_lock:
+        c = dict(index_cache)
+    if c['error'] and now - c['failed_at'] < INDEX_RETRY_SEC:
+        return True
+    return now - c['fetched_at'] < index_ttl()
+
+def refresh_indices():
+    """Fetch every INDEX_LIST quote in one call unless the cache is still fresh."""
+    if _indices_fresh(time.time()):
+        return False
+    with index_fetch_lock:
+        if _indices_fresh(time.time()):
+            with state_lock:
+                state['ctrl']['indices']['coalesced'] += 1
+            return False
+        try:
+            with timed('index_quotes'):
+                quotes = provider.quotes([sym for sym, _ in INDEX_LIST])
+            result = {}
+            for sym, name in INDEX_LIST:
+                q = quotes.get(sym)
+                if not q:
+                    continue
+                last = q.get('last') or 0
+                prev = q.get('prev') or last
+                result[name] = {'price': round(last, 2),
+                                'change': round((last - prev) / prev * 100, 2) if prev else 0}
+            if not result:
+                raise ValueError('no index quotes returned')
+            with index_lock:
+                index_cache.update(quotes=result, fetched_at=time.time(), error=None)
+            with state_lock:
+                ix = state['ctrl']['indices']
+                ix['last_fetch'] = get_ist().isoformat()
+                ix['count']      = len(result)
+                ix['fetches']   += 1
+                ix['error']      = None
+            return True
+        except Exception as e:
+            with index_lock:
+                index_cache.update(failed_at=time.time(), error=str(e))
+            with state_lock:
+                state['ctrl']['indices']['errors'] += 1
+                state['ctrl']['indices']['error']   = str(e)
+            print(f"  ⚠ Index quote refresh failed: {e}")
+            return False
+
+def get_indices():
+    """Cached quotes, instantly. A stale cache kicks a background refresh (coalesced)."""
+    if not _indices_fresh(time.time()) and not index_fetch_lock.locked():
+        threading.Thread(target=refresh_indices, daemon=True).start()
+    with index_lock:
+        return dict(index_cache['quotes']), index_cache['error']
+
+def index_refresher():
+    while True:
+        try:
+            refresh_indices()
+        except Exception as e:
+            print(f"  ⚠ Index refresher error: {e}")
+        time.sleep(min(INDEX_TTL, INDEX_RETRY_SEC))
 
 # ════════════════════════════════════════════════════════════════════
 # EOD TECHNICAL REFRESH
@@ -979,6 +3247,9 @@ def refresh_technicals():
         state['ctrl']['technicals']['running'] = True
 
     print(f"\n  📐 EOD: Refreshing technicals for {len(stocks)} stocks (parallel, {SCAN_WORKERS} workers)...")
+    if hasattr(provider, 'refresh'):
+        provider.refresh()   # bhavcopy: today's bars for the whole universe from one file
+    served0 = getattr(provider, 'served', 0)
     updated_count = [0]
     counter = [0]
     results_lock = threading.Lock()
@@ -988,10 +3259,15 @@ def refresh_technicals():
 
     def _refresh_one(s):
         try:
-            hist = yf.Ticker(s['ticker'] + '.NS').history(period='1y', auto_adjust=True)
+            with timed('t.history'):
+                hist = provider.history(s['ticker'] + '.NS', '1y')
             if hist is None or len(hist) < 30:
                 return None
-            tech = calc_technicals(hist)
+            rs_capture(s['ticker'], hist)
+            prices_record(s['ticker'], hist)
+            with timed('calc_technicals'):
+                # weekly / monthly from the matrix's full row — the 1y fetch is too short for monthly
+                tech = calc_technicals(hist, prices_frame(s['ticker']))
             if not tech:
                 return None
 
@@ -1012,6 +3288,10 @@ def refresh_technicals():
             updates['vpbScore']     = tech['vpb_score']
             updates['vpbDetail']    = tech['vpb_detail']
             updates['near52High']   = tech['near_52high']
+            updates['ema50']        = tech['ema50']
+            updates['avgVol20']     = tech['avg_vol20']
+            updates.update(mtf_fields(tech))
+            updates['intradayVpb']  = 'none'   # provisional signal superseded by the EOD candle
             updates['stage']        = classify_stage(tech)
             # Recompute MM target and upside from fresh history
             vpb_rh    = tech.get('vpb_range_height', 0.0)
@@ -1024,12 +3304,10 @@ def refresh_technicals():
             updates['targetType']  = target_type
             updates['upsidePct']   = upside_pct
             updates['upsideRs']    = upside_rs
-            # update chart data
-            h60 = hist.tail(60)
-            updates['chartDates']  = [d.strftime('%Y-%m-%d') for d in h60.index]
-            updates['chartPrices'] = [round(float(p), 2) for p in h60['Close'].values]
             # recalculate score
-            sc, f, c, t, ct, l = score(s.get('pe'), s.get('debtEq'), s.get('roe'), s.get('dailyVol'), tech)
+            with timed('score'):
+                sc, f, c, t, ct, l = score(s.get('pe'), s.get('debtEq'), s.get('roe'), s.get('dailyVol'), tech,
+                                           s.get('rsRating'))
             updates['score']   = sc
             updates['fScore']  = f
             updates['cScore']  = c
@@ -1054,6 +3332,13 @@ def refresh_technicals():
     with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as ex:
         list(ex.map(worker, stocks))
 
+    compute_relative_strength(list(stocks_by_ticker.values()))
+    prices_publish()
+    detect_patterns(list(stocks_by_ticker.values()))
+    corr_update(list(stocks_by_ticker.values()))
+    plan_publish(list(stocks_by_ticker.values()))
+    breadth_update(stocks_by_ticker.values())
+    check_alerts(stocks_by_ticker.values())
     with state_lock:
         state['stocks'] = list(stocks_by_ticker.values())
     print(f"  ✅ EOD technicals refreshed for {updated_count[0]} stocks")
@@ -1062,11 +3347,764 @@ def refresh_technicals():
             'last_run':    get_ist().isoformat(),
             'elapsed_sec': round(time.time() - _t0, 1),
             'workers':     SCAN_WORKERS,
-            'yahoo_calls': counter[0],
+            'yahoo_calls': counter[0] - (getattr(provider, 'served', 0) - served0),
             'updated':     updated_count[0],
             'running':     False,
         })
 
+# ════════════════════════════════════════════════════════════════════
+# RELATIVE STRENGTH vs NIFTY
+# Every history fetch (scan / EOD technicals) leaves its last RS_KEEP closes
+# in rs_closes. At publish time those are laid onto the benchmark's trading
+# days as one (stocks × days) matrix; returns, relative performance and
+# percentile ranks for all horizons come out of a handful of array ops.
+# ════════════════════════════════════════════════════════════════════
+RS_KEEP   = max(d for _, d, _ in RS_HORIZONS) + 1
+rs_closes = {}   # ticker -> (day numbers int32, closes float64), last RS_KEEP sessions
+rs_lines  = {}   # ticker -> RS line (stock / benchmark, rebased to 100), last RS_LINE_DAYS
+rs_lock   = threading.Lock()
+
+def _day_numbers(index):
+    if getattr(index, 'tz', None) is not None:
+        index = index.tz_localize(None)   # keep exchange-local dates
+    return index.values.astype('datetime64[D]').astype(np.int32)
+
+def rs_capture(ticker, hist):
+    tail = hist['Close'].dropna().tail(RS_KEEP)
+    with rs_lock:
+        rs_closes[ticker] = (_day_numbers(tail.index), tail.values.astype(np.float64))
+
+def rs_points(rating):
+    """Score bonus for an RS rating (see RS_SCORE_POINTS)."""
+    if not RS_SCORE_POINTS or rating is None:
+        return 0
+    if rating >= 80: return RS_SCORE_POINTS
+    if rating >= 60: return RS_SCORE_POINTS // 2
+    return 0
+
+def rs_rank(x):
+    """Percentile rank 1–99 of every finite value; NaN in → NaN out."""
+    out = np.full(x.shape, np.nan)
+    ok  = np.isfinite(x)
+    n   = int(ok.sum())
+    if n:
+        order   = x[ok].argsort().argsort()
+        out[ok] = 1 + np.floor(order * 98 / max(n - 1, 1) + 0.5)
+    return out
+
+def compute_relative_strength(stocks):
+    """Set rs1m/rs3m/rs6m (% vs benchmark), rsRank* and rsRating on every stock in place."""
+    try:
+        bench = provider.history(RS_BENCHMARK, '1y')
+        b     = bench['Close'].dropna().tail(RS_KEEP)
+        if len(b) < RS_KEEP:
+            raise ValueError(f'only {len(b)} benchmark sessions')
+    except Exception as e:
+        print(f"  ⚠ RS skipped — {RS_BENCHMARK} history unavailable: {e}")
+        return 0
+    t0   = time.perf_counter()
+    grid = _day_numbers(b.index)
+    bc   = b.values.astype(np.float64)
+    G, n = len(grid), len(stocks)
+    with rs_lock:
+        series = [rs_closes.get(s['ticker']) for s in stocks]
+
+    # Aligned close matrix; days a stock didn't trade are forward-filled
+    M = np.full((n, G), np.nan)
+    for i, sr in enumerate(series):
+        if sr is None:
+            continue
+        days, closes = sr
+        pos = np.searchsorted(grid, days)
+        ok  = (pos < G) & (grid[np.minimum(pos, G - 1)] == days)
+        M[i, pos[ok]] = closes[ok]
+    fill = np.where(np.isfinite(M), np.arange(G), 0)
+    np.maximum.accumulate(fill, axis=1, out=fill)
+    M = M[np.arange(n)[:, None], fill]
+
+    cols, composite = {}, np.zeros(n)
+    for label, days, weight in RS_HORIZONS:
+        rel = (M[:, -1] / M[:, -1 - days]) / (bc[-1] / bc[-1 - days]) * 100 - 100
+        cols['rs' + label]     = rel
+        cols['rsRank' + label] = rs_rank(rel)
+        composite += weight * rel
+    rating = rs_rank(composite)
+    line   = M[:, -RS_LINE_DAYS:] / bc[-RS_LINE_DAYS:]
+    line   = np.round(line / line[:, :1] * 100, 2)
+
+    # Back to plain Python values (NaN → None) in bulk, then one pass over the dicts
+    cols   = {k: [None if x != x else (int(x) if k.startswith('rsRank') else x)
+                  for x in (v if k.startswith('rsRank') else np.round(v, 1)).tolist()]
+              for k, v in cols.items()}
+    rating = [None if x != x else int(x) for x in rating.tolist()]
+    observe('stage', 'relative_strength', time.perf_counter() - t0)
+
+    ranked, lines = 0, {}
+    for i, s in enumerate(stocks):
+        for k, v in cols.items():
+            s[k] = v[i]
+        new = rating[i]
+        # score() already counted rs_points(old rating) — swap in the new one
+        delta = rs_points(new) - rs_points(s.get('rsRating'))
+        if delta:
+            s['tScore'] = s.get('tScore', 0) + delta
+            s['score']  = min(100, s.get('fScore', 0) + s['tScore'] + s.get('cScore', 0))
+        s['rsRating'] = new
+        if new is not None:
+            ranked += 1
+            lines[s['ticker']] = line[i].tolist()
+    with rs_lock:
+        rs_lines.clear()
+        rs_lines.update(lines)
+    print(f"  📈 RS vs {RS_BENCHMARK}: {ranked}/{n} ranked in {(time.perf_counter() - t0) * 1e3:.0f} ms")
+    return ranked
+
+# ════════════════════════════════════════════════════════════════════
+# BREADTH — universe / sector / MCap-segment aggregates
+# Each stock contributes one small tuple. A publish compares the new tuple
+# with the stored one and, when it changed, subtracts the old contribution
+# and adds the new one, so a price tick costs O(changed stocks) and the
+# aggregates are never recomputed from scratch (except on a full rescan
+# or cache load, which replace the whole universe).
+# ════════════════════════════════════════════════════════════════════
+MCAP_SEGMENTS = ('micro', 'mid', 'large')
+
+class _Agg:
+    __slots__ = ('n', 'adv', 'dec', 'above', 'known', 'score', 'change')
+
+    def __init__(self):
+        self.n = self.adv = self.dec = self.above = self.known = 0
+        self.score = self.change = 0.0
+
+    def add(self, c, sign):
+        score_, change, above = c[3], c[4], c[5]
+        self.n      += sign
+        self.score  += sign * score_
+        self.change += sign * change
+        if change > 0:   self.adv += sign
+        elif change < 0: self.dec += sign
+        if above is not None:
+            self.known += sign
+            self.above += sign * above
+
+    def summary(self):
+        n = self.n or 1
+        return {'count': self.n, 'advances': self.adv, 'declines': self.dec,
+                'unchanged': self.n - self.adv - self.dec,
+                'avgScore': round(self.score / n, 1), 'avgChange': round(self.change / n, 2),
+                'aboveEma50': self.above,
+                'aboveEma50Pct': round(self.above / self.known * 100, 1) if self.known else None}
+
+breadth      = {'contrib': {}, 'total': _Agg(), 'sectors': {}, 'segments': {}, 'stages': {},
+                'deltas': 0, 'updated_at': None}
+breadth_lock = threading.Lock()
+
+def _mcap_segment(mcap):
+    """Same ₹ Cr cut-offs as the UI's MCap filter."""
+    return 'micro' if mcap < 100 else 'mid' if mcap <= 10_000 else 'large'
+
+def _breadth_contrib(s):
+    """(sector, segment, stage, score, change, above_ema50) — everything breadth reads."""
+    ema50 = s.get('ema50')
+    price = s.get('price') or 0
+    return (s.get('sector') or 'Unknown', _mcap_segment(s.get('mcap') or 0), s.get('stage') or 'none',
+            float(s.get('score') or 0), float(s.get('change') or 0),
+            (price > ema50) if ema50 else None)
+
+def _breadth_apply(c, sign):
+    breadth['total'].add(c, sign)
+    breadth['sectors'].setdefault(c[0], _Agg()).add(c, sign)
+    breadth['segments'].setdefault(c[1], _Agg()).add(c, sign)
+    breadth['stages'][c[2]] = breadth['stages'].get(c[2], 0) + sign
+
+def breadth_update(stocks):
+    """Fold in the stocks that were just published. Unchanged ones cost one tuple compare."""
+    t0 = time.perf_counter()
+    with breadth_lock:
+        contrib = breadth['contrib']
+        for s in stocks:
+            new = _breadth_contrib(s)
+            old = contrib.get(s['ticker'])
+            if new == old:
+                continue
+            if old is not None:
+                _breadth_apply(old, -1)
+            _breadth_apply(new, 1)
+            contrib[s['ticker']] = new
+            breadth['deltas'] += 1
+        breadth['updated_at'] = get_ist().isoformat()
+    observe('stage', 'breadth_update', time.perf_counter() - t0)
+
+def breadth_rebuild(stocks):
+    """Start over — for publishes that replace the universe (full scan, cache load)."""
+    with breadth_lock:
+        breadth.update(contrib={}, total=_Agg(), sectors={}, segments={}, stages={})
+    breadth_update(stocks)
+
+def breadth_snapshot():
+    with breadth_lock:
+        total   = breadth['total'].summary()
+        sectors = [dict(sector=k, **a.summary()) for k, a in breadth['sectors'].items() if a.n]
+        return {
+            **total,
+            'adRatio':    round(total['advances'] / total['declines'], 2) if total['declines'] else None,
+            'stages':     {k: v for k, v in breadth['stages'].items() if v},
+            'sectors':    sorted(sectors, key=lambda x: -x['avgScore']),
+            'segments':   {name: breadth['segments'][name].summary()
+                           for name in MCAP_SEGMENTS if name in breadth['segments']},
+            'deltas':     breadth['deltas'],
+            'updated_at': breadth['updated_at'],
+        }
+
+# ════════════════════════════════════════════════════════════════════
+# ALERTS
+# Rules live in alerts.json. Price and score rules sit in sorted per-ticker
+# level lists (ticker '*' = any stock), one list per (kind, direction).
+# A move old → new fires exactly the levels in between, found with two
+# bisects. Stage / VPB rules are keyed by target, so they're dict lookups.
+# Stocks that didn't move cost one tuple compare. Fired alerts go to the
+# log file and to every open /api/alerts/stream (Server-Sent Events).
+# ════════════════════════════════════════════════════════════════════
+ALERTS_FILE    = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alerts.json')
+ALERT_LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alerts_log.jsonl')
+ALERT_KINDS    = ('price', 'score', 'stage', 'vpb')
+ALERT_RECENT   = 200
+
+alert_rules  = {}    # id -> rule dict
+alert_levels = {}    # (kind, op, ticker) -> ([levels…], [ids…]) kept sorted by level
+alert_events = {}    # (kind, ticker) -> {target: [ids…]}  target None = any change
+alert_last   = {}    # ticker -> (price, score, stage, vpb) as of the previous publish
+alert_recent = []    # newest last, capped at ALERT_RECENT
+alert_seq    = [0]
+alert_lock   = threading.Lock()
+
+def _vpb_state(s):
+    return 'breakout' if 'breakout' in (s.get('vpbDetail'), s.get('intradayVpb')) else 'none'
+
+def _index_rule(r):
+    if r['kind'] in ('price', 'score'):
+        levels, ids = alert_levels.setdefault((r['kind'], r['op'], r['ticker']), ([], []))
+        i = bisect.bisect_right(levels, r['level'])
+        levels.insert(i, r['level'])
+        ids.insert(i, r['id'])
+    else:
+        alert_events.setdefault((r['kind'], r['ticker']), {}).setdefault(r.get('target'), []).append(r['id'])
+
+def _unindex_rule(r):
+    if r['kind'] in ('price', 'score'):
+        levels, ids = alert_levels.get((r['kind'], r['op'], r['ticker']), ([], []))
+        i = bisect.bisect_left(levels, r['level'])
+        while i < len(levels) and levels[i] == r['level']:
+            if ids[i] == r['id']:
+                del levels[i], ids[i]
+                return
+            i += 1
+    else:
+        bucket = alert_events.get((r['kind'], r['ticker']), {}).get(r.get('target'), [])
+        if r['id'] in bucket:
+            bucket.remove(r['id'])
+
+def load_alerts():
+    try:
+        if os.path.exists(ALERTS_FILE):
+            with open(ALERTS_FILE) as f:
+                rules = json.load(f).get('rules', [])
+            with alert_lock:
+                for r in rules:
+                    alert_rules[r['id']] = r
+                    if r.get('active', True):
+                        _index_rule(r)
+            print(f"  🔔 Alerts: {len(rules)} rules loaded")
+    except Exception as e:
+        print(f"  ⚠ Alerts load error: {e}")
+
+def save_alerts():
+    try:
+        with alert_lock:
+            rules = list(alert_rules.values())
+        with open(ALERTS_FILE, 'w') as f:
+            json.dump({'saved_at': get_ist().isoformat(), 'rules': rules}, f)
+    except Exception as e:
+        print(f"  ⚠ Alerts save error: {e}")
+
+def add_alert(q):
+    """q: query params — ticker, kind, and op+level (price/score) or target (stage).
+    Returns (rule, error)."""
+    kind   = q.get('kind', 'price')
+    ticker = (q.get('ticker') or '').upper().strip()
+    if kind not in ALERT_KINDS:
+        return None, f'kind must be one of {", ".join(ALERT_KINDS)}'
+    if not ticker:
+        return None, "ticker required ('*' = any stock)"
+    r = {'id': f'a{int(time.time() * 1000):x}{random.randrange(16 ** 3):03x}', 'ticker': ticker, 'kind': kind,
+         'once': q.get('once', '1') not in ('0', 'false'), 'note': q.get('note', '')[:120],
+         'active': True, 'fired': 0, 'created_at': get_ist().isoformat()}
+    if kind in ('price', 'score'):
+        if q.get('op') not in ('above', 'below'):
+            return None, "op must be 'above' or 'below'"
+        try:
+            r['op'], r['level'] = q['op'], float(q['level'])
+        except (KeyError, ValueError):
+            return None, 'numeric level required'
+    elif kind == 'stage':
+        r['target'] = q.get('target') or None
+    with alert_lock:
+        alert_rules[r['id']] = r
+        _index_rule(r)
+    save_alerts()
+    return r, None
+
+def remove_alert(rule_id):
+    with alert_lock:
+        r = alert_rules.pop(rule_id, None)
+        if r and r.get('active', True):
+            _unindex_rule(r)
+    if r:
+        save_alerts()
+    return r is not None
+
+def _describe(r, value):
+    if r['kind'] in ('price', 'score'):
+        unit = '₹' if r['kind'] == 'price' else ''
+        return f"{r['kind']} {unit}{value} crossed {r['op']} {unit}{r['level']}"
+    if r['kind'] == 'stage':
+        return f"stage → {value}"
+    return 'VPB breakout'
+
+def check_alerts(stocks):
+    """Compare each stock with its previous publish and fire the rules it crossed.
+    First sight of a ticker only records its values."""
+    fired = []
+    with alert_lock:
+        if not alert_rules:
+            for s in stocks:
+                alert_last[s['ticker']] = (s.get('price'), s.get('score'), s.get('stage'), _vpb_state(s))
+            return 0
+        for s in stocks:
+            t   = s['ticker']
+            now = (s.get('price'), s.get('score'), s.get('stage'), _vpb_state(s))
+            old = alert_last.get(t)
+            alert_last[t] = now
+            if old is None or old == now:
+                continue
+            for kind, o, n in (('price', old[0], now[0]), ('score', old[1], now[1])):
+                if o is None or n is None or o == n:
+                    continue
+                op = 'above' if n > o else 'below'
+                for key in (t, '*'):
+                    entry = alert_levels.get((kind, op, key))
+                    if not entry:
+                        continue
+                    levels, ids = entry
+                    if op == 'above':   # levels in (o, n]
+                        lo, hi = bisect.bisect_right(levels, o), bisect.bisect_right(levels, n)
+                    else:               # levels in [n, o)
+                        lo, hi = bisect.bisect_left(levels, n), bisect.bisect_left(levels, o)
+                    fired += [(ids[i], t, n) for i in range(lo, hi)]
+            if old[2] != now[2]:
+                for key in (t, '*'):
+                    targets = alert_events.get(('stage', key), {})
+                    fired += [(rid, t, now[2]) for rid in targets.get(now[2], []) + targets.get(None, [])]
+            if old[3] != now[3] and now[3] == 'breakout':
+                for key in (t, '*'):
+                    fired += [(rid, t, 'breakout') for rid in alert_events.get(('vpb', key), {}).get(None, [])]
+
+        events = []
+        for rid, t, value in fired:
+            r = alert_rules.get(rid)
+            if not r or not r.get('active', True):
+                continue
+            r['fired'] += 1
+            if r['once']:
+                r['active'] = False
+                _unindex_rule(r)
+            alert_seq[0] += 1
+            ev = {'seq': alert_seq[0], 'at': get_ist().isoformat(), 'ruleId': rid, 'ticker': t,
+                  'kind': r['kind'], 'value': value, 'note': r['note'], 'msg': f"{t}: {_describe(r, value)}"}
+            events.append(ev)
+        alert_recent.extend(events)
+        del alert_recent[:-ALERT_RECENT]
+    if events:
+        _deliver_alerts(events)
+        save_alerts()
+    return len(events)
+
+def _deliver_alerts(events):
+    try:
+        with open(ALERT_LOG_FILE, 'a', encoding='utf-8') as f:
+            for ev in events:
+                f.write(json.dumps(ev, ensure_ascii=False) + '\n')
+    except Exception as e:
+        print(f"  ⚠ Alert log write failed: {e}")
+    for ev in events:
+        print(f"  🔔 {ev['msg']}")
+        stream_push(('data: ' + json.dumps(ev, ensure_ascii=False) + '\n\n').encode('utf-8'))
+
+# ── Push channel: Server-Sent Events on sockets handed off by the HTTP handler ──
+alert_streams = []
+stream_lock   = threading.Lock()
+STREAM_PING_SEC = 20
+
+def stream_push(payload):
+    with stream_lock:
+        socks = list(alert_streams)
+    dead = []
+    for sock in socks:
+        try:
+            sock.sendall(payload)
+        except OSError:
+            dead.append(sock)
+    if dead:
+        with stream_lock:
+            for sock in dead:
+                if sock in alert_streams:
+                    alert_streams.remove(sock)
+        for sock in dead:
+            try: sock.close()
+            except OSError: pass
+
+def stream_open(sock):
+    sock.settimeout(5)   # a stalled browser must not stall the price refresh
+    with stream_lock:
+        alert_streams.append(sock)
+        first = len(alert_streams) == 1
+    if first and not any(t.name == 'alert-ping' for t in threading.enumerate()):
+        threading.Thread(target=_stream_keepalive, name='alert-ping', daemon=True).start()
+
+def _stream_keepalive():
+    while True:
+        time.sleep(STREAM_PING_SEC)
+        stream_push(b': ping\n\n')
+
+# ════════════════════════════════════════════════════════════════════
+# SCORE HISTORY — one append-only snapshot per trading day
+# history/<column>.bin are flat little-endian arrays (tid int32, stage int8,
+# the rest float32), one row per stock per day; a day's rows are contiguous.
+# history/index.json (tickers + [day, first_row, rows] per day) is rewritten
+# after the columns, so it doubles as the commit record: rows past the last
+# committed day are ignored and overwritten. Columns are memory-mapped, so
+# years of snapshots cost page cache, not heap. A per-ticker row index (one
+# stable argsort of tid) makes /api/history/<T> a slice + gather, and a day's
+# stages scatter into a dense tid-indexed array for "what changed" diffs.
+# ════════════════════════════════════════════════════════════════════
+HISTORY_DIR    = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history')
+HISTORY_FIELDS = ('price', 'score', 'fScore', 'tScore', 'cScore', 'rsi', 'adx', 'rsRating')
+HISTORY_STAGES = ('none', 'trending', 'coiling', 'breakout', 'pre_cross', 'post_cross', 'pullback')  # low → high
+HISTORY_BREAKOUT = HISTORY_STAGES.index('breakout')
+HISTORY_COLUMNS  = {'tid': '<i4', 'stage': 'i1', **{f: '<f4' for f in HISTORY_FIELDS}}
+
+history = {'tickers': [], 'tid': {}, 'days': [], 'cols': {}, 'order': None, 'starts': None,
+           'day_ord': None, 'day_start': None}
+history_lock = threading.Lock()
+
+def trading_day(now=None):
+    """Session the current data belongs to — before the open (or on a weekend) that's the previous weekday."""
+    d = now or get_ist()
+    day = d.date()
+    if d.weekday() >= 5 or d.hour * 60 + d.minute < 9*60 + 15:
+        day -= datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return day
+
+def _history_path(name):
+    return os.path.join(HISTORY_DIR, name)
+
+def _history_open():
+    """(Re)map the committed rows and rebuild the per-ticker index. Caller holds history_lock."""
+    rows = history['days'][-1][1] + history['days'][-1][2] if history['days'] else 0
+    cols = {}
+    for name, dtype in HISTORY_COLUMNS.items():
+        path = _history_path(name + '.bin')
+        cols[name] = (np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+                      if rows else np.zeros(0, dtype=dtype))
+    tid = np.asarray(cols['tid'])
+    history['cols']      = cols
+    history['day_ord']   = np.array([d[0] for d in history['days']], np.int32)
+    history['day_start'] = np.array([d[1] for d in history['days']], np.int64)
+    history['order']     = np.argsort(tid, kind='stable').astype(np.int32)   # chronological within a ticker
+    history['starts']    = np.searchsorted(tid[history['order']], np.arange(len(history['tickers']) + 1))
+
+def load_history():
+    try:
+        path = _history_path('index.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                idx = json.load(f)
+            with history_lock:
+                history['tickers'] = idx['tickers']
+                history['tid']     = {t: i for i, t in enumerate(idx['tickers'])}
+                history['days']    = [tuple(d) for d in idx['days']]
+                _history_open()
+            print(f"  📚 History: {len(history['days'])} days, {len(history['order'])} rows")
+    except Exception as e:
+        print(f"  ⚠ History load error: {e}")
+
+def history_record(stocks, day=None):
+    """Append (or replace) the snapshot for `day` (default: trading_day())."""
+    if not stocks:
+        return 0
+    day = (day or trading_day()).toordinal()
+    t0  = time.perf_counter()
+    with history_lock:
+        days = list(history['days'])
+        if days and days[-1][0] > day:
+            return 0                      # never rewrite the past
+        if days and days[-1][0] == day:
+            days.pop()                    # re-scan / late refresh of the same session
+        start   = days[-1][1] + days[-1][2] if days else 0
+        tickers = list(history['tickers'])
+        tids    = dict(history['tid'])
+        for s in stocks:
+            if s['ticker'] not in tids:
+                tids[s['ticker']] = len(tickers)
+                tickers.append(s['ticker'])
+        stage_code = {name: i for i, name in enumerate(HISTORY_STAGES)}
+        data = {
+            'tid':   np.fromiter((tids[s['ticker']] for s in stocks), '<i4', len(stocks)),
+            'stage': np.fromiter((stage_code.get(s.get('stage'), 0) for s in stocks), 'i1', len(stocks)),
+        }
+        for f in HISTORY_FIELDS:
+            data[f] = np.array([s.get(f) if s.get(f) is not None else np.nan for s in stocks], '<f4')
+
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        history['cols'] = {}              # drop the maps before writing to the files
+        for name, dtype in HISTORY_COLUMNS.items():
+            path = _history_path(name + '.bin')
+            with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+                f.seek(start * np.dtype(dtype).itemsize)
+                f.write(data[name].tobytes())
+                f.truncate()
+        days.append((day, start, len(stocks)))
+        tmp = _history_path('index.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'tickers': tickers, 'days': days}, f)
+        os.replace(tmp, _history_path('index.json'))
+        history.update(tickers=tickers, tid=tids, days=days)
+        _history_open()
+    observe('stage', 'history_record', time.perf_counter() - t0)
+    print(f"  📚 History: {datetime.date.fromordinal(day)} snapshot — {len(stocks)} rows ({len(days)} days)")
+    return len(stocks)
+
+def history_series(ticker, days=None):
+    """Columnar daily history of one ticker, oldest first, or None."""
+    with history_lock:
+        tid = history['tid'].get(ticker)
+        if tid is None:
+            return None
+        rows = history['order'][history['starts'][tid]:history['starts'][tid + 1]]
+        if days:
+            rows = rows[-days:]
+        cols = history['cols']
+        # Row → day: day starts are sorted, so one searchsorted over them
+        ordinal = history['day_ord'][np.searchsorted(history['day_start'], rows, side='right') - 1]
+        out = {'ticker': ticker,
+               'days':   [datetime.date.fromordinal(int(d)).isoformat() for d in ordinal],
+               'stage':  [HISTORY_STAGES[c] for c in cols['stage'][rows].tolist()]}
+        for f in HISTORY_FIELDS:
+            v = np.round(cols[f][rows].astype(np.float64), 2)
+            out[f] = [None if x != x else x for x in v.tolist()]
+    return out
+
+def _history_day(i):
+    """Dense per-tid (stage, score) arrays for the i-th stored day; missing tickers get stage -1."""
+    _, start, n = history['days'][i]
+    T     = len(history['tickers'])
+    tid   = history['cols']['tid'][start:start + n]
+    stage = np.full(T, -1, np.int8)
+    score = np.full(T, np.nan, np.float32)
+    stage[tid] = history['cols']['stage'][start:start + n]
+    score[tid] = history['cols']['score'][start:start + n]
+    return stage, score
+
+def history_changes(since=None):
+    """Stage transitions between the snapshot on/before `since` (default: the previous one) and the latest."""
+    with history_lock:
+        days = history['days']
+        if len(days) < 2:
+            return None
+        i = len(days) - 2
+        if since:
+            i = int(np.searchsorted(history['day_ord'], since.toordinal(), side='right')) - 1
+            if i < 0 or i >= len(days) - 1:
+                return None
+        s0, sc0 = _history_day(i)
+        s1, sc1 = _history_day(len(days) - 1)
+        tickers = history['tickers']
+        frm, to = days[i][0], days[-1][0]
+
+    def rows(mask):
+        idx = np.flatnonzero(mask)
+        idx = idx[np.argsort(-np.nan_to_num(sc1[idx], nan=-1), kind='stable')]
+        return [{'ticker': tickers[t], 'from': HISTORY_STAGES[s0[t]] if s0[t] >= 0 else None,
+                 'to': HISTORY_STAGES[s1[t]],
+                 'score': None if sc1[t] != sc1[t] else round(float(sc1[t]), 1),
+                 'scoreChg': None if sc0[t] != sc0[t] or sc1[t] != sc1[t] else round(float(sc1[t] - sc0[t]), 1)}
+                for t in idx.tolist()]
+
+    both = (s0 >= 0) & (s1 >= 0)
+    return {
+        'from':       datetime.date.fromordinal(frm).isoformat(),
+        'to':         datetime.date.fromordinal(to).isoformat(),
+        'breakouts':  rows((s1 >= HISTORY_BREAKOUT) & (s0 < HISTORY_BREAKOUT)),   # incl. names new to the universe
+        'upgrades':   rows(both & (s1 > s0)),
+        'downgrades': rows(both & (s1 < s0)),
+    }
+
+# ════════════════════════════════════════════════════════════════════
+# PARAMETER SWEEP — backtest.py does the work, in its own process pool;
+# this runs it in the background and mirrors progress into state['ctrl'].
+# ════════════════════════════════════════════════════════════════════
+SWEEP_TRIALS = 2000
+sweep_result = {}    # last finished sweep (defaults + top configurations)
+
+def run_sweep(trials=SWEEP_TRIALS, mode='random', grid=None, rebuild=False):
+    sys.modules.setdefault('server', sys.modules[__name__])   # backtest.py imports us by name
+    import backtest
+    ctrl = state['ctrl']['sweep']
+    t0   = time.time()
+    with state_lock:
+        items = [(s['ticker'], s.get('pe') or 0.0, s.get('debtEq') or 0.0) for s in state['stocks']]
+        ctrl.update(running=True, phase='events', done=0, total=len(items), started=get_ist().isoformat(),
+                    finished=None, best=None, error=None)
+
+    def progress(phase, done, total, best):
+        with state_lock:
+            ctrl.update(phase=phase, done=done, total=total, elapsed_sec=round(time.time() - t0, 1))
+            if best:
+                ctrl['best'] = best
+
+    print(f"  🧪 Sweep: {trials if mode != 'grid' else 'grid ' + ','.join(grid or [])} over {len(items)} stocks...")
+    try:
+        res = backtest.run_sweep(items, trials, mode, grid, provider_spec=PROVIDER, fixtures=PROVIDER_DIR,
+                                 rebuild=rebuild, progress=progress)
+        sweep_result.clear()
+        sweep_result.update(res, finished=get_ist().isoformat())
+        with state_lock:
+            ctrl.update(events=res['events'], configs=res['configs'], defaults=res['defaults'],
+                        best=res['top'][0] if res['top'] else None)
+        print(f"  🧪 Sweep done — {res['configs']} configs over {res['events']} trades in {res['elapsed_sec']}s")
+    except Exception as e:
+        with state_lock:
+            ctrl['error'] = str(e)
+        print(f"  ⚠ Sweep failed: {e}")
+    finally:
+        with state_lock:
+            ctrl.update(running=False, finished=get_ist().isoformat(), elapsed_sec=round(time.time() - t0, 1))
+
+# ════════════════════════════════════════════════════════════════════
+# STRATEGY PLAYGROUND — rescoring with SCORE_DEFAULTS overrides
+# The universe's score() inputs are pulled out of the stock dicts once per
+# data version (scan / EOD refresh / cache load each publish a new list)
+# and scored with score_columns(), so a toggle is one vectorised pass.
+# Results are kept in a small LRU keyed by a hash of the configuration.
+# ════════════════════════════════════════════════════════════════════
+STRATEGY_CACHE_SIZE  = 64
+STRATEGY_MOVERS      = 15
+STRATEGY_STRONG      = 70   # "strong entry" line the playground counts across
+strategy_cols  = {}              # src, tickers, sectors, cols, base, base_rank
+strategy_cache = OrderedDict()   # config hash -> (new scores, rank delta)
+strategy_lock  = threading.Lock()
+
+def _strategy_columns():
+    """Score inputs for the current universe, rebuilt when state['stocks'] is replaced.
+    Holding the list itself (not its id) means a recycled id can't pass for fresh data."""
+    with state_lock:
+        stocks = state['stocks']
+    if strategy_cols.get('src') is stocks:
+        return strategy_cols
+    get = lambda k, d=None: [s.get(k, d) for s in stocks]
+    pre = get('emaPreCross', False)
+    cols = {
+        'pe':            get('pe'),
+        'debtEq':        get('debtEq'),
+        'rsi':           get('rsi'),
+        'adx':           get('adx'),
+        'vpb_score':     get('vpbScore', 0),
+        'pre_cross':     pre,
+        'pre_breakout':  [p and s.get('vpbDetail') in ('breakout', 'weak_breakout') for p, s in zip(pre, stocks)],
+        'ema_cross':     get('emaCross', False),
+        'cross_days':    get('emaCrossDays'),
+        'vol_confirmed': get('volConfirm', False),
+        'pullback':      get('emaPullback', False),
+        'macd':          get('macd', False),
+        'rs_rating':     get('rsRating'),
+        'w_up':          [t == 'up' for t in get('wTrend')],
+        'm_up':          [t == 'up' for t in get('mTrend')],
+    }
+    cols = {k: np.asarray([np.nan if v is None else v for v in c],
+                          dtype=np.float64 if k in ('pe', 'debtEq', 'rsi', 'adx', 'vpb_score', 'cross_days', 'rs_rating') else bool)
+            for k, c in cols.items()}
+    base = score_columns(cols)[0]
+    strategy_cache.clear()
+    strategy_cols.update(src=stocks, tickers=get('ticker'), sectors=get('sector', ''), cols=cols,
+                         base=base, base_rank=_rank(base))
+    return strategy_cols
+
+def _rank(scores):
+    """Competition rank, 1 = best; ties share a rank."""
+    return len(scores) - np.searchsorted(np.sort(scores), scores, side='right') + 1
+
+def strategy_params(raw):
+    """Validate SCORE_DEFAULTS overrides; drops ones equal to the default so every
+    spelling of a configuration hashes alike. Returns (params, error)."""
+    params = {}
+    for k, v in (raw or {}).items():
+        if k not in SCORE_DEFAULTS:
+            return None, f'Unknown parameter: {k}'
+        if v is None or v == '':
+            if k == 'rs_pts':
+                continue
+            return None, f'{k} needs a number'
+        try:
+            v = float(v)
+        except (TypeError, ValueError):
+            return None, f'{k} needs a number'
+        if not math.isfinite(v):
+            return None, f'{k} needs a number'
+        if v != SCORE_DEFAULTS[k]:
+            params[k] = v
+    return params, None
+
+def strategy_score(params, full=False):
+    """Rescore the universe with `params` (validated overrides). Returns the
+    summary the playground shows; full=True adds per-stock scores and rank deltas."""
+    t0  = time.perf_counter()
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    with strategy_lock:
+        data = _strategy_columns()
+        hit  = strategy_cache.get(key)
+        cached = hit is not None
+        if cached:
+            strategy_cache.move_to_end(key)
+        else:
+            new = score_columns(data['cols'], params)[0]
+            hit = strategy_cache[key] = (new, data['base_rank'] - _rank(new))
+            if len(strategy_cache) > STRATEGY_CACHE_SIZE:
+                strategy_cache.popitem(last=False)
+    new, delta = hit
+    base, tickers = data['base'], data['tickers']
+    diff  = new - base
+    moved = np.flatnonzero(np.abs(diff) >= 2)
+    moved = moved[np.argsort(-np.abs(diff[moved]), kind='stable')[:STRATEGY_MOVERS]]
+    out = {
+        'ok':           True,
+        'key':          key,
+        'cached':       cached,
+        'last_updated': state['last_updated'],
+        'count':        len(tickers),
+        'origStrong':   int((base >= STRATEGY_STRONG).sum()),
+        'newStrong':    int((new >= STRATEGY_STRONG).sum()),
+        'gained':       int(((base < STRATEGY_STRONG) & (new >= STRATEGY_STRONG)).sum()),
+        'lost':         int(((base >= STRATEGY_STRONG) & (new < STRATEGY_STRONG)).sum()),
+        'movers':       [{'ticker': tickers[i], 'sector': data['sectors'][i], 'orig': int(base[i]),
+                          'nw': int(new[i]), 'diff': int(diff[i]), 'rankDelta': int(delta[i])} for i in moved],
+    }
+    if full:
+        out.update(tickers=tickers, scores=new.tolist(), rankDelta=delta.tolist())
+    observe('stage', 'strategy_score', time.perf_counter() - t0)
+    return out
+
 # ════════════════════════════════════════════════════════════════════
 # CACHE
 # ════════════════════════════════════════════════════════════════════
@@ -1080,18 +4118,22 @@ def save_cache():
                 'last_updated': state['last_updated'],
                 'saved_at':     get_ist().isoformat(),
             }
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
+        with timed('save_cache'), open(CACHE_FILE, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False)
         print(f"  💾 Cache saved — {len(data['stocks'])} stocks → {CACHE_FILE}")
     except Exception as e:
         print(f"  ⚠ Cache save failed: {e}")
+    try:
+        history_record(data['stocks'])
+    except Exception as e:
+        print(f"  ⚠ History snapshot failed: {e}")
 
 def load_cache():
     if not os.path.exists(CACHE_FILE):
         print("  📭 No cache — full scan needed")
         return False
     try:
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+        with timed('load_cache'), open(CACHE_FILE, 'r', encoding='utf-8') as f:
             data = json.load(f)
         saved_at  = datetime.datetime.fromisoformat(data['saved_at'])
         age_hours = (get_ist() - saved_at).total_seconds() / 3600
@@ -1104,6 +4146,8 @@ def load_cache():
             return False
         # Re-classify stages from stored fields (picks up any classify_stage() changes)
         for s in stocks:
+            s.pop('chartPrices', None)   # older caches — charts come from /api/chart now
+            s.pop('chartDates', None)
             try:
                 tech = {
                     'ema_cross':           s.get('emaCross', False),
@@ -1120,6 +4164,8 @@ def load_cache():
             except:
                 pass
         print(f"  🔄 Stages re-classified for {len(stocks)} stocks")
+        breadth_rebuild(stocks)
+        check_alerts(stocks)
         with state_lock:
             state['stocks']         = stocks
             state['last_updated']   = data.get('last_updated','From cache')
@@ -1130,17 +4176,161 @@ def load_cache():
             state['in_range']       = len(stocks)
             state['total_scanned']  = len(stocks)
         print(f"  🚀 Cache loaded — {len(stocks)} stocks (age: {age_hours:.1f}h)")
+        plan_publish(stocks)
         return True
     except Exception as e:
         print(f"  ⚠ Cache load error: {e}")
         return False
 
+# ════════════════════════════════════════════════════════════════════
+# MEMORY DIAGNOSTICS (opt-in — nothing runs until /api/debug/memory is hit)
+#   /api/debug/memory                  → bytes per major structure + RSS
+#   /api/debug/memory?action=start     → tracemalloc.start()
+#   /api/debug/memory?action=snapshot  → take a snapshot (last two are kept)
+#   /api/debug/memory?action=diff      → top allocation sites, last vs previous
+#   /api/debug/memory?action=stop      → tracemalloc.stop(), drop snapshots
+# ════════════════════════════════════════════════════════════════════
+MEM_TRACE_FRAMES = 10
+MEM_DIFF_TOP     = 25
+mem_snapshots    = []   # at most two (previous, latest)
+
+def _rss_bytes():
+    """Resident set size of this process, or None if the OS won't say."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        pass
+    try:
+        import ctypes, ctypes.wintypes as wt
+        class PMC(ctypes.Structure):
+            _fields_ = [('cb', wt.DWORD), ('PageFaultCount', wt.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+        pmc = PMC()
+        pmc.cb = ctypes.sizeof(PMC)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(pmc), pmc.cb)
+        return int(pmc.WorkingSetSize)
+    except Exception:
+        return None
+
+def _deep_sizeof(obj, seen):
+    """Approximate retained size of a container tree. Objects already in `seen`
+    are not counted again, so sharing one set splits a tree into parts."""
+    stack, total = [obj], 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, '__slots__') and not isinstance(o, array):
+            stack.extend(getattr(o, a) for a in o.__slots__ if hasattr(o, a))
+    return total
+
+def _frame_bytes(df):
+    try:
+        return int(df.memory_usage(index=True, deep=False).sum())
+    except Exception:
+        return 0
+
+def memory_report():
+    import gc, tracemalloc
+    seen = set()
+    with state_lock:
+        stocks = list(state['stocks'])
+    with chart_lock:
+        chart = _deep_sizeof(chart_cache, seen)
+    rows   = _deep_sizeof(stocks, seen)
+    with intraday_lock:
+        ring_bytes = _deep_sizeof(intraday, seen)
+    with metrics_lock:
+        metric_bytes = _deep_sizeof(metrics, seen)
+    with shard_lock:
+        shard_bytes = _deep_sizeof(shard_job, seen)
+
+    # Every live DataFrame in the process — history frames held past their thread
+    # show up here. yfinance's last-download frames are reported separately.
+    frames = [o for o in gc.get_objects() if isinstance(o, pd.DataFrame)]
+    yf_dfs = list(getattr(getattr(yf, 'shared', None), '_DFS', {}).values())
+    yf_ids = {id(df) for df in yf_dfs}
+
+    structures = {
+        'stocks_rows':     rows,
+        'chart_cache':     chart,
+        'intraday_rings':  ring_bytes,
+        'metrics':         metric_bytes,
+        'price_stamps':    _deep_sizeof(price_stamps, seen),
+        'shard_job':       shard_bytes,
+        'pandas_frames':   sum(_frame_bytes(df) for df in frames if id(df) not in yf_ids),
+        'yfinance_frames': sum(_frame_bytes(df) for df in yf_dfs),
+    }
+    traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+    report = {
+        'measured_at':    get_ist().isoformat(),
+        'rss_bytes':      _rss_bytes(),
+        'structures':     structures,
+        'stock_count':    len(stocks),
+        'frame_count':    len(frames),
+        'gc_objects':     len(gc.get_objects()),
+        'tracing':        tracemalloc.is_tracing(),
+        'traced_current': traced[0] if traced else None,
+        'traced_peak':    traced[1] if traced else None,
+        'snapshots':      len(mem_snapshots),
+    }
+    with state_lock:
+        state['ctrl']['memory'].update(report)
+    return report
+
+def memory_action(action, top=MEM_DIFF_TOP):
+    import tracemalloc
+    if action == 'start':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MEM_TRACE_FRAMES)
+        return {'ok': True, 'msg': f'tracemalloc started ({MEM_TRACE_FRAMES} frames)'}
+    if action == 'stop':
+        tracemalloc.stop()
+        mem_snapshots.clear()
+        return {'ok': True, 'msg': 'tracemalloc stopped — snapshots dropped'}
+    if action == 'snapshot':
+        if not tracemalloc.is_tracing():
+            return {'ok': False, 'msg': 'Start tracemalloc first'}
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        mem_snapshots.append(snap)
+        del mem_snapshots[:-2]
+        return {'ok': True, 'msg': f'Snapshot taken ({len(mem_snapshots)} held)'}
+    if action == 'diff':
+        if len(mem_snapshots) < 2:
+            return {'ok': False, 'msg': 'Need two snapshots to diff'}
+        stats = mem_snapshots[1].compare_to(mem_snapshots[0], 'lineno')[:top]
+        diff  = [{'site':       f'{st.traceback[0].filename}:{st.traceback[0].lineno}',
+                  'size_diff':  st.size_diff, 'size': st.size,
+                  'count_diff': st.count_diff, 'count': st.count} for st in stats]
+        with state_lock:
+            state['ctrl']['memory']['diff_top'] = diff[:5]
+        return {'ok': True, 'msg': f'Top {len(diff)} allocation sites by growth', 'diff': diff}
+    return {'ok': False, 'msg': f'Unknown action: {action}'}
+
 # ════════════════════════════════════════════════════════════════════
 # SCHEDULER
 # ════════════════════════════════════════════════════════════════════
 def scheduler():
     print(f"\n{'='*52}")
     print(f"  Checking for saved cache...")
+    load_watchlist()
+    load_alerts()
+    load_history()
     cache_ok = load_cache()
 
     if cache_ok:
@@ -1157,10 +4347,10 @@ def scheduler():
 
     eod_saved = False
     while True:
-        time.sleep(LIVE_REFRESH)
+        time.sleep(PRICE_TICK_SEC)
         mode = get_market_mode()
         if mode == 'open':
-            refresh_prices()
+            refresh_due_prices()
             eod_saved = False
         elif mode == 'eod':
             with state_lock:
@@ -1174,6 +4364,67 @@ def scheduler():
             with state_lock:
                 state['status'] = 'eod'
 
+# ════════════════════════════════════════════════════════════════════
+# COLUMNAR TRANSPORT — /api/stocks for the browser
+# As JSON, /api/stocks repeats ~70 key strings per stock and the browser
+# parses every number from text. Asked for with ?format=columnar or
+# Accept: COLUMNAR_TYPE, it's one column per field instead:
+#   'SCOL' · u32 header length · header JSON · column buffers (8-aligned)
+# Numbers go as int32 scaled by 10^scale when that round-trips exactly
+# (prices, ratios, scores — nearly all of them), else float64; booleans as
+# u8; strings as u16 / u32 indexes into a per-column dictionary; anything
+# else (lists) stays JSON in the header. Nulls: int32 min, NaN, 2, and the
+# index type's max. index.html's decodeColumnar() maps each buffer to a
+# typed array and rebuilds the same row objects JSON.parse would give.
+# JSON stays the default.
+# ════════════════════════════════════════════════════════════════════
+COLUMNAR_TYPE   = 'application/x-stocks-columnar'
+COLUMNAR_MAGIC  = b'SCOL'
+COLUMNAR_SCALES = 4           # decimals tried for int32 before falling back to float64
+_I32_NULL       = -2**31
+
+def _columnar_column(vals):
+    """(header entry, array or None) for one field's values across all stocks."""
+    kinds = {type(v) for v in vals} - {type(None)}
+    if kinds <= {bool}:
+        return {'type': 'bool', 'dtype': 'u8'}, np.array([2 if v is None else v for v in vals], np.uint8)
+    if kinds <= {int, float}:
+        x = np.array([np.nan if v is None else v for v in vals], np.float64)
+        x[np.isinf(x)] = np.nan   # JSON sends these as null too
+        null, f = np.isnan(x), x[~np.isnan(x)]
+        for d in range(COLUMNAR_SCALES + 1):
+            p, s = 10.0 ** d, f * 10.0 ** d
+            if not len(f) or (np.abs(s).max() < 2**31 - 1 and np.array_equal(np.rint(s) / p, f)):
+                a = np.full(len(x), _I32_NULL, '<i4')
+                a[~null] = np.rint(s)
+                return {'type': 'num', 'dtype': 'i32', 'scale': d}, a
+        return {'type': 'num', 'dtype': 'f64'}, x.astype('<f8')
+    if kinds <= {str}:
+        words = {}
+        idx   = [-1 if v is None else words.setdefault(v, len(words)) for v in vals]
+        dtype = '<u2' if len(words) < 0xFFFF else '<u4'
+        a     = np.array(idx, np.int64)
+        a[a < 0] = np.iinfo(dtype).max
+        return {'type': 'str', 'dtype': 'u16' if dtype == '<u2' else 'u32', 'dict': list(words)}, a.astype(dtype)
+    return {'type': 'json', 'values': vals}, None
+
+def stocks_columnar(meta, stocks):
+    """/api/stocks as one SCOL body: `meta` (status etc.) plus every field of `stocks` by column."""
+    head = {**meta, 'n': len(stocks), 'columns': []}
+    bufs, off = [], 0
+    for k in dict.fromkeys(k for s in stocks for k in s):   # first-seen key order, like the rows
+        col, a = _columnar_column([s.get(k) for s in stocks])
+        col['name'] = k
+        if a is not None:
+            b = a.tobytes() + b'\0' * (-a.nbytes % 8)
+            col['offset'] = off
+            bufs.append(b)
+            off += len(b)
+        head['columns'].append(col)
+    hb  = json.dumps(head, ensure_ascii=False).replace('Infinity', 'null').replace('NaN', 'null').encode('utf-8')
+    hb += b' ' * (-(8 + len(hb)) % 8)   # buffers start 8-aligned for Float64Array
+    return COLUMNAR_MAGIC + len(hb).to_bytes(4, 'little') + hb + b''.join(bufs)
+
 # ════════════════════════════════════════════════════════════════════
 # HTTP SERVER
 # ════════════════════════════════════════════════════════════════════
@@ -1181,7 +4432,8 @@ class Handler(BaseHTTPRequestHandler):
     def log_message(self, fmt, *args): pass  # suppress request logs
 
     def send_json(self, data, status=200):
-        body = json.dumps(data, ensure_ascii=False).replace('Infinity', 'null').replace('NaN', 'null').encode('utf-8')
+        with timed('json_encode'):
+            body = json.dumps(data, ensure_ascii=False).replace('Infinity', 'null').replace('NaN', 'null').encode('utf-8')
         self.send_response(status)
         self.send_header('Content-Type',   'application/json')
         self.send_header('Content-Length', len(body))
@@ -1189,6 +4441,17 @@ class Handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
+    def send_bytes(self, body, ctype='application/json', headers=None):
+        """An already-encoded body (plan, charts, columnar stocks)."""
+        self.send_response(200)
+        self.send_header('Content-Type',   ctype)
+        self.send_header('Content-Length', len(body))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
     def send_file(self, path, ctype):
         try:
             with open(path, 'rb') as f:
@@ -1204,10 +4467,64 @@ class Handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST')
         self.end_headers()
 
+    def do_POST(self):
+        path = urlparse(self.path).path
+        with timed(self._route_label(path), 'http'):
+            self._do_POST()
+
+    def _do_POST(self):
+        path = urlparse(self.path).path
+        try:
+            length  = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self.send_json({'ok': False, 'msg': 'Bad JSON'}, 400)
+            return
+
+        if path == '/api/shard/done':
+            ok = complete_shard(payload)
+            self.send_json({'ok': ok}, 200 if ok else 409)
+            return
+
+        if path == '/api/strategy/score':
+            params, err = strategy_params(payload.get('params'))
+            if err:
+                self.send_json({'ok': False, 'msg': err}, 400)
+            else:
+                self.send_json(strategy_score(params, bool(payload.get('full'))))
+            return
+
+        self.send_response(404); self.end_headers()
+
+    PARAM_ROUTES = ('/api/stock/', '/api/intraday/', '/api/history/', '/api/chart/', '/api/watchlist/add/', '/api/watchlist/remove/')
+    # Every exact path served below. Anything else is one 'other' series, so
+    # a scanner walking /api/<random> can't grow the metrics table.
+    ROUTES = frozenset((
+        '/', '/index.html', '/api/status', '/api/stocks', '/api/prices', '/api/changes',
+        '/api/patch_upside', '/api/rescan', '/api/watchlist', '/api/debug/memory', '/api/metrics',
+        '/api/ctrl', '/api/ctrl/run_prices', '/api/ctrl/run_technicals', '/api/ctrl/run_plan',
+        '/api/ctrl/run_ticker_fetch', '/api/ctrl/run_sweep', '/api/strategy/score', '/api/plan',
+        '/api/plan/diversified', '/api/sweep', '/api/shard/lease', '/api/shard/renew',
+        '/api/shard/done', '/api/shards', '/api/alerts', '/api/alerts/add', '/api/alerts/remove',
+        '/api/alerts/stream', '/api/breadth', '/api/indices',
+    ))
+
+    def _route_label(self, path):
+        for prefix in self.PARAM_ROUTES:
+            if path.startswith(prefix):
+                return prefix + ':ticker'
+        return path if path in self.ROUTES else 'other'
+
     def do_GET(self):
+        # Timed wrapper — one histogram per route; unknown paths collapse to 'other'
+        path = urlparse(self.path).path
+        with timed(self._route_label(path), 'http'):
+            self._do_GET()
+
+    def _do_GET(self):
         path = urlparse(self.path).path
 
         if path in ('/', '/index.html'):
@@ -1230,13 +4547,21 @@ class Handler(BaseHTTPRequestHandler):
             return
 
         if path == '/api/stocks':
+            # ?format=columnar or Accept: COLUMNAR_TYPE → typed columns; JSON otherwise
+            columnar = parse_qs(urlparse(self.path).query).get('format', [''])[0] == 'columnar' \
+                       or COLUMNAR_TYPE in self.headers.get('Accept', '')
             with state_lock:
-                self.send_json({
+                meta = {
                     'status':       state['status'],
                     'market_mode':  state['market_mode'],
                     'last_updated': state['last_updated'],
-                    'stocks':       state['stocks'],
-                })
+                }
+                if not columnar:
+                    self.send_json({**meta, 'stocks': state['stocks']})
+                    return
+                with timed('columnar_encode'):
+                    body = stocks_columnar(meta, state['stocks'])
+            self.send_bytes(body, COLUMNAR_TYPE, {'Vary': 'Accept'})
             return
 
         if path == '/api/prices':
@@ -1250,13 +4575,67 @@ class Handler(BaseHTTPRequestHandler):
                 })
             return
 
+        if path.startswith('/api/intraday/'):
+            ticker = path.replace('/api/intraday/','').upper().strip()
+            qs     = parse_qs(urlparse(self.path).query)
+            step   = 5 if qs.get('tf', ['1m'])[0] == '5m' else 1
+            day, bars = get_intraday_bars(ticker, step)
+            with state_lock:
+                stock = next((s for s in state['stocks'] if s['ticker']==ticker), None)
+            self.send_json({
+                'ticker':  ticker,
+                'day':     day,
+                'tf':      f'{step}m',
+                'bars':    [[minute_to_hhmm(b[0])] + [round(x, 2) for x in b[1:5]] + [int(b[5])] for b in bars],
+                'signals': calc_intraday_signals(stock) if stock else {},
+            }, 200 if day else 404)
+            return
+
         if path.startswith('/api/stock/'):
             ticker = path.replace('/api/stock/','').upper().strip()
             with state_lock:
                 stock = next((s for s in state['stocks'] if s['ticker']==ticker), None)
+            if stock:
+                with rs_lock:
+                    stock = {**stock, 'rsLine': rs_lines.get(ticker)}
             self.send_json(stock if stock else {'error':'Not found'}, 200 if stock else 404)
             return
 
+        if path.startswith('/api/history/'):
+            ticker = path.replace('/api/history/','').upper().strip()
+            qs     = parse_qs(urlparse(self.path).query)
+            try:
+                days = int(qs.get('days', ['0'])[0]) or None
+            except ValueError:
+                days = None
+            series = history_series(ticker, days)
+            self.send_json(series if series else {'error': 'No history'}, 200 if series else 404)
+            return
+
+        if path.startswith('/api/chart/'):
+            ticker = path.replace('/api/chart/','').upper().strip()
+            rng    = parse_qs(urlparse(self.path).query).get('range', ['3m'])[0]
+            if rng not in CHART_RANGES:
+                self.send_json({'error': f"range must be one of {', '.join(CHART_RANGES)}"}, 400)
+                return
+            body = chart_body(ticker, rng)
+            if body is None:
+                self.send_json({'error': 'No price history'}, 404)
+                return
+            self.send_bytes(body)
+            return
+
+        if path == '/api/changes':
+            qs = parse_qs(urlparse(self.path).query)
+            try:
+                since = datetime.date.fromisoformat(qs['since'][0]) if 'since' in qs else None
+            except ValueError:
+                self.send_json({'error': 'since must be YYYY-MM-DD'}, 400)
+                return
+            changes = history_changes(since)
+            self.send_json(changes if changes else {'error': 'Need two stored days'}, 200 if changes else 404)
+            return
+
         if path == '/api/patch_upside':
             # Patch targetPrice/upside in-memory for stocks missing it
             with state_lock:
@@ -1293,6 +4672,57 @@ class Handler(BaseHTTPRequestHandler):
                 self.send_json({'ok':True,'msg':'Full rescan started'})
             return
 
+        if path == '/api/watchlist':
+            with state_lock:
+                self.send_json({'tickers': state['watchlist']})
+            return
+
+        if path.startswith('/api/watchlist/add/') or path.startswith('/api/watchlist/remove/'):
+            action, ticker = path[len('/api/watchlist/'):].split('/', 1)
+            ticker = ticker.upper().strip()
+            if not ticker:
+                self.send_json({'ok': False, 'msg': 'No ticker'}, 400)
+                return
+            with state_lock:
+                wl = state['watchlist']
+                if action == 'add' and ticker not in wl:
+                    wl.append(ticker)
+                elif action == 'remove' and ticker in wl:
+                    wl.remove(ticker)
+                tickers = list(wl)
+            save_watchlist()
+            self.send_json({'ok': True, 'tickers': tickers})
+            return
+
+        if path == '/api/debug/memory':
+            qs     = parse_qs(urlparse(self.path).query)
+            action = qs.get('action', [''])[0]
+            try:
+                top = int(qs.get('top', [MEM_DIFF_TOP])[0])
+            except ValueError:
+                self.send_json({'ok': False, 'msg': 'top must be a whole number'}, 400)
+                return
+            if action:
+                result = memory_action(action, top)
+                memory_report()   # refresh the Control tab summary
+                self.send_json(result, 200 if result['ok'] else 400)
+            else:
+                self.send_json({**memory_report(), 'ok': True, 'msg': 'Memory measured'})
+            return
+
+        if path == '/api/metrics':
+            qs = parse_qs(urlparse(self.path).query)
+            if qs.get('format', [''])[0] == 'json':
+                self.send_json(metrics_summary())
+                return
+            body = metrics_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type',   'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', len(body))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
         if path == '/api/ctrl':
             with state_lock:
                 self.send_json(state['ctrl'])
@@ -1327,6 +4757,18 @@ class Handler(BaseHTTPRequestHandler):
                 self.send_json({'ok': True, 'msg': 'Technical refresh started'})
             return
 
+        if path == '/api/ctrl/run_plan':
+            with state_lock:
+                stocks = state['stocks']
+            if not stocks:
+                self.send_json({'ok': False, 'msg': 'No stocks loaded yet'})
+            else:
+                plan_publish(stocks, force=True)
+                p = plan_state['plan']
+                self.send_json({'ok': True, 'msg': f"Plan rebuilt — {len(p['segments']['all']['strong'])} strong entries"
+                                                  f"{'' if p['frozen'] else ' (provisional — market open)'}"})
+            return
+
         if path == '/api/ctrl/run_ticker_fetch':
             # Ticker cache is built from a full scan — standalone MCap check is unreliable
             with state_lock:
@@ -1341,24 +4783,153 @@ class Handler(BaseHTTPRequestHandler):
                 self.send_json({'ok': True, 'msg': 'Full scan started — ticker cache will be rebuilt from results (~12 min)'})
             return
 
-        if path == '/api/indices':
+        if path == '/api/ctrl/run_sweep':
+            qs = parse_qs(urlparse(self.path).query)
+            with state_lock:
+                running   = state['ctrl']['sweep']['running']
+                no_stocks = len(state['stocks']) == 0
             try:
-                import yfinance as yf
-                result = {}
-                for sym, name in [('^NSEI','NIFTY 50'),('^BSESN','SENSEX')]:
-                    tk = yf.Ticker(sym)
-                    fi = tk.fast_info
-                    last  = fi.last_price or 0
-                    prev  = fi.previous_close or last
-                    chg   = round((last - prev) / prev * 100, 2) if prev else 0
-                    result[name] = {'price': round(last, 2), 'change': chg}
-                self.send_json(result)
-            except Exception as e:
-                self.send_json({'error': str(e)})
+                trials = max(1, int(qs.get('trials', [SWEEP_TRIALS])[0]))
+            except ValueError:
+                trials = SWEEP_TRIALS
+            grid = [k for k in qs.get('grid', [''])[0].split(',') if k]
+            if running:
+                self.send_json({'ok': False, 'msg': 'Sweep already running'})
+            elif no_stocks:
+                self.send_json({'ok': False, 'msg': 'No stocks loaded yet'})
+            else:
+                threading.Thread(target=run_sweep, daemon=True,
+                                 args=(trials, 'grid' if grid else 'random', grid,
+                                       qs.get('rebuild', ['0'])[0] == '1')).start()
+                what = f"grid over {', '.join(grid)}" if grid else f'{trials} random configurations'
+                self.send_json({'ok': True, 'msg': f'Sweep started — {what}; 5y history is re-used for 24h'})
+            return
+
+        if path == '/api/strategy/score':
+            # GET form for curl / bookmarks: ?pe_pts_1=0&macd_pts=4&full=1
+            q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            full = q.pop('full', '') in ('1', 'true')
+            params, err = strategy_params(q)
+            if err:
+                self.send_json({'ok': False, 'msg': err}, 400)
+            else:
+                self.send_json(strategy_score(params, full))
+            return
+
+        if path == '/api/plan':
+            with plan_lock:
+                body, etag = plan_state['body'], plan_state['etag']
+            if body is None:
+                self.send_json({'ok': False, 'msg': 'No plan yet — waiting for the first scan'})
+            elif self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+            else:
+                self.send_bytes(body, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+            return
+
+        if path == '/api/plan/diversified':
+            # ?picks=10&per_cluster=2&min_score=43&corr=0.5
+            q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            try:
+                self.send_json(plan_diversified(int(q.get('picks', PLAN_PICKS)),
+                                                int(q.get('per_cluster', PLAN_PER_CLUSTER)),
+                                                float(q.get('min_score', PLAN_MIN_SCORE)),
+                                                float(q.get('corr', CORR_CLUSTER))))
+            except ValueError:
+                self.send_json({'ok': False, 'msg': 'picks / per_cluster / min_score / corr must be numbers'}, 400)
+            return
+
+        if path == '/api/sweep':
+            with state_lock:
+                ctrl = dict(state['ctrl']['sweep'])
+            self.send_json({**ctrl, 'result': sweep_result or None})
+            return
+
+        if path == '/api/shard/lease':
+            qs = parse_qs(urlparse(self.path).query)
+            self.send_json(lease_shard(qs.get('worker', ['?'])[0]))
+            return
+
+        if path == '/api/shard/renew':
+            qs = parse_qs(urlparse(self.path).query)
+            try:
+                ok = renew_shard(qs['job'][0], int(qs['shard'][0]), qs['lease'][0])
+            except (KeyError, ValueError):
+                ok = False
+            self.send_json({'ok': ok}, 200 if ok else 409)
+            return
+
+        if path == '/api/shards':
+            with state_lock:
+                self.send_json(state['ctrl']['shards'])
+            return
+
+        if path == '/api/alerts':
+            with alert_lock:
+                self.send_json({'rules': list(alert_rules.values()), 'recent': alert_recent[-50:][::-1]})
+            return
+
+        if path == '/api/alerts/add':
+            q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            rule, err = add_alert(q)
+            if rule:
+                what = (f"{rule['op']} {rule['level']}" if 'level' in rule else
+                        f"→ {rule.get('target') or 'any change'}" if rule['kind'] == 'stage' else 'breakout')
+                self.send_json({'ok': True, 'rule': rule, 'msg': f"🔔 Alert set — {rule['ticker']} {rule['kind']} {what}"})
+            else:
+                self.send_json({'ok': False, 'msg': err}, 400)
+            return
+
+        if path == '/api/alerts/remove':
+            rule_id = parse_qs(urlparse(self.path).query).get('id', [''])[0]
+            ok = remove_alert(rule_id)
+            self.send_json({'ok': ok}, 200 if ok else 404)
+            return
+
+        if path == '/api/alerts/stream':
+            # Hand the socket to the push channel; ScoutHTTPServer leaves it open
+            if not hasattr(self.server, 'detached'):
+                self.send_json({'error': 'streaming needs the app server'}, 501)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(b'retry: 5000\n\n')
+            self.wfile.flush()
+            self.close_connection = True
+            self.server.detached.add(self.connection)
+            stream_open(self.connection)
+            return
+
+        if path == '/api/breadth':
+            self.send_json(breadth_snapshot())
+            return
+
+        if path == '/api/indices':
+            quotes, err = get_indices()
+            self.send_json(quotes if quotes else {'error': err or 'Index quotes loading'})
             return
 
         self.send_response(404); self.end_headers()
 
+class ScoutHTTPServer(HTTPServer):
+    """Single-threaded HTTPServer, except a handler may keep its socket open after
+    returning (alert event streams) by adding it to `detached`."""
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.detached = set()
+
+    def shutdown_request(self, request):
+        if request in self.detached:
+            self.detached.discard(request)
+            return
+        super().shutdown_request(request)
+
 # ════════════════════════════════════════════════════════════════════
 # MAIN
 # ════════════════════════════════════════════════════════════════════
@@ -1371,10 +4942,14 @@ def main():
   Browser -> http://localhost:{PORT}
   Press Ctrl+C to stop
 """)
+    if provider.name != 'live':
+        where = f"  ({os.path.abspath(PROVIDER_DIR)})" if provider.name in ('record', 'replay') else ''
+        print(f"  Data provider: {PROVIDER}{where}\n")
     t = threading.Thread(target=scheduler, daemon=True)
     t.start()
+    threading.Thread(target=index_refresher, daemon=True).start()
     try:
-        server = HTTPServer(('0.0.0.0', PORT), Handler)
+        server = ScoutHTTPServer(('0.0.0.0', PORT), Handler)
     except OSError:
         print(f"\n  ❌ Port {PORT} is already in use!")
         print(f"  Another instance is probably running.")
@@ -1387,4 +4962,40 @@ def main():
         print("\n  Server stopped.")
 
 if __name__ == '__main__':
-    main()
+    import argparse
+    ap = argparse.ArgumentParser(description='Dalal Street Scout server')
+    ap.add_argument('--worker', metavar='URL',
+                    help='run as a sharded-scan worker for the coordinator at URL')
+    ap.add_argument('--sharded', action='store_true',
+                    help="coordinator mode: full scans are split into shards (SCAN_MODE='sharded')")
+    ap.add_argument('--provider', default=PROVIDER,
+                    help='data source: live | record | replay | http://host:port | bhav[+base] | matrix[+base] (default: %(default)s)')
+    ap.add_argument('--fixtures', default=PROVIDER_DIR, metavar='DIR',
+                    help='where record writes and replay/--standin read responses')
+    ap.add_argument('--standin', type=int, metavar='PORT',
+                    help='serve --fixtures over HTTP as a Yahoo/NSE stand-in instead of running the app')
+    ap.add_argument('--latency', type=float, default=PROVIDER_LATENCY,
+                    help='replay/stand-in: mean seconds added per call')
+    ap.add_argument('--error-rate', type=float, default=PROVIDER_ERROR_RATE,
+                    help='replay/stand-in: fraction of calls that fail with 500')
+    ap.add_argument('--rate-limit', type=float, default=PROVIDER_RATE_LIMIT,
+                    help='replay/stand-in: calls/sec before 429s (0 = unlimited)')
+    ap.add_argument('--bhav-backfill', metavar='FROM[:TO]',
+                    help='download missing bhavcopy files for FROM..TO (YYYY-MM-DD) into bhavcopy/ and exit')
+    args = ap.parse_args()
+    PROVIDER, PROVIDER_DIR = args.provider, args.fixtures
+    PROVIDER_LATENCY, PROVIDER_ERROR_RATE, PROVIDER_RATE_LIMIT = args.latency, args.error_rate, args.rate_limit
+    if args.standin:
+        run_standin(args.standin, PROVIDER_DIR, provider_faults())
+        sys.exit(0)
+    if args.bhav_backfill:
+        start, _, end = args.bhav_backfill.partition(':')
+        bhav_backfill(datetime.date.fromisoformat(start), datetime.date.fromisoformat(end) if end else None)
+        sys.exit(0)
+    provider = make_provider(PROVIDER, PROVIDER_DIR, provider_faults())
+    if args.worker:
+        run_worker(args.worker)
+    else:
+        if args.sharded:
+            SCAN_MODE = 'sharded'
+        main()